@@ -0,0 +1,208 @@
+import collections
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from ..config import Config
+from ..lipsync.lip_sync_engine import MOUTH_SHAPES, LipSyncEngine
+from ..lipsync.mouth_atlas import MouthAtlas
+from .render_cache import file_digest
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the preprocessed asset layout or atlas rendering changes
+ASSETS_VERSION = '1'
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+AVATAR_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+AvatarSource = collections.namedtuple('AvatarSource', 'avatar_id image_path metadata')
+
+class AvatarRegistry:
+    """Avatars by id, loaded on first use and kept in a memory-bounded LRU.
+
+    An avatar is `<avatars_dir>/<id>.<png|jpg|...>` with an optional
+    `<id>.json` sidecar (e.g. {"mouth_center": [256, 325]}); the default id
+    maps to Config.AVATAR_PATH. The first load decodes the image, builds its
+    mouth atlas and saves both under `assets_dir` as .npy arrays plus a JSON
+    sidecar; later loads (in any process) memory-map those files instead.
+    """
+
+    def __init__(self, avatars_dir=Config.AVATARS_DIR, assets_dir=Config.AVATAR_ASSETS_DIR,
+                 max_bytes=Config.AVATAR_CACHE_MB * 1024 * 1024,
+                 default_avatar=Config.DEFAULT_AVATAR, default_path=Config.AVATAR_PATH):
+        self.avatars_dir = avatars_dir
+        self.assets_dir = assets_dir
+        self.max_bytes = max_bytes
+        self.default_avatar = default_avatar
+        self.default_path = default_path
+
+        # avatar_id -> LipSyncEngine, least recently used first
+        self.engines = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.load_locks = collections.defaultdict(threading.Lock)
+        self.keys = {}
+        self.stats = {'hits': 0, 'loads': 0, 'builds': 0, 'evictions': 0}
+
+    def resolve(self, avatar_id=None):
+        """Find the source image and metadata for an id
+
+        Raises KeyError for ids that are malformed or have no image.
+        """
+        avatar_id = avatar_id or self.default_avatar
+        if not AVATAR_ID_PATTERN.match(avatar_id):
+            raise KeyError(f"Invalid avatar id: {avatar_id!r}")
+
+        image_path = None
+        if avatar_id == self.default_avatar:
+            # A missing default image falls back to the drawn face
+            image_path = self.default_path
+        else:
+            for ext in IMAGE_EXTENSIONS:
+                candidate = os.path.join(self.avatars_dir, avatar_id + ext)
+                if os.path.isfile(candidate):
+                    image_path = candidate
+                    break
+        if image_path is None:
+            raise KeyError(f"Unknown avatar: {avatar_id}")
+
+        metadata = {}
+        sidecar = os.path.splitext(image_path)[0] + '.json'
+        if os.path.isfile(sidecar):
+            with open(sidecar, encoding='utf-8') as f:
+                metadata = json.load(f)
+        return AvatarSource(avatar_id, image_path, metadata)
+
+    def list_avatars(self):
+        """Ids of every avatar image in the avatars directory"""
+        ids = set()
+        if os.path.isdir(self.avatars_dir):
+            for name in os.listdir(self.avatars_dir):
+                avatar_id, ext = os.path.splitext(name)
+                if ext.lower() in IMAGE_EXTENSIONS and AVATAR_ID_PATTERN.match(avatar_id):
+                    ids.add(avatar_id)
+        # The default image is reachable under its file name too; only list the id
+        ids.discard(os.path.splitext(os.path.basename(self.default_path))[0])
+        ids.add(self.default_avatar)
+        return sorted(ids)
+
+    def asset_key(self, avatar_id=None):
+        """Content hash of everything that shapes an avatar's frames, computed once per id (blocking)"""
+        source = self.resolve(avatar_id)
+        key = self.keys.get(source.avatar_id)
+        if key is None:
+            parts = [
+                f"assets={ASSETS_VERSION}",
+                f"image={file_digest(source.image_path)}",
+                f"metadata={json.dumps(source.metadata, sort_keys=True)}",
+                f"shapes={json.dumps(MOUTH_SHAPES, sort_keys=True)}",
+                f"blend_levels={Config.LIPSYNC_BLEND_LEVELS}",
+            ]
+            key = self.keys[source.avatar_id] = hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+        return key
+
+    def get(self, avatar_id=None):
+        """LipSyncEngine for an avatar, loading it on first use (blocking)"""
+        avatar_id = avatar_id or self.default_avatar
+        engine = self.lookup(avatar_id)
+        if engine is not None:
+            return engine
+
+        # Unknown ids fail here, before they get a lock entry
+        source = self.resolve(avatar_id)
+        # One loader per id; other ids keep being served meanwhile
+        with self.load_locks[avatar_id]:
+            engine = self.lookup(avatar_id)
+            if engine is not None:
+                return engine
+            engine = self.load(source)
+
+        with self.lock:
+            self.engines[avatar_id] = engine
+            self.size += engine.atlas.nbytes
+            self.evict()
+        return engine
+
+    def lookup(self, avatar_id):
+        with self.lock:
+            engine = self.engines.get(avatar_id)
+            if engine is not None:
+                self.engines.move_to_end(avatar_id)
+                self.stats['hits'] += 1
+            return engine
+
+    def load(self, source):
+        """Memory-map preprocessed assets, building them first when missing or stale"""
+        asset_dir = os.path.join(
+            self.assets_dir, f"{source.avatar_id}-{self.asset_key(source.avatar_id)[:16]}"
+        )
+        self.stats['loads'] += 1
+        try:
+            atlas = MouthAtlas.load(asset_dir, MOUTH_SHAPES)
+            logger.info(f"Avatar '{source.avatar_id}' mapped from {asset_dir}")
+            return LipSyncEngine(source.image_path, atlas=atlas)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        engine = LipSyncEngine(source.image_path, mouth_center=source.metadata.get('mouth_center'))
+        self.stats['builds'] += 1
+        self.save_assets(source.avatar_id, engine.atlas, asset_dir)
+        return engine
+
+    def save_assets(self, avatar_id, atlas, asset_dir):
+        """Write assets to a temp directory and rename it into place"""
+        tmp_dir = f"{asset_dir}.{uuid.uuid4().hex}.tmp"
+        try:
+            atlas.save(tmp_dir)
+            os.rename(tmp_dir, asset_dir)
+        except OSError as e:
+            # Another process may have won the race; either way the in-memory atlas works
+            logger.warning(f"Could not save assets for avatar '{avatar_id}': {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        # Drop assets built from older versions of this avatar
+        stale = re.compile(re.escape(avatar_id) + r'-[0-9a-f]{16}')
+        for name in os.listdir(self.assets_dir):
+            path = os.path.join(self.assets_dir, name)
+            if stale.fullmatch(name) and path != asset_dir:
+                shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Avatar '{avatar_id}' assets saved to {asset_dir}")
+
+    def evict(self):
+        """Drop least recently used avatars until under the cap (lock held)"""
+        while self.size > self.max_bytes and len(self.engines) > 1:
+            avatar_id, engine = self.engines.popitem(last=False)
+            self.size -= engine.atlas.nbytes
+            self.stats['evictions'] += 1
+            logger.info(f"Evicted avatar '{avatar_id}'")
+
+    def get_stats(self):
+        """Loaded avatars and cache counters"""
+        with self.lock:
+            return {
+                **self.stats,
+                'loaded': list(self.engines),
+                'bytes': self.size,
+            }
+
+def preprocess(avatar_ids=None):
+    """Build memory-mappable assets for the given (or all) avatars"""
+    registry = AvatarRegistry()
+    for avatar_id in avatar_ids or registry.list_avatars():
+        registry.get(avatar_id)
+    return registry.get_stats()
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute avatar assets")
+    parser.add_argument('avatars', nargs='*', help="avatar ids (default: every avatar)")
+    args = parser.parse_args()
+    print(json.dumps(preprocess(args.avatars), indent=2))
@@ -1,38 +1,159 @@
-import cv2
-import numpy as np
-from moviepy.editor import ImageSequenceClip, AudioFileClip
+import itertools
 import os
+import threading
+import time
 from ..config import Config
+from ..workers.cancellation import RenderCancelled
+from ..workers.frame_ring import FrameRing, FrameRingClosed
+from .video_encoder import FRAGMENTED_MOVFLAGS, EncodeJob, FFmpegPipeEncoder
 import logging
 import uuid
 
 logger = logging.getLogger(__name__)
 
 class AvatarRenderer:
-    def __init__(self, output_path=Config.OUTPUT_PATH):
+    def __init__(self, output_path=Config.OUTPUT_PATH, encoder=Config.VIDEO_ENCODER,
+                 preset=Config.VIDEO_PRESET):
         self.output_path = output_path
+        self.encoder = encoder  # 'ffmpeg' (stdin pipe) or 'moviepy'
+        self.preset = preset
+        self.last_stats = None
         os.makedirs(output_path, exist_ok=True)
         
     def render_video(self, frames, audio_data, fps=Config.VIDEO_FPS):
         """Render frames with audio to video file"""
+        if not frames:
+            logger.error("No frames to render")
+            return None
+            
+        if self.encoder == 'ffmpeg':
+            return self.encode_ffmpeg(frames, audio_data, fps)
+        return self.encode_moviepy_clip(frames, audio_data, fps)
+        
+    def render_video_stream(self, frames, audio_data, fps=Config.VIDEO_FPS,
+                            queue_size=Config.FRAME_QUEUE_SIZE, fragmented=False, ring=None):
+        """Render a lazily produced frame iterator with audio to video file
+        
+        Frames are pulled on a producer thread into a FrameRing and written
+        to the encoder straight from its slots, so peak memory depends on
+        `queue_size` rather than on the utterance length. Pass the `ring`
+        whose slots the frames are composed into (see
+        LipSyncEngine.stream_frames) to avoid copying them at all.
+        `fragmented` writes a fragmented MP4 suitable for segment-by-segment
+        playback.
+        """
+        slotted = self.ring_frames(frames, ring, queue_size)
         try:
-            # Generate unique filename
-            video_id = str(uuid.uuid4())
-            video_path = f"{self.output_path}/{video_id}.mp4"
-            audio_path = f"{self.output_path}/{video_id}_audio.mp3"
+            if self.encoder == 'ffmpeg':
+                return self.encode_ffmpeg(slotted, audio_data, fps, fragmented)
+            return self.encode_moviepy_stream(slotted, audio_data, fps, fragmented)
+        finally:
+            slotted.close()
             
-            # Save audio temporarily
-            with open(audio_path, 'wb') as f:
-                f.write(audio_data)
+    def ring_frames(self, frames, ring=None, queue_size=Config.FRAME_QUEUE_SIZE):
+        """Yield `frames` through a FrameRing filled by a producer thread
+        
+        Frames that already are the ring's next slot are published as they
+        are; anything else is copied into the slot. Without a `ring` one is
+        sized from the first frame and removed at the end.
+        """
+        frames = iter(frames)
+        owned = ring is None
+        if owned:
+            first = next(frames, None)
+            if first is None:
+                return
+            ring = FrameRing(first.shape, queue_size)
+            frames = itertools.chain([first], frames)
+        errors = []
+        
+        def produce():
+            try:
+                while True:
+                    slot = ring.acquire()
+                    frame = next(frames, None)
+                    if frame is None:
+                        break
+                    if frame is not slot:
+                        slot[...] = frame
+                    ring.publish()
+                ring.finish()
+            except FrameRingClosed:
+                pass  # The encoder stopped early
+            except Exception as e:
+                errors.append(e)
+                ring.abort()
                 
-            # Create video from frames
-            if frames:
-                # Convert frames to RGB if needed
-                rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if len(frame.shape) == 3 else frame 
-                            for frame in frames]
+        producer = threading.Thread(target=produce, name="frame-producer", daemon=True)
+        producer.start()
+        
+        try:
+            yield from ring
+        except FrameRingClosed:
+            if errors:
+                raise errors[0]
+            raise
+        finally:
+            ring.abort()
+            # The producer may be mid-write into a slot; wait before unmapping
+            producer.join()
+            if owned:
+                ring.close()
+            
+    def new_video_path(self):
+        """Generate unique filename"""
+        video_id = str(uuid.uuid4())
+        return f"{self.output_path}/{video_id}.mp4"
+        
+    def record_stats(self, encoder, frame_count, started):
+        """Store and log encode timing for the last render"""
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            'encoder': encoder,
+            'frames': frame_count,
+            'encode_seconds': elapsed,
+            'ms_per_frame': elapsed * 1000 / max(frame_count, 1),
+        }
+        logger.info(
+            f"Encoded {frame_count} frames with {encoder} in {elapsed:.2f}s "
+            f"({self.last_stats['ms_per_frame']:.2f} ms/frame)"
+        )
+        
+    def encode_ffmpeg(self, frames, audio_data, fps, fragmented=False):
+        """Pipe frames and in-memory audio into ffmpeg"""
+        video_path = self.new_video_path()
+        try:
+            encoder = FFmpegPipeEncoder(fps=fps, preset=self.preset, fragmented=fragmented)
+            self.last_stats = encoder.encode(frames, audio_data, video_path)
+            
+            logger.info(f"Video rendered successfully: {video_path}")
+            return video_path
+            
+        except RenderCancelled:
+            # The encoder already killed ffmpeg and removed the partial file
+            logger.info("Render cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Error rendering video: {e}")
+            return None
+            
+    def encode_moviepy_clip(self, frames, audio_data, fps):
+        """Render a frame list through a moviepy ImageSequenceClip"""
+        # moviepy is slow to import and only needed by this backend
+        from moviepy.editor import ImageSequenceClip, AudioFileClip
+        
+        video_path = self.new_video_path()
+        started = time.perf_counter()
+        try:
+            with EncodeJob() as job:
+                audio_path = job.file('audio.mp3')
                 
-                # Create video clip
-                clip = ImageSequenceClip(rgb_frames, fps=fps)
+                # Save audio temporarily
+                with open(audio_path, 'wb') as f:
+                    f.write(audio_data)
+                    
+                # Frames are RGB already, as moviepy expects
+                clip = ImageSequenceClip(frames, fps=fps)
                 
                 # Add audio
                 audio_clip = AudioFileClip(audio_path)
@@ -43,35 +164,73 @@ class AvatarRenderer:
                     video_path,
                     codec=Config.VIDEO_CODEC,
                     audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
+                    temp_audiofile=job.file('temp-audio.m4a'),
                     remove_temp=True
                 )
+                audio_clip.close()
                 
-                # Clean up temporary audio
-                os.remove(audio_path)
-                
-                logger.info(f"Video rendered successfully: {video_path}")
-                return video_path
-                
-            else:
-                logger.error("No frames to render")
-                return None
-                
+            self.record_stats('moviepy', len(frames), started)
+            logger.info(f"Video rendered successfully: {video_path}")
+            return video_path
+            
         except Exception as e:
             logger.error(f"Error rendering video: {e}")
-            # Clean up temp files if they exist
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
             return None
             
-    def render_realtime_stream(self, frame_generator, audio_generator):
-        """Render real-time stream (for WebRTC)"""
-        # This would stream frames directly to WebRTC
-        # Implementation depends on streaming protocol
+    def encode_moviepy_stream(self, frames, audio_data, fps, fragmented=False):
+        """Write frames one by one through moviepy's ffmpeg writer"""
+        from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
         
-        for frame in frame_generator:
-            # Encode frame and send via WebRTC
-            yield frame
+        video_path = self.new_video_path()
+        ffmpeg_params = ['-acodec', 'aac']
+        if fragmented:
+            ffmpeg_params += ['-movflags', FRAGMENTED_MOVFLAGS]
+        started = time.perf_counter()
+        writer = None
+        frame_count = 0
+        try:
+            with EncodeJob() as job:
+                audio_path = job.file('audio.mp3')
+                
+                # Save audio temporarily
+                with open(audio_path, 'wb') as f:
+                    f.write(audio_data)
+                    
+                for frame in frames:
+                    if writer is None:
+                        height, width = frame.shape[:2]
+                        writer = FFMPEG_VideoWriter(
+                            video_path,
+                            (width, height),
+                            fps,
+                            codec=Config.VIDEO_CODEC,
+                            audiofile=audio_path,
+                            ffmpeg_params=ffmpeg_params
+                        )
+                    writer.write_frame(frame)
+                    frame_count += 1
+                    
+                if writer is None:
+                    logger.error("No frames to render")
+                    return None
+                    
+                writer.close()
+                writer = None
+                
+            self.record_stats('moviepy', frame_count, started)
+            logger.info(f"Video rendered successfully ({frame_count} frames streamed): {video_path}")
+            return video_path
+            
+        except Exception as e:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(video_path):
+                os.remove(video_path)
+            if isinstance(e, RenderCancelled):
+                logger.info("Render cancelled")
+                raise
+            logger.error(f"Error rendering video stream: {e}")
+            return None
             
     def save_video(self, video_path):
         """Save and return video file path"""
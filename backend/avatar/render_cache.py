@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+from ..cache.disk_lru import DiskLRU
+from ..cache.single_flight import SingleFlight
+from ..config import Config
+from ..tts.audio_analysis import analysis_settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever lip sync or encoding changes the pixels or container of a render
+RENDERER_VERSION = '5'
+
+def file_digest(path):
+    """sha256 of a file's contents, or of the path when it does not exist"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        digest.update(f"missing:{path}".encode())
+    return digest.hexdigest()
+
+class RenderCache:
+    """Content-addressed store of fully encoded avatar videos.
+
+    The key covers everything that affects the output (text and voice via
+    the TTS key, avatar image, fps, codec, encoder settings, speech timing
+    settings and renderer version), so a hit can be returned without
+    running TTS, lip sync or the encoder. Files are kept in a size-capped DiskLRU.
+    """
+
+    def __init__(self, cache_dir=Config.RENDER_CACHE_DIR,
+                 max_bytes=Config.RENDER_CACHE_MB * 1024 * 1024, executor=None):
+        self.executor = executor  # StageExecutor; None uses asyncio.to_thread
+        self.disk = DiskLRU(cache_dir, 'mp4', max_bytes)
+        self.single_flight = SingleFlight()
+        self.avatar_digests = {}
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def avatar_digest(self, avatar_path):
+        """Content hash of an avatar image, computed once per path"""
+        digest = self.avatar_digests.get(avatar_path)
+        if digest is None:
+            digest = self.avatar_digests[avatar_path] = file_digest(avatar_path)
+        return digest
+
+    def make_key(self, voice_key, avatar_path=Config.AVATAR_PATH, fps=Config.VIDEO_FPS, avatar_key=None):
+        """Key for one render; `voice_key` is the TTS cache key of the text
+
+        `avatar_key` (AvatarRegistry.asset_key) replaces hashing `avatar_path`.
+        """
+        parts = [
+            f"renderer={RENDERER_VERSION}",
+            f"voice={voice_key}",
+            f"avatar={avatar_key or self.avatar_digest(avatar_path)}",
+            f"fps={fps}",
+            f"codec={Config.VIDEO_CODEC}",
+            f"encoder={Config.VIDEO_ENCODER}",
+            f"preset={Config.VIDEO_PRESET}",
+            f"blend_levels={Config.LIPSYNC_BLEND_LEVELS}",
+            f"alignment={Config.TTS_ALIGNMENT}",
+        ]
+        if Config.TTS_ALIGNMENT == 'audio':
+            # Word and viseme timing come from the audio analysis
+            parts += [f"audio_{name}={value}" for name, value in sorted(analysis_settings().items())]
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    async def get_or_render(self, key, render):
+        """Cached video path for `key`, running `await render()` once on a miss
+
+        `render` returns the path of a freshly encoded video (or None); the
+        file is moved into the cache and its cached path returned.
+        """
+        async def load():
+            path = await self.run_io(self.disk.lookup, key)
+            if path is not None:
+                self.stats['hits'] += 1
+                return path
+
+            self.stats['misses'] += 1
+            video_path = await render()
+            if video_path is None:
+                return None
+            cached_path = await self.run_io(self.disk.adopt, key, video_path)
+            return cached_path or video_path
+
+        try:
+            return await self.single_flight.run(key, load)
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+
+    async def run_io(self, fn, *args):
+        if self.executor is not None:
+            return await self.executor.run('io', fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    def get_stats(self):
+        """Hit/miss counters and cache size"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'coalesced': self.single_flight.coalesced,
+            'evictions': self.disk.evictions,
+            'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+            'entries': self.disk.entries(),
+            'bytes': self.disk.size,
+        }
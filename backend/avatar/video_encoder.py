@@ -0,0 +1,191 @@
+import numpy as np
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fragmented MP4: playable while it is still being written or streamed
+FRAGMENTED_MOVFLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+# x264 settings per preset name
+ENCODER_PRESETS = {
+    # Fastest first byte, larger files
+    'realtime': ['-preset', 'ultrafast', '-tune', 'zerolatency', '-crf', '28'],
+    # Smaller, higher quality files for storage
+    'archival': ['-preset', 'slow', '-crf', '18'],
+}
+
+class EncodeJob:
+    """Per-render scratch directory, removed when the job ends"""
+
+    def __init__(self, prefix='avatar-render-'):
+        self.prefix = prefix
+        self.path = None
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(prefix=self.prefix)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+class FFmpegPipeEncoder:
+    """Encode raw frames piped straight into an ffmpeg subprocess.
+
+    Frames go over stdin as rawvideo and the audio bytes are fed from memory
+    through a second pipe, so nothing but the final mp4 touches the disk.
+    Output is written to a `.part` file and renamed once ffmpeg succeeds.
+    """
+
+    def __init__(self, fps=Config.VIDEO_FPS, codec=Config.VIDEO_CODEC,
+                 preset=Config.VIDEO_PRESET, ffmpeg_binary=Config.FFMPEG_BINARY,
+                 pix_fmt='rgb24', fragmented=False):
+        if preset not in ENCODER_PRESETS:
+            raise ValueError(f"Unknown encoder preset: {preset}")
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.ffmpeg_binary = ffmpeg_binary
+        # Lip-sync frames are RGB (the avatar is converted once on load)
+        self.pix_fmt = pix_fmt
+        self.fragmented = fragmented
+        self.last_stats = None
+
+    def build_command(self, size, audio_input, output_path):
+        """ffmpeg command line for one encode"""
+        width, height = size
+        cmd = [
+            self.ffmpeg_binary, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', self.pix_fmt,
+            '-s', f'{width}x{height}', '-r', str(self.fps), '-i', 'pipe:0',
+        ]
+        if audio_input is not None:
+            cmd += ['-i', audio_input]
+        cmd += ['-map', '0:v:0']
+        if audio_input is not None:
+            cmd += ['-map', '1:a:0', '-c:a', 'aac']
+        cmd += ['-c:v', self.codec]
+        if self.codec == 'libx264':
+            cmd += ENCODER_PRESETS[self.preset]
+        movflags = FRAGMENTED_MOVFLAGS if self.fragmented else '+faststart'
+        cmd += ['-pix_fmt', 'yuv420p', '-movflags', movflags, '-f', 'mp4', output_path]
+        return cmd
+
+    def encode(self, frames, audio_data, output_path):
+        """Encode an iterable of frames plus audio bytes into `output_path`"""
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("No frames to encode")
+
+        height, width = first.shape[:2]
+        partial_path = f"{output_path}.part"
+        started = time.perf_counter()
+        frame_count = 0
+
+        with EncodeJob() as job:
+            audio_input, audio_fd, pass_fds = self.prepare_audio(job, audio_data)
+            cmd = self.build_command((width, height), audio_input, partial_path)
+
+            with open(job.file('ffmpeg.log'), 'wb') as log_file:
+                try:
+                    process = subprocess.Popen(
+                        cmd, stdin=subprocess.PIPE, stderr=log_file, pass_fds=pass_fds
+                    )
+                except BaseException:
+                    if audio_fd is not None:
+                        os.close(audio_fd)
+                    raise
+                finally:
+                    # The child holds its own copy of the audio pipe's read end
+                    for fd in pass_fds:
+                        os.close(fd)
+
+                feeder = None
+                try:
+                    if audio_fd is not None:
+                        feeder = threading.Thread(
+                            target=self.feed_audio, args=(audio_fd, audio_data), daemon=True
+                        )
+                        feeder.start()
+
+                    process.stdin.write(self.frame_bytes(first))
+                    frame_count = 1
+                    for frame in frames:
+                        process.stdin.write(self.frame_bytes(frame))
+                        frame_count += 1
+                    process.stdin.close()
+                    returncode = process.wait()
+
+                except BaseException:
+                    process.kill()
+                    process.wait()
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    raise
+
+                finally:
+                    if feeder is not None:
+                        feeder.join(timeout=5)
+
+            if returncode != 0:
+                with open(job.file('ffmpeg.log'), 'rb') as f:
+                    error = f.read().decode(errors='replace').strip()
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise RuntimeError(f"ffmpeg exited with {returncode}: {error}")
+
+        os.replace(partial_path, output_path)
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            'encoder': 'ffmpeg',
+            'preset': self.preset,
+            'frames': frame_count,
+            'encode_seconds': elapsed,
+            'ms_per_frame': elapsed * 1000 / frame_count,
+        }
+        logger.info(
+            f"Encoded {frame_count} frames with ffmpeg/{self.preset} in {elapsed:.2f}s "
+            f"({self.last_stats['ms_per_frame']:.2f} ms/frame)"
+        )
+        return self.last_stats
+
+    def prepare_audio(self, job, audio_data):
+        """Return (ffmpeg input, write fd, fds to pass) for the audio track"""
+        if not audio_data:
+            return None, None, ()
+        if os.name == 'posix':
+            read_fd, write_fd = os.pipe()
+            return f'pipe:{read_fd}', write_fd, (read_fd,)
+
+        # No inheritable extra pipes: fall back to a per-job temp file
+        audio_path = job.file('audio.mp3')
+        with open(audio_path, 'wb') as f:
+            f.write(audio_data)
+        return audio_path, None, ()
+
+    @staticmethod
+    def frame_bytes(frame):
+        """Zero-copy byte view of a frame for the stdin pipe"""
+        return np.ascontiguousarray(frame).data.cast('B')
+
+    @staticmethod
+    def feed_audio(fd, audio_data):
+        """Write the audio bytes into ffmpeg's audio pipe"""
+        try:
+            with os.fdopen(fd, 'wb') as pipe:
+                pipe.write(audio_data)
+        except (BrokenPipeError, OSError):
+            # ffmpeg stopped reading; its exit status reports the failure
+            pass
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import secrets
+import shutil
+import threading
+import time
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class VideoStore:
+    """Short-lived links to rendered videos, and retention for the output directory.
+
+    `publish` maps a random id to a video file for `link_ttl` seconds; the
+    HTTP server resolves ids back to paths and streams the file. The
+    collector deletes rendered files in `output_path` (top level only;
+    batch outputs live in subdirectories) once they are older than
+    `max_age`, then oldest first while the directory exceeds `max_bytes`.
+    Files behind a live link are spared by the size limit, not by age.
+    Videos published from elsewhere (render cache hits) are linked into
+    `output_path` first, so the cache evicting its copy cannot break a link.
+    """
+
+    def __init__(self, output_path=Config.OUTPUT_PATH, url_base=Config.VIDEO_URL_BASE,
+                 link_ttl=Config.VIDEO_LINK_TTL, max_age=Config.OUTPUT_RETENTION_SECONDS,
+                 max_bytes=Config.OUTPUT_RETENTION_MB * 1024 * 1024,
+                 interval=Config.OUTPUT_GC_INTERVAL, executor=None):
+        self.output_path = output_path
+        self.url_base = url_base.rstrip('/')
+        self.link_ttl = link_ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.executor = executor  # StageExecutor; None uses asyncio.to_thread
+
+        # video id -> (path, expiry); read by the HTTP handlers, pruned by the collector
+        self.links = {}
+        self.lock = threading.Lock()
+        self.task = None
+        self.stats = {'published': 0, 'adopted': 0, 'served': 0, 'expired': 0, 'deleted': 0,
+                      'deleted_bytes': 0, 'bytes': 0, 'files': 0}
+
+    async def publish(self, video_path):
+        """URL for a rendered video, valid for `link_ttl` seconds"""
+        path = os.path.abspath(video_path)
+        if os.path.dirname(path) != os.path.abspath(self.output_path):
+            try:
+                path = await self.run_io(self.adopt, path)
+            except OSError as e:
+                logger.error(f"Could not link {path} into {self.output_path}: {e}")
+        video_id = secrets.token_urlsafe(16)
+        with self.lock:
+            self.links[video_id] = (path, time.monotonic() + self.link_ttl)
+        self.stats['published'] += 1
+        return f"{self.url_base}/videos/{video_id}"
+
+    def adopt(self, video_path):
+        """Hard link (a copy across filesystems) of a video in the output directory (blocking)"""
+        path = os.path.join(os.path.abspath(self.output_path), f"{secrets.token_hex(16)}.mp4")
+        try:
+            os.link(video_path, path)
+            os.utime(path)  # Age counts from publishing, not from the first render
+        except OSError:
+            shutil.copyfile(video_path, path + '.part')
+            os.replace(path + '.part', path)
+        self.stats['adopted'] += 1
+        return path
+
+    def resolve(self, video_id):
+        """Path behind a live link, or None"""
+        with self.lock:
+            link = self.links.get(video_id)
+            if link is None:
+                return None
+            path, expiry = link
+            if time.monotonic() >= expiry:
+                del self.links[video_id]
+                self.stats['expired'] += 1
+                return None
+        self.stats['served'] += 1
+        return path
+
+    def prune_links(self):
+        """Drop expired links; returns the paths still linked"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [video_id for video_id, (_, expiry) in self.links.items() if expiry <= now]
+            for video_id in expired:
+                del self.links[video_id]
+            linked = {path for path, _ in self.links.values()}
+        self.stats['expired'] += len(expired)
+        return linked
+
+    def collect(self):
+        """One retention pass over the output directory (blocking)"""
+        linked = self.prune_links()
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.output_path) as scan:
+                for entry in scan:
+                    if entry.name.endswith(('.mp4', '.mp4.part')) and entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, os.path.abspath(entry.path), stat.st_size))
+        except FileNotFoundError:
+            return
+        entries.sort()
+
+        total = sum(size for _, _, size in entries)
+        kept = 0
+        for mtime, path, size in entries:
+            too_old = now - mtime > self.max_age
+            # '.part' files are still being encoded, unless left behind by a crash long ago
+            too_big = total > self.max_bytes and path not in linked and not path.endswith('.part')
+            if not (too_old or too_big):
+                kept += 1
+                continue
+            try:
+                # Transfers already in progress keep their open file
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats['deleted'] += 1
+            self.stats['deleted_bytes'] += size
+        self.stats['bytes'] = total
+        self.stats['files'] = kept
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                deleted = self.stats['deleted']
+                await self.run_io(self.collect)
+                if self.stats['deleted'] > deleted:
+                    logger.info(f"Output retention: deleted {self.stats['deleted'] - deleted} videos, "
+                                f"{self.stats['files']} kept ({self.stats['bytes'] / 1e6:.1f} MB)")
+            except Exception as e:
+                logger.error(f"Output retention pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_io(self, fn, *args):
+        if self.executor is not None:
+            return await self.executor.run('io', fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    def get_stats(self):
+        with self.lock:
+            links = len(self.links)
+        return {**self.stats, 'links': links}
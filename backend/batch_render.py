@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Render a manifest of scripted clips to video files, offline
+
+Each manifest line is a JSON object:
+    {"id": "welcome-01", "text": "...", "avatar": "anchor", "output": "optional/path.mp4"}
+Only "text" is required; the id defaults to the line number and the
+output to `<output-dir>/<id>.mp4`. Clips whose output already exists are
+skipped, and every finished clip is appended to a checkpoint file, so an
+interrupted run picks up where it stopped. A clip whose text or avatar
+changed since the checkpoint recorded it is rendered again.
+
+Usage: python -m backend.batch_render manifest.jsonl [--output-dir DIR] [--workers N] [--json report.json]
+"""
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+from .config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLIP_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+BatchClip = collections.namedtuple('BatchClip', 'clip_id text avatar_id output')
+
+def clip_digest(clip):
+    """Hash of what a clip's video is made from, recorded in the checkpoint"""
+    source = json.dumps([clip.text, clip.avatar_id or Config.DEFAULT_AVATAR], ensure_ascii=False)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+def children_cpu_seconds():
+    """CPU time of this process's reaped children (workers and their encoders)"""
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        times = psutil.Process().cpu_times()
+        return times.children_user + times.children_system  # Not tracked on Windows (0)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+# TTS and viseme generation owned by a batch worker process
+_batch_state = {}
+
+def load_manifest(path, output_dir):
+    """Clips from a JSONL manifest; blank lines and '#' comments are skipped
+
+    Raises ValueError naming the line of the first malformed entry.
+    """
+    clips = []
+    seen = set()
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON ({e})")
+            if not isinstance(entry, dict) or not str(entry.get('text', '')).strip():
+                raise ValueError(f"{path}:{number}: entry needs a non-empty 'text'")
+
+            clip_id = str(entry.get('id') or f"clip-{number:06d}")
+            if not CLIP_ID_PATTERN.match(clip_id):
+                raise ValueError(f"{path}:{number}: invalid clip id {clip_id!r}")
+            if clip_id in seen:
+                raise ValueError(f"{path}:{number}: duplicate clip id {clip_id!r}")
+            seen.add(clip_id)
+
+            output = entry.get('output') or os.path.join(output_dir, f"{clip_id}.mp4")
+            clips.append(BatchClip(clip_id, entry['text'].strip(), entry.get('avatar'), output))
+    return clips
+
+def load_checkpoint(path):
+    """{clip id: record} of clips earlier runs finished or failed (the last record wins)"""
+    records = {}
+    if not os.path.isfile(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line from an interrupted run
+            records[record['id']] = record
+    return records
+
+def init_batch_worker(output_dir):
+    """Process pool initializer: render state plus an inline TTS and viseme generator"""
+    from .tts.text_to_speech import TextToSpeech
+    from .viseme.viseme_generator import VisemeGenerator
+    from .workers.stage_executor import init_render_worker
+
+    init_render_worker(output_dir)
+    _batch_state['tts'] = TextToSpeech()
+    _batch_state['visemes'] = VisemeGenerator()
+
+def clip_renderer(output_dir):
+    """Renderer encoding into `<output_dir>/.partial`, one per output directory"""
+    from .avatar.avatar_renderer import AvatarRenderer
+
+    renderers = _batch_state.setdefault('renderers', {})
+    renderer = renderers.get(output_dir)
+    if renderer is None:
+        renderer = renderers[output_dir] = AvatarRenderer(os.path.join(output_dir, '.partial'))
+    return renderer
+
+def render_clip(clip, fps=Config.VIDEO_FPS):
+    """Process pool entry point: TTS, visemes, lip sync and encode for one clip
+
+    The video is encoded next to its output (same filesystem) and renamed
+    into place with os.replace, so an existing output is always complete.
+    Returns the clip's stats.
+    """
+    from .workers.stage_executor import _worker_state, render_with_stats
+
+    started = time.perf_counter()
+    audio_data, timings = asyncio.run(_batch_state['tts'].generate_with_timings(clip.text))
+    if not audio_data:
+        raise RuntimeError("speech synthesis failed")
+    viseme_sequence = _batch_state['visemes'].text_to_visemes(clip.text, timings)
+    tts_seconds = time.perf_counter() - started
+
+    renderer = clip_renderer(os.path.dirname(os.path.abspath(clip.output)))
+    video_path, stats = render_with_stats(
+        _worker_state['avatars'].get(clip.avatar_id), renderer, viseme_sequence, audio_data, fps
+    )
+    if not video_path:
+        raise RuntimeError("render failed")
+    # Atomic: never a partly copied output, even for manifests writing to other filesystems
+    os.replace(video_path, clip.output)
+
+    return {
+        'frames': stats['frames'],
+        'video_seconds': round(stats['frames'] / fps, 3),
+        'tts_seconds': round(tts_seconds, 3),
+        'render_seconds': round(stats['render_seconds'], 3),
+        'clip_seconds': round(time.perf_counter() - started, 3),
+        'worker': os.getpid(),
+    }
+
+def prepare_avatars(avatar_ids):
+    """Build every avatar's assets once, before the workers start
+
+    Workers then memory-map the same files instead of each building the
+    atlas; the pages are shared through the OS cache. Returns the ids that
+    could not be loaded, mapped to the error.
+    """
+    from .avatar.avatar_registry import AvatarRegistry
+
+    registry = AvatarRegistry()
+    failed = {}
+    for avatar_id in avatar_ids:
+        try:
+            registry.get(avatar_id)
+        except Exception as e:
+            failed[avatar_id] = str(e)
+    return failed
+
+class BatchRun:
+    """One pass over a manifest with a process pool and a checkpoint file"""
+
+    def __init__(self, clips, checkpoint_path, workers=Config.BATCH_WORKERS,
+                 output_dir=Config.BATCH_OUTPUT_DIR, force=False, progress_every=10):
+        self.clips = clips
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.output_dir = output_dir
+        self.force = force
+        self.progress_every = progress_every
+        self.stats = {'clips': len(clips), 'rendered': 0, 'skipped': 0, 'resumed': 0,
+                      'failed': 0, 'frames': 0, 'video_seconds': 0.0}
+
+    def pending(self):
+        """Clips still to render; finished ones are skipped unless forced
+
+        Outputs only ever appear complete, so an existing file counts as
+        done, unless the checkpoint shows it was rendered from another text
+        or avatar. Clips that failed last time are tried again.
+        """
+        if self.force:
+            return list(self.clips)
+        checkpoint = load_checkpoint(self.checkpoint_path)
+        pending = []
+        for clip in self.clips:
+            record = checkpoint.get(clip.clip_id, {})
+            if not os.path.exists(clip.output):
+                pending.append(clip)
+            elif record.get('digest', clip_digest(clip)) != clip_digest(clip):
+                logger.warning(f"Clip {clip.clip_id} changed since it was rendered; rendering it again")
+                pending.append(clip)
+            else:
+                self.stats['skipped'] += 1
+                if record.get('status') == 'done':
+                    self.stats['resumed'] += 1
+        return pending
+
+    def record(self, checkpoint, clip, status, **fields):
+        # One flushed line per clip: a crash loses at most the clips in flight
+        checkpoint.write(json.dumps({'id': clip.clip_id, 'output': clip.output, 'status': status,
+                                     'digest': clip_digest(clip), **fields}) + '\n')
+        checkpoint.flush()
+
+    def run(self):
+        pending = self.pending()
+        logger.info(f"{len(pending)} clips to render, {self.stats['skipped']} already done, "
+                    f"{self.workers} workers")
+        started = time.perf_counter()
+        if pending:
+            failed_avatars = prepare_avatars(sorted({clip.avatar_id or Config.DEFAULT_AVATAR for clip in pending}))
+            self.render(pending, failed_avatars)
+
+        elapsed = time.perf_counter() - started
+        self.stats['elapsed_seconds'] = round(elapsed, 3)
+        # Children are reaped by now, so this covers the workers and their encoders
+        cpu_seconds = children_cpu_seconds()
+        self.stats['cpu_utilization'] = round(cpu_seconds / max(elapsed * (os.cpu_count() or 1), 1e-9), 3)
+        self.stats['clips_per_minute'] = round(self.stats['rendered'] * 60 / max(elapsed, 1e-9), 2)
+        self.stats['frames_per_second'] = round(self.stats['frames'] / max(elapsed, 1e-9), 1)
+        self.stats['video_seconds'] = round(self.stats['video_seconds'], 3)
+        self.stats['realtime_factor'] = round(self.stats['video_seconds'] / max(elapsed, 1e-9), 2)
+        return self.stats
+
+    def render(self, pending, failed_avatars):
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        with open(self.checkpoint_path, 'a', encoding='utf-8') as checkpoint, ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_batch_worker,
+            # Clips encode into a hidden directory beside their output (see clip_renderer)
+            initargs=(os.path.join(self.output_dir, '.partial'),),
+        ) as pool:
+            queue = collections.deque()
+            for clip in pending:
+                avatar_id = clip.avatar_id or Config.DEFAULT_AVATAR
+                if avatar_id in failed_avatars:
+                    self.stats['failed'] += 1
+                    self.record(checkpoint, clip, 'failed', error=failed_avatars[avatar_id])
+                else:
+                    queue.append(clip)
+
+            # A couple of jobs per worker in flight keeps every core busy
+            # without pickling the whole manifest into the pool up front
+            inflight = {}
+            finished = 0
+            try:
+                while queue or inflight:
+                    while queue and len(inflight) < self.workers * 2:
+                        clip = queue.popleft()
+                        inflight[pool.submit(render_clip, clip)] = clip
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        clip = inflight.pop(future)
+                        try:
+                            stats = future.result()
+                        except Exception as e:
+                            logger.error(f"Clip {clip.clip_id} failed: {e}")
+                            self.stats['failed'] += 1
+                            self.record(checkpoint, clip, 'failed', error=str(e))
+                            continue
+                        self.stats['rendered'] += 1
+                        self.stats['frames'] += stats['frames']
+                        self.stats['video_seconds'] += stats['video_seconds']
+                        self.record(checkpoint, clip, 'done', **stats)
+
+                    previous, finished = finished, finished + len(done)
+                    if self.progress_every and finished // self.progress_every > previous // self.progress_every:
+                        logger.info(f"{finished}/{len(pending)} clips finished")
+            except KeyboardInterrupt:
+                # Finished clips are in the checkpoint; the next run resumes from there
+                for future in inflight:
+                    future.cancel()
+                raise
+
+def print_report(stats):
+    print(f"Rendered {stats['rendered']} clips, skipped {stats['skipped']}, failed {stats['failed']} "
+          f"(of {stats['clips']}) in {stats['elapsed_seconds']:.1f}s")
+    print(f"Throughput: {stats['clips_per_minute']:.1f} clips/min, {stats['frames_per_second']:.1f} frames/s, "
+          f"{stats['realtime_factor']:.2f}x realtime, CPU {stats['cpu_utilization'] * 100:.0f}% of all cores")
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a JSONL manifest of scripted clips to video files")
+    parser.add_argument('manifest', help="JSONL file with one clip per line ({'text': ..., 'id', 'avatar', 'output'})")
+    parser.add_argument('--output-dir', default=Config.BATCH_OUTPUT_DIR, help="where clips without an 'output' go")
+    parser.add_argument('--workers', type=int, default=Config.BATCH_WORKERS,
+                        help="render processes (default: one per core)")
+    parser.add_argument('--checkpoint', help="progress file (default: <output-dir>/checkpoint.jsonl)")
+    parser.add_argument('--force', action='store_true', help="re-render clips that are already done")
+    parser.add_argument('--json', help="write the throughput report to this file")
+    args = parser.parse_args()
+
+    Config.ensure_directories()
+    os.makedirs(args.output_dir, exist_ok=True)
+    clips = load_manifest(args.manifest, args.output_dir)
+    checkpoint_path = args.checkpoint or os.path.join(args.output_dir, 'checkpoint.jsonl')
+
+    stats = BatchRun(clips, checkpoint_path, args.workers, args.output_dir, args.force).run()
+    print_report(stats)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(stats, f, indent=2)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume from the checkpoint")
@@ -0,0 +1,164 @@
+import collections
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DiskLRU:
+    """Size-capped directory of files keyed by content hash.
+
+    Files are evicted least-recently-used first once the directory exceeds
+    `max_bytes`. Every write lands in a temp file and is renamed into place,
+    so readers never see a partial file. All methods block; call them from
+    a worker thread.
+
+    Several processes may share a directory (the server, render and batch
+    workers), but each keeps its own index and size: N processes can use
+    up to N x `max_bytes` between them, and each evicts only what it knows.
+    """
+
+    # Temp files younger than this may belong to another process mid-write
+    TEMP_GRACE_SECONDS = 3600
+
+    def __init__(self, directory, extension, max_bytes):
+        self.directory = directory
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        # key -> size, oldest access first; built lazily from the directory
+        self.index = None
+        self.size = 0
+        self.evictions = 0
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.{self.extension}")
+
+    def load_index(self):
+        """Scan the directory once (call with lock held)"""
+        if self.index is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith('.tmp'):
+                    if now - stat.st_mtime > self.TEMP_GRACE_SECONDS:
+                        os.remove(entry.path)  # Leftover from an interrupted write
+                    continue
+            except FileNotFoundError:
+                continue  # Renamed or evicted by another process meanwhile
+            key, ext = os.path.splitext(entry.name)
+            if ext != f".{self.extension}":
+                continue
+            entries.append((stat.st_mtime, key, stat.st_size))
+
+        self.index = collections.OrderedDict()
+        self.size = 0
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+            self.size += size
+        self.evict()
+
+    def lookup(self, key):
+        """Path of a cached file (refreshing its recency) or None"""
+        with self.lock:
+            self.load_index()
+            if key not in self.index:
+                return None
+            self.index.move_to_end(key)
+
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # Keep recency across restarts
+            return path
+        except FileNotFoundError:
+            self.forget(key)
+            return None
+
+    def read(self, key):
+        """Contents of a cached file or None"""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            self.forget(key)
+            return None
+
+    def write(self, key, data):
+        """Atomically store bytes under `key`"""
+        path = self.path_for(key)
+        tmp_path = self.temp_path(path)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        self.track(key, len(data))
+        return path
+
+    def adopt(self, key, source_path):
+        """Move an existing file into the cache under `key`, returning its new path"""
+        path = self.path_for(key)
+        tmp_path = self.temp_path(path)
+        try:
+            # Copy first when the source is on another filesystem
+            shutil.move(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error adopting cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        self.track(key, os.path.getsize(path))
+        return path
+
+    def temp_path(self, path):
+        with self.lock:
+            self.load_index()
+        return f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def track(self, key, size):
+        with self.lock:
+            old = self.index.pop(key, None)
+            if old is not None:
+                self.size -= old
+            self.index[key] = size
+            self.size += size
+            self.evict()
+
+    def forget(self, key):
+        with self.lock:
+            size = self.index.pop(key, None)
+            if size is not None:
+                self.size -= size
+
+    def evict(self):
+        """Drop least recently used files until under the cap (lock held)"""
+        while self.size > self.max_bytes and self.index:
+            key, size = self.index.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def entries(self):
+        with self.lock:
+            return len(self.index) if self.index is not None else None
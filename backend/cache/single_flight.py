@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution
+
+    The shared work runs as its own task and is cancelled only when every
+    caller waiting on it has been cancelled, so one client giving up never
+    fails another client's identical request.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+        self.coalesced = 0
+
+    async def run(self, key, fn):
+        """Await `fn()` once per key; concurrent callers share its result"""
+        entry = self.inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = self.inflight[key] = [task, 0]
+            task.add_done_callback(lambda _, entry=entry: self.forget(key, entry))
+        else:
+            self.coalesced += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not task.done():
+                task.cancel()  # Nobody is waiting any more
+
+    def forget(self, key, entry):
+        if self.inflight.get(key) is entry:
+            del self.inflight[key]
+        if not entry[0].cancelled():
+            entry[0].exception()  # Mark retrieved when every caller had gone
@@ -7,22 +7,135 @@ class Config:
     # Server Config
     HOST = os.getenv('HOST', 'localhost')
     PORT = int(os.getenv('PORT', 8765))
+    WS_CHUNK_SIZE = int(os.getenv('WS_CHUNK_SIZE', 256 * 1024))  # Bytes per binary WebSocket chunk
+    WS_MAX_UPLOAD_SIZE = int(os.getenv('WS_MAX_UPLOAD_SIZE', 20 * 1024 * 1024))  # Max reassembled upload
+    WS_MAX_PENDING_UPLOADS = int(os.getenv('WS_MAX_PENDING_UPLOADS', 4))  # Chunked uploads open at once per connection
+    WS_MAX_PENDING_BYTES = int(os.getenv('WS_MAX_PENDING_BYTES', WS_MAX_UPLOAD_SIZE))  # Held by those uploads together
+    WS_UPLOAD_TIMEOUT = float(os.getenv('WS_UPLOAD_TIMEOUT', 60))  # Seconds without a chunk before an upload is dropped
     
     # Paths
     AVATAR_PATH = os.getenv('AVATAR_PATH', 'avatars/default_avatar.png')
     OUTPUT_PATH = os.getenv('OUTPUT_PATH', 'outputs/')
+    AVATARS_DIR = os.getenv('AVATARS_DIR', 'avatars')  # <avatar_id>.png plus optional <avatar_id>.json
+    DEFAULT_AVATAR = os.getenv('DEFAULT_AVATAR', 'default')  # Id served from AVATAR_PATH
     
     # TTS Config
     TTS_LANGUAGE = os.getenv('TTS_LANGUAGE', 'hi')  # Hindi
     TTS_TLD = os.getenv('TTS_TLD', 'co.in')  # India domain for Google TTS
+    TTS_BACKEND = os.getenv('TTS_BACKEND', 'gtts')  # 'gtts' or 'offline' (local stand-in)
+    TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', 'cache/tts')
+    TTS_MEMORY_CACHE_MB = int(os.getenv('TTS_MEMORY_CACHE_MB', 32))
+    TTS_DISK_CACHE_MB = int(os.getenv('TTS_DISK_CACHE_MB', 512))
+    TTS_ALIGNMENT = os.getenv('TTS_ALIGNMENT', 'audio')  # 'audio' (word timings from the decoded speech) or 'estimate'
+
+    # Audio analysis of TTS output (word and viseme timing)
+    AUDIO_FRAME_MS = int(os.getenv('AUDIO_FRAME_MS', 10))  # Hop between analysis frames
+    AUDIO_SILENCE_DB = float(os.getenv('AUDIO_SILENCE_DB', -50))  # Frames quieter than this are never speech
+    AUDIO_DYNAMIC_RANGE_DB = float(os.getenv('AUDIO_DYNAMIC_RANGE_DB', 30))  # Speech is within this of the loud end
+    AUDIO_MIN_PAUSE_MS = int(os.getenv('AUDIO_MIN_PAUSE_MS', 60))  # Shorter gaps stay inside a word
+    AUDIO_MIN_SPEECH_MS = int(os.getenv('AUDIO_MIN_SPEECH_MS', 40))  # Shorter bursts are clicks, not speech
     
     # STT Config
     STT_LANGUAGE = os.getenv('STT_LANGUAGE', 'hi-IN')
+    STT_BACKEND = os.getenv('STT_BACKEND', 'google')  # 'google' or 'offline' (local stand-in)
+    STT_OFFLINE_TRANSCRIPT = os.getenv('STT_OFFLINE_TRANSCRIPT', '')  # What the offline recognizer "hears"
+    STT_SAMPLE_RATE = int(os.getenv('STT_SAMPLE_RATE', 16000))  # Decoded PCM rate
+    STT_BUFFER_SECONDS = float(os.getenv('STT_BUFFER_SECONDS', 30))  # PCM ring buffer per stream
+    STT_PARTIAL_INTERVAL = float(os.getenv('STT_PARTIAL_INTERVAL', 0))  # Seconds between interim results; 0 disables
+    STT_MAX_STREAMS_PER_CLIENT = int(os.getenv('STT_MAX_STREAMS_PER_CLIENT', 2))  # Live recordings (one ffmpeg each)
+    STT_STREAM_MAX_BUFFER_KB = int(os.getenv('STT_STREAM_MAX_BUFFER_KB', 1024))  # Encoded audio awaiting a live decoder
+    STT_UPLOAD_VAD = os.getenv('STT_UPLOAD_VAD', 'false').lower() == 'true'  # Also gate whole uploads (drops quiet speech)
+    STT_VAD_FRAME_MS = int(os.getenv('STT_VAD_FRAME_MS', 30))
+    STT_VAD_THRESHOLD_DB = float(os.getenv('STT_VAD_THRESHOLD_DB', -45))  # Frames quieter than this are silence
+    STT_VAD_MARGIN_DB = float(os.getenv('STT_VAD_MARGIN_DB', 12))  # Speech must be this far above the noise floor
+    STT_MIN_SPEECH_MS = int(os.getenv('STT_MIN_SPEECH_MS', 90))
+    STT_END_SILENCE_MS = int(os.getenv('STT_END_SILENCE_MS', 500))  # Silence that ends an utterance
+    STT_SPEECH_PAD_MS = int(os.getenv('STT_SPEECH_PAD_MS', 150))
+    STT_MAX_SEGMENT_SECONDS = float(os.getenv('STT_MAX_SEGMENT_SECONDS', 15))
     
     # Video Config
     VIDEO_FPS = int(os.getenv('VIDEO_FPS', 30))
     VIDEO_CODEC = os.getenv('VIDEO_CODEC', 'libx264')
+    VIDEO_ENCODER = os.getenv('VIDEO_ENCODER', 'ffmpeg')  # 'ffmpeg' (stdin pipe) or 'moviepy'
+    VIDEO_PRESET = os.getenv('VIDEO_PRESET', 'realtime')  # 'realtime' or 'archival'
+    FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+    FRAME_STREAMING = os.getenv('FRAME_STREAMING', 'true').lower() == 'true'  # Stream frames to the encoder
+    FRAME_QUEUE_SIZE = int(os.getenv('FRAME_QUEUE_SIZE', 8))  # Frame ring slots between lip sync and encoder
+    RESPONSE_DELIVERY = os.getenv('RESPONSE_DELIVERY', 'video')  # 'video' or 'mouth' (atlas once, then mouth tracks)
+    
+    # Incremental (segmented) responses
+    SEGMENTED_RESPONSES = os.getenv('SEGMENTED_RESPONSES', 'false').lower() == 'true'  # Default when the client does not ask
+    SEGMENT_MAX_CHARS = int(os.getenv('SEGMENT_MAX_CHARS', 160))
+    SEGMENT_MIN_CHARS = int(os.getenv('SEGMENT_MIN_CHARS', 20))
+    SEGMENT_LOOKAHEAD = int(os.getenv('SEGMENT_LOOKAHEAD', 2))  # Segments rendered ahead of the one being sent
+    SUPERSEDE_RESPONSES = os.getenv('SUPERSEDE_RESPONSES', 'true').lower() == 'true'  # New llm_response cancels the previous one
+    
+    # Render cache (fully encoded videos keyed by content)
+    RENDER_CACHE_ENABLED = os.getenv('RENDER_CACHE_ENABLED', 'true').lower() == 'true'
+    RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR', 'cache/renders')
+    RENDER_CACHE_MB = int(os.getenv('RENDER_CACHE_MB', 2048))
+    PREWARM_PHRASES_FILE = os.getenv('PREWARM_PHRASES_FILE', '')  # One phrase per line, rendered at startup
+    
+    # Avatar registry (decoded avatars + mouth atlases kept per process)
+    AVATAR_ASSETS_DIR = os.getenv('AVATAR_ASSETS_DIR', 'cache/avatars')  # Preprocessed, memory-mappable assets
+    AVATAR_CACHE_MB = int(os.getenv('AVATAR_CACHE_MB', 256))
+    
+    # WebRTC peers
+    WEBRTC_MAX_PEERS = int(os.getenv('WEBRTC_MAX_PEERS', 50))  # Per process
+    WEBRTC_MAX_PEERS_PER_CLIENT = int(os.getenv('WEBRTC_MAX_PEERS_PER_CLIENT', 2))
+    WEBRTC_IDLE_TIMEOUT = float(os.getenv('WEBRTC_IDLE_TIMEOUT', 600))  # Seconds an unconnected peer may sit idle; 0 disables
+    WEBRTC_REAP_INTERVAL = float(os.getenv('WEBRTC_REAP_INTERVAL', 30))
+    
+    # Render job queue (admission, priorities and per-client fairness)
+    RENDER_QUEUE_BACKEND = os.getenv('RENDER_QUEUE_BACKEND', 'local')  # 'local' (this process) or 'redis' (render workers)
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    RENDER_QUEUE_NAMESPACE = os.getenv('RENDER_QUEUE_NAMESPACE', 'avatar')  # Redis key prefix
+    RENDER_QUEUE_MAX_DEPTH = int(os.getenv('RENDER_QUEUE_MAX_DEPTH', 32))  # Waiting jobs before "busy" replies
+    RENDER_QUEUE_MAX_PER_TENANT = int(os.getenv('RENDER_QUEUE_MAX_PER_TENANT', 4))
+    TENANT_HEADER = os.getenv('TENANT_HEADER', '')  # Handshake header a trusted proxy sets to the tenant; empty uses the peer address
+    RENDER_JOB_TIMEOUT = float(os.getenv('RENDER_JOB_TIMEOUT', 120))  # Seconds
+    WORKER_HEARTBEAT_INTERVAL = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', 2))
+    WORKER_HEARTBEAT_TTL = float(os.getenv('WORKER_HEARTBEAT_TTL', 10))  # Worker counts as dead after this
+    RENDER_SHARED_PATH = os.getenv('RENDER_SHARED_PATH', '')  # Storage servers and workers both mount; workers return paths in it
+    RENDER_RESULT_MAX_MB = float(os.getenv('RENDER_RESULT_MAX_MB', 16))  # Largest video sent through Redis without a shared path
+    
+    # Lip Sync Config
+    LIPSYNC_BLEND_LEVELS = int(os.getenv('LIPSYNC_BLEND_LEVELS', 5))  # Pre-rendered blend steps per viseme
+    
+    # Worker pools (keep blocking stages off the event loop)
+    EXECUTOR_ENABLED = os.getenv('EXECUTOR_ENABLED', 'true').lower() == 'true'
+    RENDER_POOL = os.getenv('RENDER_POOL', 'process')  # 'process' or 'thread'
+    RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    STT_WORKERS = int(os.getenv('STT_WORKERS', 2))
+    IO_WORKERS = int(os.getenv('IO_WORKERS', 4))
+    RENDER_CANCEL_SLOTS = int(os.getenv('RENDER_CANCEL_SLOTS', 256))  # Renders that can be cancelled mid-flight
+    LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 0.1))  # Seconds between lag probes
+    LOOP_LAG_LOG_INTERVAL = float(os.getenv('LOOP_LAG_LOG_INTERVAL', 60))  # 0 disables lag logging
+    
+    # Offline batch rendering (python -m backend.batch_render)
+    BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', os.cpu_count() or 1))  # Render processes; one per core
+    BATCH_OUTPUT_DIR = os.getenv('BATCH_OUTPUT_DIR', 'outputs/batch')
+    
+    # Metrics and tracing
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    HTTP_HOST = os.getenv('HTTP_HOST', HOST)
+    HTTP_PORT = int(os.getenv('HTTP_PORT', PORT + 1))  # Serves /metrics, /healthz, /readyz and /videos; 0 disables
+    OTEL_ENABLED = os.getenv('OTEL_ENABLED', 'false').lower() == 'true'  # Needs opentelemetry-api
+    
+    # Video links (rendered videos fetched over HTTP instead of sent over the WebSocket)
+    VIDEO_DELIVERY = os.getenv('VIDEO_DELIVERY', 'url')  # 'url' (needs HTTP_PORT and VIDEO_URL_BASE) or 'inline'
+    VIDEO_URL_BASE = os.getenv('VIDEO_URL_BASE', '')  # HTTP origin as clients see it, e.g. https://avatar.example.com; empty sends videos inline
+    VIDEO_LINK_TTL = float(os.getenv('VIDEO_LINK_TTL', 3600))  # Seconds a video link stays valid
+    OUTPUT_RETENTION_SECONDS = float(os.getenv('OUTPUT_RETENTION_SECONDS', 6 * 3600))  # Rendered videos older than this are deleted
+    OUTPUT_RETENTION_MB = int(os.getenv('OUTPUT_RETENTION_MB', 2048))  # Oldest deleted first above this
+    OUTPUT_GC_INTERVAL = float(os.getenv('OUTPUT_GC_INTERVAL', 300))  # Seconds between retention passes
+    
+    # Startup warm-up (runs after the ports are bound; /readyz passes once it is done)
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_AVATARS = [a for a in os.getenv('WARMUP_AVATARS', DEFAULT_AVATAR).split(',') if a]  # Ids to preload
     
-    # Create directories if not exists
-    os.makedirs(OUTPUT_PATH, exist_ok=True)
-    os.makedirs('avatars', exist_ok=True)
\ No newline at end of file
+    @classmethod
+    def ensure_directories(cls):
+        """Create directories if not exists (at startup, not on import)"""
+        os.makedirs(cls.OUTPUT_PATH, exist_ok=True)
+        os.makedirs(cls.AVATARS_DIR, exist_ok=True)
\ No newline at end of file
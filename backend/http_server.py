@@ -0,0 +1,56 @@
+import os
+from aiohttp import web
+from .telemetry.metrics import REGISTRY
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+async def handle_metrics(request):
+    """Prometheus scrape endpoint"""
+    return web.Response(body=REGISTRY.render().encode(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+async def handle_healthz(request):
+    """Liveness: the event loop is up and answering"""
+    return web.json_response({'status': 'ok'})
+
+async def handle_readyz(request):
+    """Readiness: 503 until startup warm-up has finished"""
+    system = request.app['system']
+    if not system.ready:
+        return web.json_response({'status': 'warming'}, status=503)
+    return web.json_response({'status': 'ready', **system.warmup_stats})
+
+async def handle_video(request):
+    """A rendered video by link id: sendfile transfer with Range and conditional requests"""
+    system = request.app['system']
+    path = system.videos.resolve(request.match_info['video_id'])
+    if path is None or not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    # The id always names the same bytes, so caches may keep it for the link's lifetime
+    return web.FileResponse(path, headers={
+        'Content-Type': 'video/mp4',
+        'Cache-Control': f"private, max-age={int(system.videos.link_ttl)}, immutable",
+        'Access-Control-Allow-Origin': '*',
+    })
+
+def create_app(system):
+    """HTTP endpoints served next to the WebSocket server"""
+    app = web.Application()
+    app['system'] = system
+    app.router.add_get('/healthz', handle_healthz)
+    app.router.add_get('/readyz', handle_readyz)
+    app.router.add_get('/videos/{video_id}', handle_video)
+    if REGISTRY.enabled:
+        app.router.add_get('/metrics', handle_metrics)
+    return app
+
+async def start_http_server(system, host, port):
+    """Start the HTTP server; call cleanup() on the returned runner to stop it"""
+    runner = web.AppRunner(create_app(system), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"HTTP endpoints on http://{host}:{port}")
+    return runner
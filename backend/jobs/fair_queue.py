@@ -0,0 +1,73 @@
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job priorities; lower values are served first
+PRIORITY_INTERACTIVE = 0  # A client is waiting on this response
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2  # Pre-warming and batch renders
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND)
+
+class FairQueue:
+    """Strict priority across levels, round-robin across tenants within one.
+
+    Each (priority, tenant) pair has its own FIFO. pop() takes the head of
+    the next tenant in rotation at the most urgent non-empty priority, so
+    one tenant's burst cannot starve the others.
+    """
+
+    def __init__(self):
+        # priority -> tenant -> deque of items; tenant order is the rotation
+        self.levels = {priority: collections.OrderedDict() for priority in PRIORITIES}
+        self.tenant_depth = collections.Counter()
+        self.depth = 0
+
+    def push(self, item, tenant, priority=PRIORITY_NORMAL):
+        if priority not in self.levels:
+            raise ValueError(f"Unknown priority: {priority}")
+        tenants = self.levels[priority]
+        tenants.setdefault(tenant, collections.deque()).append(item)
+        self.tenant_depth[tenant] += 1
+        self.depth += 1
+
+    def pop(self):
+        """(item, tenant) of the next job, or None when empty"""
+        for priority in PRIORITIES:
+            tenants = self.levels[priority]
+            if not tenants:
+                continue
+            tenant, items = next(iter(tenants.items()))
+            item = items.popleft()
+            if items:
+                tenants.move_to_end(tenant)  # Next tenant's turn
+            else:
+                del tenants[tenant]
+
+            self.discount(tenant)
+            return item, tenant
+        return None
+
+    def remove(self, item, tenant, priority=PRIORITY_NORMAL):
+        """Drop a still-queued item; False when it was already popped"""
+        tenants = self.levels[priority]
+        items = tenants.get(tenant)
+        if not items:
+            return False
+        try:
+            items.remove(item)
+        except ValueError:
+            return False
+        if not items:
+            del tenants[tenant]
+        self.discount(tenant)
+        return True
+
+    def discount(self, tenant):
+        self.depth -= 1
+        self.tenant_depth[tenant] -= 1
+        if not self.tenant_depth[tenant]:
+            del self.tenant_depth[tenant]
+
+    def __len__(self):
+        return self.depth
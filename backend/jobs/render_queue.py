@@ -0,0 +1,424 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+import numpy as np
+from ..config import Config
+from ..telemetry.tracing import record_render
+from ..viseme.viseme_generator import VISEME_DTYPE
+from .fair_queue import PRIORITY_NORMAL, FairQueue
+import logging
+
+logger = logging.getLogger(__name__)
+
+class QueueBusyError(Exception):
+    """Raised when a job is refused because the render queue is full"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RenderJob:
+    """Everything a worker needs to lip sync and encode one video"""
+
+    __slots__ = ('job_id', 'viseme_sequence', 'audio_data', 'avatar_id', 'fragmented',
+                 'tenant', 'priority', 'fps', 'created')
+
+    def __init__(self, viseme_sequence, audio_data, avatar_id=None, fragmented=False,
+                 tenant='default', priority=PRIORITY_NORMAL, fps=Config.VIDEO_FPS, job_id=None,
+                 created=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.viseme_sequence = viseme_sequence
+        self.audio_data = audio_data
+        self.avatar_id = avatar_id
+        self.fragmented = fragmented
+        self.tenant = tenant
+        self.priority = priority
+        self.fps = fps
+        self.created = created or time.time()
+
+    def to_fields(self):
+        """Flat mapping for a Redis hash (visemes as raw VISEME_DTYPE rows)"""
+        meta = {
+            'avatar_id': self.avatar_id,
+            'fragmented': self.fragmented,
+            'tenant': self.tenant,
+            'priority': self.priority,
+            'fps': self.fps,
+            'created': self.created,
+        }
+        return {
+            'meta': json.dumps(meta),
+            'visemes': np.ascontiguousarray(self.viseme_sequence, dtype=VISEME_DTYPE).tobytes(),
+            'audio': self.audio_data,
+        }
+
+    @classmethod
+    def from_fields(cls, job_id, fields):
+        meta = json.loads(fields[b'meta'])
+        return cls(
+            np.frombuffer(fields[b'visemes'], dtype=VISEME_DTYPE), fields[b'audio'],
+            meta['avatar_id'], meta['fragmented'], meta['tenant'], meta['priority'], meta['fps'],
+            job_id=job_id, created=meta['created']
+        )
+
+class LocalRenderQueue:
+    """Fair, bounded queue in front of this process's render pool.
+
+    Up to `concurrency` jobs run at once through `render(job)`; the rest
+    wait in a FairQueue. A cancelled submitter takes its job out of the
+    queue (so it stops counting against the depth and tenant limits) or
+    cancels its running render.
+    """
+
+    backend = 'local'
+
+    def __init__(self, render, concurrency=Config.RENDER_WORKERS, max_depth=Config.RENDER_QUEUE_MAX_DEPTH,
+                 max_per_tenant=Config.RENDER_QUEUE_MAX_PER_TENANT):
+        # async render(job) -> video path or None
+        self.render = render
+        self.concurrency = max(int(concurrency), 1)
+        self.max_depth = max_depth
+        self.max_per_tenant = max_per_tenant
+
+        self.jobs = FairQueue()
+        self.running = 0
+        self.tasks = set()
+        self.job_seconds = 1.0  # Moving average, for retry_after hints
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'abandoned': 0}
+
+    def admit(self, tenant):
+        """Raise QueueBusyError when `tenant` may not queue another job"""
+        retry_after = max(1, round(len(self.jobs) * self.job_seconds / self.concurrency))
+        if len(self.jobs) >= self.max_depth:
+            self.stats['rejected'] += 1
+            raise QueueBusyError(f"Render queue full ({self.max_depth} jobs waiting)", retry_after)
+        if self.jobs.tenant_depth[tenant] >= self.max_per_tenant:
+            self.stats['rejected'] += 1
+            raise QueueBusyError(f"Too many queued renders for this client ({self.max_per_tenant})", retry_after)
+
+    async def submit(self, job):
+        """Queue a job and wait for its video path"""
+        self.admit(job.tenant)
+        future = asyncio.get_running_loop().create_future()
+        entry = (job, future)
+        self.jobs.push(entry, job.tenant, job.priority)
+        self.stats['submitted'] += 1
+        self.dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Still waiting for a slot: free its place now (a running job is cancelled by dispatch's callback)
+            if self.jobs.remove(entry, job.tenant, job.priority):
+                self.stats['abandoned'] += 1
+            raise
+
+    def dispatch(self):
+        """Start queued jobs while render slots are free"""
+        while self.running < self.concurrency:
+            entry = self.jobs.pop()
+            if entry is None:
+                return
+            (job, future), _ = entry
+            if future.done():
+                self.stats['abandoned'] += 1
+                continue
+
+            self.running += 1
+            task = asyncio.get_running_loop().create_task(self.run_job(job, future))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            future.add_done_callback(lambda f, task=task: task.cancel() if f.cancelled() else None)
+
+    async def run_job(self, job, future):
+        started = time.perf_counter()
+        try:
+            result = await self.render(job)
+        except asyncio.CancelledError:
+            self.stats['abandoned'] += 1
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.stats['completed'] += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self.running -= 1
+            self.job_seconds = 0.8 * self.job_seconds + 0.2 * (time.perf_counter() - started)
+            self.dispatch()
+
+    async def workers(self):
+        """Render capacity behind this queue"""
+        return [{
+            'worker_id': f"{socket.gethostname()}:{os.getpid()}",
+            'concurrency': self.concurrency,
+            'running': self.running,
+            'last_seen': time.time(),
+        }]
+
+    def get_stats(self):
+        return {
+            'backend': self.backend,
+            'depth': len(self.jobs),
+            'running': self.running,
+            'workers': 1,
+            'job_seconds': round(self.job_seconds, 3),
+            **self.stats,
+        }
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        while (entry := self.jobs.pop()) is not None:
+            (_, future), _ = entry
+            if not future.done():
+                future.cancel()
+
+# Atomic admission + enqueue. Returns the new depth, -1 (queue full) or
+# -2 (tenant limit). A tenant joins its priority's rotation when its list
+# becomes non-empty.
+ENQUEUE_SCRIPT = """
+local ns, tenant, priority, job_id = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local depth = tonumber(redis.call('GET', ns .. ':depth') or '0')
+if depth >= tonumber(ARGV[5]) then return -1 end
+local tenant_depth = tonumber(redis.call('HGET', ns .. ':tenant_depth', tenant) or '0')
+if tenant_depth >= tonumber(ARGV[6]) then return -2 end
+local jobs = ns .. ':jobs:' .. priority .. ':' .. tenant
+if redis.call('RPUSH', jobs, job_id) == 1 then
+    redis.call('RPUSH', ns .. ':tenants:' .. priority, tenant)
+end
+redis.call('HINCRBY', ns .. ':tenant_depth', tenant, 1)
+redis.call('RPUSH', ns .. ':wakeup', 1)
+redis.call('LTRIM', ns .. ':wakeup', -64, -1)
+return redis.call('INCR', ns .. ':depth')
+"""
+
+# Atomic fair pop: most urgent priority first, tenants in rotation
+POP_SCRIPT = """
+local ns = ARGV[1]
+for priority = 0, tonumber(ARGV[2]) do
+    local rotation = ns .. ':tenants:' .. priority
+    local tenant = redis.call('LPOP', rotation)
+    if tenant then
+        local jobs = ns .. ':jobs:' .. priority .. ':' .. tenant
+        local job_id = redis.call('LPOP', jobs)
+        if redis.call('LLEN', jobs) > 0 then
+            redis.call('RPUSH', rotation, tenant)
+        end
+        if job_id then
+            redis.call('DECR', ns .. ':depth')
+            if redis.call('HINCRBY', ns .. ':tenant_depth', tenant, -1) <= 0 then
+                redis.call('HDEL', ns .. ':tenant_depth', tenant)
+            end
+            return job_id
+        end
+    end
+end
+return false
+"""
+
+# Atomic removal of a job that is still queued (its submitter gave up).
+# Returns 1 when the job was removed, 0 when a worker already popped it.
+CANCEL_SCRIPT = """
+local ns, tenant, priority, job_id = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local jobs = ns .. ':jobs:' .. priority .. ':' .. tenant
+if redis.call('LREM', jobs, 1, job_id) == 0 then return 0 end
+if redis.call('LLEN', jobs) == 0 then
+    redis.call('LREM', ns .. ':tenants:' .. priority, 0, tenant)
+end
+redis.call('DECR', ns .. ':depth')
+if redis.call('HINCRBY', ns .. ':tenant_depth', tenant, -1) <= 0 then
+    redis.call('HDEL', ns .. ':tenant_depth', tenant)
+end
+return 1
+"""
+
+# Atomic claim of a popped job: the worker only takes it (and marks the
+# hash) while the hash still exists, so a job cancelled after the pop is
+# skipped and its hash is never recreated without a TTL. Returns the
+# hash's fields, or false.
+CLAIM_SCRIPT = """
+local job_key, worker_id = ARGV[1], ARGV[2]
+if redis.call('EXISTS', job_key) == 0 then return false end
+redis.call('HSET', job_key, 'worker', worker_id)
+return redis.call('HGETALL', job_key)
+"""
+
+def queue_key(namespace, *parts):
+    return ':'.join((namespace,) + tuple(str(part) for part in parts))
+
+class RedisRenderQueue:
+    """Render queue shared by several nodes through Redis.
+
+    Servers push jobs (visemes + audio in a hash, the id in a per-tenant,
+    per-priority list) and wait for the result; `python -m
+    backend.jobs.render_worker` processes on any machine pop them with the
+    same priority and fairness rules as LocalRenderQueue. Videos come back
+    as a path on RENDER_SHARED_PATH, or as bytes of at most
+    RENDER_RESULT_MAX_MB without one. Workers heartbeat
+    a key with a TTL: no live workers means "busy", and a job whose worker
+    stops heartbeating fails fast instead of waiting for the timeout.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, url=Config.REDIS_URL, namespace=Config.RENDER_QUEUE_NAMESPACE,
+                 max_depth=Config.RENDER_QUEUE_MAX_DEPTH, max_per_tenant=Config.RENDER_QUEUE_MAX_PER_TENANT,
+                 job_timeout=Config.RENDER_JOB_TIMEOUT, heartbeat_interval=Config.WORKER_HEARTBEAT_INTERVAL,
+                 output_path=Config.OUTPUT_PATH, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("RENDER_QUEUE_BACKEND=redis needs the redis package")
+            client = aioredis.from_url(url)
+
+        self.redis = client
+        self.namespace = namespace
+        self.max_depth = max_depth
+        self.max_per_tenant = max_per_tenant
+        self.job_timeout = job_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.output_path = output_path
+
+        self.enqueue = self.redis.register_script(ENQUEUE_SCRIPT)
+        self.cancel = self.redis.register_script(CANCEL_SCRIPT)
+        self.live_workers = 0
+        self.depth = 0  # As of this server's last enqueue
+        self.workers_checked = 0.0
+        self.job_seconds = 1.0
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'abandoned': 0}
+
+    def key(self, *parts):
+        return queue_key(self.namespace, *parts)
+
+    async def count_workers(self):
+        """Live workers, refreshed at most once per heartbeat interval"""
+        now = time.monotonic()
+        if now - self.workers_checked >= self.heartbeat_interval:
+            self.live_workers = len([key async for key in self.redis.scan_iter(match=self.key('worker', '*'))])
+            self.workers_checked = now
+        return self.live_workers
+
+    async def submit(self, job):
+        """Queue a job and wait for a worker to return its video path"""
+        workers = await self.count_workers()
+        if not workers:
+            self.stats['rejected'] += 1
+            raise QueueBusyError("No render workers available", self.heartbeat_interval)
+
+        job_key = self.key('job', job.job_id)
+        await self.redis.hset(job_key, mapping=job.to_fields())
+        await self.redis.expire(job_key, int(self.job_timeout))
+        depth = await self.enqueue(args=[self.namespace, job.tenant, job.priority, job.job_id,
+                                         self.max_depth, self.max_per_tenant])
+        if depth < 0:
+            await self.redis.delete(job_key)
+            self.stats['rejected'] += 1
+            retry_after = max(1, round(self.max_depth * self.job_seconds / workers))
+            if depth == -1:
+                raise QueueBusyError(f"Render queue full ({self.max_depth} jobs waiting)", retry_after)
+            raise QueueBusyError(f"Too many queued renders for this client ({self.max_per_tenant})", retry_after)
+
+        self.depth = depth
+        self.stats['submitted'] += 1
+        started = time.perf_counter()
+        try:
+            video_path = await self.wait_result(job)
+        except asyncio.CancelledError:
+            self.stats['abandoned'] += 1
+            await asyncio.shield(self.withdraw(job))
+            raise
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        self.stats['completed'] += 1
+        self.job_seconds = 0.8 * self.job_seconds + 0.2 * (time.perf_counter() - started)
+        return video_path
+
+    async def withdraw(self, job):
+        """Take an abandoned job out of its queue and drop its hash
+
+        A job still queued stops counting toward the depth and tenant
+        limits at once; one already popped is skipped by its worker once
+        the hash is gone.
+        """
+        await self.cancel(args=[self.namespace, job.tenant, job.priority, job.job_id])
+        await self.redis.delete(self.key('job', job.job_id))
+
+    async def wait_result(self, job):
+        job_key = self.key('job', job.job_id)
+        result_key = self.key('result', job.job_id)
+        deadline = time.monotonic() + self.job_timeout
+
+        while not await self.redis.blpop([self.key('done', job.job_id)], timeout=self.heartbeat_interval):
+            if time.monotonic() > deadline:
+                await self.withdraw(job)
+                raise TimeoutError(f"Render job {job.job_id} timed out after {self.job_timeout}s")
+            worker = await self.redis.hget(job_key, 'worker')
+            if worker and not await self.redis.exists(self.key('worker', worker.decode())):
+                await self.redis.delete(job_key)
+                raise RuntimeError(f"Render worker {worker.decode()} stopped heartbeating")
+
+        result = await self.redis.hgetall(result_key)
+        await self.redis.delete(result_key, job_key)
+        if result.get(b'status') != b'ok':
+            raise RuntimeError(f"Render job {job.job_id} failed: {result.get(b'error', b'unknown').decode()}")
+        if result.get(b'stats'):
+            record_render(json.loads(result[b'stats']))
+        video_path = os.path.join(self.output_path, f"{job.job_id}.mp4")
+        if result.get(b'path'):
+            # Rendered onto shared storage; bring it under this server's retention
+            await asyncio.to_thread(shutil.move, result[b'path'].decode(), video_path)
+            return video_path
+        if not result.get(b'video'):
+            return None
+
+        # Land the worker's bytes in a local file for the existing send path
+        await asyncio.to_thread(write_file, video_path, result[b'video'])
+        return video_path
+
+    async def workers(self):
+        """Heartbeat payloads of the live workers"""
+        workers = []
+        async for key in self.redis.scan_iter(match=self.key('worker', '*')):
+            payload = await self.redis.get(key)
+            if payload:
+                workers.append(json.loads(payload))
+        return workers
+
+    def get_stats(self):
+        return {
+            'backend': self.backend,
+            'depth': self.depth,
+            'workers': self.live_workers,
+            'job_seconds': round(self.job_seconds, 3),
+            **self.stats,
+        }
+
+    async def start(self):
+        await self.count_workers()
+
+    async def stop(self):
+        await self.redis.aclose()
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def create_render_queue(render, backend=Config.RENDER_QUEUE_BACKEND, concurrency=Config.RENDER_WORKERS):
+    """Render queue for a backend name; `render(job)` runs jobs for the local backend"""
+    if backend == 'local':
+        return LocalRenderQueue(render, concurrency)
+    if backend == 'redis':
+        return RedisRenderQueue()
+    raise ValueError(f"Unknown render queue backend: {backend}")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Render worker for the Redis render queue
+
+Pops jobs queued by any server sharing the Redis instance, lip syncs and
+encodes them, and hands the video back to the waiting server: as a path
+on RENDER_SHARED_PATH when set, else as bytes (at most RENDER_RESULT_MAX_MB).
+
+Usage: python -m backend.jobs.render_worker [--worker-id ID]
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+from ..config import Config
+from .fair_queue import PRIORITIES
+from .render_queue import CLAIM_SCRIPT, POP_SCRIPT, RenderJob, queue_key
+
+logger = logging.getLogger(__name__)
+
+class RenderWorker:
+    """Consumes render jobs and heartbeats while it is alive"""
+
+    def __init__(self, url=Config.REDIS_URL, namespace=Config.RENDER_QUEUE_NAMESPACE, worker_id=None,
+                 heartbeat_interval=Config.WORKER_HEARTBEAT_INTERVAL, heartbeat_ttl=Config.WORKER_HEARTBEAT_TTL,
+                 result_ttl=Config.RENDER_JOB_TIMEOUT, output_path=Config.OUTPUT_PATH,
+                 shared_path=Config.RENDER_SHARED_PATH, max_result_bytes=Config.RENDER_RESULT_MAX_MB * 1024 * 1024,
+                 client=None):
+        from ..avatar.avatar_registry import AvatarRegistry
+        from ..avatar.avatar_renderer import AvatarRenderer
+
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+
+        self.redis = client
+        self.namespace = namespace
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_ttl = heartbeat_ttl
+        self.result_ttl = int(result_ttl)
+
+        self.shared_path = shared_path
+        self.max_result_bytes = max_result_bytes
+
+        self.pop = self.redis.register_script(POP_SCRIPT)
+        self.claim = self.redis.register_script(CLAIM_SCRIPT)
+        self.avatars = AvatarRegistry()
+        # On shared storage the server picks the file up where it was encoded
+        self.renderer = AvatarRenderer(shared_path or output_path)
+        self.stopping = threading.Event()
+        self.current_job = None
+        self.started = time.time()
+        self.stats = {'completed': 0, 'failed': 0, 'skipped': 0}
+
+    def key(self, *parts):
+        return queue_key(self.namespace, *parts)
+
+    def heartbeat(self):
+        payload = json.dumps({
+            'worker_id': self.worker_id,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'started': self.started,
+            'current_job': self.current_job,
+            'last_seen': time.time(),
+            **self.stats,
+        })
+        self.redis.set(self.key('worker', self.worker_id), payload, ex=int(self.heartbeat_ttl))
+
+    def heartbeat_loop(self):
+        # Own thread: a long render must not look like a dead worker
+        while not self.stopping.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e}")
+
+    def run(self):
+        self.heartbeat()
+        threading.Thread(target=self.heartbeat_loop, name='heartbeat', daemon=True).start()
+        logger.info(f"Render worker {self.worker_id} waiting for jobs")
+        try:
+            while not self.stopping.is_set():
+                job_id = self.pop(args=[self.namespace, max(PRIORITIES)])
+                if job_id is None:
+                    # Woken by new jobs; the timeout also covers missed wake-ups
+                    self.redis.blpop([self.key('wakeup')], timeout=self.heartbeat_interval)
+                    continue
+                self.process(job_id.decode())
+        finally:
+            self.stopping.set()
+            self.redis.delete(self.key('worker', self.worker_id))
+
+    def process(self, job_id):
+        from ..workers.stage_executor import render_with_stats
+
+        job_key = self.key('job', job_id)
+        claimed = self.claim(args=[job_key, self.worker_id])
+        if not claimed:
+            self.stats['skipped'] += 1  # Cancelled or expired while queued
+            return
+
+        fields = dict(zip(claimed[::2], claimed[1::2]))
+        self.current_job = job_id
+        result = {'status': 'ok', 'worker': self.worker_id}
+        video_path = None
+        try:
+            job = RenderJob.from_fields(job_id, fields)
+            video_path, stats = render_with_stats(
+                self.avatars.get(job.avatar_id), self.renderer, job.viseme_sequence, job.audio_data,
+                job.fps, job.fragmented
+            )
+            if video_path and self.shared_path:
+                result['path'] = os.path.abspath(video_path)
+                video_path = None  # Now the server's to move or delete
+            elif video_path:
+                size = os.path.getsize(video_path)
+                if size > self.max_result_bytes:
+                    raise RuntimeError(f"video of {size / 1e6:.1f} MB is over RENDER_RESULT_MAX_MB; "
+                                       f"set RENDER_SHARED_PATH")
+                with open(video_path, 'rb') as f:
+                    result['video'] = f.read()
+            result['stats'] = json.dumps(stats)
+            self.stats['completed'] += 1
+        except Exception as e:
+            logger.error(f"Render job {job_id} failed: {e}")
+            result = {'status': 'error', 'error': str(e), 'worker': self.worker_id}
+            self.stats['failed'] += 1
+        finally:
+            self.current_job = None
+            if video_path and os.path.exists(video_path):
+                os.remove(video_path)
+
+        if not self.redis.exists(job_key):
+            # Withdrawn while rendering: nobody is waiting for the result
+            if result.get('path'):
+                os.remove(result['path'])
+            return
+
+        result_key = self.key('result', job_id)
+        done_key = self.key('done', job_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(result_key, mapping=result)
+            pipe.expire(result_key, self.result_ttl)
+            pipe.rpush(done_key, 1)
+            pipe.expire(done_key, self.result_ttl)
+            pipe.execute()
+
+    def stop(self):
+        self.stopping.set()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Consume render jobs from the Redis render queue")
+    parser.add_argument('--worker-id', help="name shown in heartbeats (default: host-pid-random)")
+    args = parser.parse_args()
+
+    Config.ensure_directories()
+    worker = RenderWorker(worker_id=args.worker_id)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
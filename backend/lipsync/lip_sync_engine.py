@@ -1,47 +1,71 @@
-import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFilter
+from PIL import Image, ImageDraw
 import json
 import os
 from ..config import Config
+from .mouth_atlas import MouthAtlas
+from .viseme_timeline import VisemeTimeline
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Mouth ellipse size and offset per viseme
+MOUTH_SHAPES = {
+    'viseme_silence': {'width': 30, 'height': 5, 'x_offset': 0, 'y_offset': 0},
+    'viseme_aa': {'width': 40, 'height': 15, 'x_offset': 0, 'y_offset': 0},
+    'viseme_ii': {'width': 25, 'height': 20, 'x_offset': 5, 'y_offset': -2},
+    'viseme_uu': {'width': 35, 'height': 10, 'x_offset': 0, 'y_offset': 5},
+    'viseme_e': {'width': 35, 'height': 8, 'x_offset': 0, 'y_offset': -3},
+    'viseme_o': {'width': 30, 'height': 12, 'x_offset': 0, 'y_offset': 2},
+    'viseme_k': {'width': 32, 'height': 8, 'x_offset': -2, 'y_offset': 0},
+    'viseme_g': {'width': 34, 'height': 9, 'x_offset': 1, 'y_offset': 1},
+    'viseme_ch': {'width': 28, 'height': 7, 'x_offset': 0, 'y_offset': -1},
+    'viseme_j': {'width': 30, 'height': 8, 'x_offset': 0, 'y_offset': 0},
+    'viseme_t': {'width': 25, 'height': 6, 'x_offset': 3, 'y_offset': 0},
+    'viseme_d': {'width': 27, 'height': 7, 'x_offset': -2, 'y_offset': 0},
+    'viseme_n': {'width': 26, 'height': 6, 'x_offset': 0, 'y_offset': 0},
+    'viseme_m': {'width': 28, 'height': 7, 'x_offset': 0, 'y_offset': 0},
+    'viseme_p': {'width': 30, 'height': 5, 'x_offset': 0, 'y_offset': 2},
+    'viseme_b': {'width': 32, 'height': 6, 'x_offset': 0, 'y_offset': 1},
+    'viseme_y': {'width': 28, 'height': 8, 'x_offset': -1, 'y_offset': -1},
+    'viseme_r': {'width': 25, 'height': 7, 'x_offset': 0, 'y_offset': 0},
+    'viseme_l': {'width': 24, 'height': 6, 'x_offset': 2, 'y_offset': 0},
+    'viseme_v': {'width': 30, 'height': 7, 'x_offset': -2, 'y_offset': 0},
+    'viseme_s': {'width': 22, 'height': 5, 'x_offset': 0, 'y_offset': 1},
+    'viseme_h': {'width': 28, 'height': 8, 'x_offset': 0, 'y_offset': 0}
+}
+
+def default_mouth_center(avatar):
+    """Mouth anchor of the built-in face layout, scaled to the image size"""
+    height, width = avatar.shape[:2]
+    return (width // 2, round(height * 325 / 512))
+
 class LipSyncEngine:
-    def __init__(self, avatar_path=Config.AVATAR_PATH):
+    def __init__(self, avatar_path=Config.AVATAR_PATH, mouth_center=None, atlas=None):
         self.avatar_path = avatar_path
-        self.avatar = self.load_avatar()
         
         # Define mouth regions for different visemes
-        self.mouth_shapes = {
-            'viseme_silence': {'width': 30, 'height': 5, 'x_offset': 0, 'y_offset': 0},
-            'viseme_aa': {'width': 40, 'height': 15, 'x_offset': 0, 'y_offset': 0},
-            'viseme_ii': {'width': 25, 'height': 20, 'x_offset': 5, 'y_offset': -2},
-            'viseme_uu': {'width': 35, 'height': 10, 'x_offset': 0, 'y_offset': 5},
-            'viseme_e': {'width': 35, 'height': 8, 'x_offset': 0, 'y_offset': -3},
-            'viseme_o': {'width': 30, 'height': 12, 'x_offset': 0, 'y_offset': 2},
-            'viseme_k': {'width': 32, 'height': 8, 'x_offset': -2, 'y_offset': 0},
-            'viseme_g': {'width': 34, 'height': 9, 'x_offset': 1, 'y_offset': 1},
-            'viseme_ch': {'width': 28, 'height': 7, 'x_offset': 0, 'y_offset': -1},
-            'viseme_j': {'width': 30, 'height': 8, 'x_offset': 0, 'y_offset': 0},
-            'viseme_t': {'width': 25, 'height': 6, 'x_offset': 3, 'y_offset': 0},
-            'viseme_d': {'width': 27, 'height': 7, 'x_offset': -2, 'y_offset': 0},
-            'viseme_n': {'width': 26, 'height': 6, 'x_offset': 0, 'y_offset': 0},
-            'viseme_m': {'width': 28, 'height': 7, 'x_offset': 0, 'y_offset': 0},
-            'viseme_p': {'width': 30, 'height': 5, 'x_offset': 0, 'y_offset': 2},
-            'viseme_b': {'width': 32, 'height': 6, 'x_offset': 0, 'y_offset': 1},
-            'viseme_y': {'width': 28, 'height': 8, 'x_offset': -1, 'y_offset': -1},
-            'viseme_r': {'width': 25, 'height': 7, 'x_offset': 0, 'y_offset': 0},
-            'viseme_l': {'width': 24, 'height': 6, 'x_offset': 2, 'y_offset': 0},
-            'viseme_v': {'width': 30, 'height': 7, 'x_offset': -2, 'y_offset': 0},
-            'viseme_s': {'width': 22, 'height': 5, 'x_offset': 0, 'y_offset': 1},
-            'viseme_h': {'width': 28, 'height': 8, 'x_offset': 0, 'y_offset': 0}
-        }
+        self.mouth_shapes = MOUTH_SHAPES
+        
+        if atlas is not None:
+            # Pre-built (usually memory-mapped) assets from the avatar registry
+            self.avatar = atlas.avatar
+            self.mouth_center = atlas.mouth_center
+            self.atlas = atlas
+            return
+            
+        self.avatar = self.load_avatar()
+        
+        # Define mouth region (per-avatar anchor, or the default face layout)
+        self.mouth_center = tuple(mouth_center) if mouth_center else default_mouth_center(self.avatar)
+        
+        # Render every mouth shape once; frames only paste the mouth region
+        self.atlas = MouthAtlas(self.avatar, self.mouth_shapes, self.mouth_center)
         
     def load_avatar(self):
         """Load avatar image"""
         if os.path.exists(self.avatar_path):
+            import cv2
             avatar = cv2.imread(self.avatar_path)
             if avatar is not None:
                 return cv2.cvtColor(avatar, cv2.COLOR_BGR2RGB)
@@ -72,26 +96,7 @@ class LipSyncEngine:
     def apply_lip_sync(self, viseme_sequence, fps=Config.VIDEO_FPS):
         """Apply lip sync animation based on viseme sequence"""
         try:
-            frames = []
-            
-            # Calculate total duration
-            if viseme_sequence:
-                total_duration = max(v['end'] for v in viseme_sequence)
-            else:
-                total_duration = 5  # Default 5 seconds
-                
-            num_frames = int(total_duration * fps)
-            
-            for frame_num in range(num_frames):
-                current_time = frame_num / fps
-                
-                # Find active viseme at current time
-                active_viseme = self.find_active_viseme(viseme_sequence, current_time)
-                
-                # Generate frame with current mouth shape
-                frame = self.generate_frame(active_viseme)
-                frames.append(frame)
-                
+            frames = list(self.stream_frames(viseme_sequence, fps))
             logger.info(f"Generated {len(frames)} frames for lip sync")
             return frames
             
@@ -99,54 +104,56 @@ class LipSyncEngine:
             logger.error(f"Error in lip sync: {e}")
             return []
             
+    def stream_frames(self, viseme_sequence, fps=Config.VIDEO_FPS, buffers=0):
+        """Lazily yield lip-synced frames for a viseme sequence
+        
+        With `buffers=0` every frame is a new array. Otherwise frames cycle
+        through that many preallocated buffers, so a consumer must be done
+        with a frame before `buffers` more have been yielded (a bounded
+        queue of size N is safe with N + 2 buffers). `buffers` may also be
+        a list of base-frame copies to compose into in turn, such as the
+        slots of a FrameRing whose producer acquires one per frame.
+        """
+        # Compile the sequence once; all frames are resolved in one lookup
+        timeline = VisemeTimeline(viseme_sequence)
+        
+        # Calculate total duration
+        if len(timeline):
+            total_duration = timeline.duration
+        else:
+            total_duration = 5  # Default 5 seconds
+            
+        frame_times = timeline.frame_times(fps, total_duration)
+        viseme_ids, blends = timeline.lookup(frame_times)
+        
+        if isinstance(buffers, int):
+            pool = [self.atlas.new_frame() for _ in range(buffers)]
+        else:
+            pool = list(buffers)
+            
+        for frame_num, (viseme_id, blend) in enumerate(zip(viseme_ids.tolist(), blends.tolist())):
+            out = pool[frame_num % len(pool)] if pool else None
+            
+            # Generate frame with current mouth shape
+            yield self.atlas.compose(timeline.names[viseme_id], blend, out)
+            
     def find_active_viseme(self, viseme_sequence, current_time):
-        """Find active viseme at given time"""
+        """Find active viseme at given time (linear scan, use VisemeTimeline for many lookups)"""
         for viseme in viseme_sequence:
             if viseme['start'] <= current_time <= viseme['end']:
                 return viseme
         return {'viseme': 'viseme_silence', 'blend': 0}
         
-    def generate_frame(self, viseme_info):
-        """Generate a single frame with mouth shape"""
+    def generate_frame(self, viseme_info, out=None):
+        """Generate a single frame with mouth shape
+        
+        Pass a frame previously returned by this method as `out` to reuse
+        its buffer; only the mouth region is rewritten.
+        """
         try:
-            frame = self.avatar.copy()
-            
-            # Get mouth shape parameters
             viseme_name = viseme_info['viseme']
-            mouth_params = self.mouth_shapes.get(viseme_name, self.mouth_shapes['viseme_silence'])
-            
-            # Define mouth region (assuming face is centered)
-            mouth_center = (256, 325)  # Adjust based on avatar
             blend = viseme_info.get('blend', 0)
-            
-            # Draw mouth shape
-            img = Image.fromarray(frame)
-            draw = ImageDraw.Draw(img)
-            
-            # Apply shape with blending
-            width = int(mouth_params['width'] * (1 + blend * 0.2))
-            height = int(mouth_params['height'] * (1 + blend * 0.2))
-            x_offset = mouth_params['x_offset']
-            y_offset = mouth_params['y_offset']
-            
-            x1 = mouth_center[0] - width // 2 + x_offset
-            y1 = mouth_center[1] - height // 2 + y_offset
-            x2 = mouth_center[0] + width // 2 + x_offset
-            y2 = mouth_center[1] + height // 2 + y_offset
-            
-            # Draw mouth with some gradient
-            for i in range(3):
-                alpha = 1 - i * 0.3
-                offset = i * 2
-                draw.ellipse(
-                    [x1 - offset, y1 - offset, x2 + offset, y2 + offset],
-                    fill=(int(255 * alpha), int(100 * alpha), int(100 * alpha))
-                )
-                
-            # Apply slight blur for smoothness
-            img = img.filter(ImageFilter.GaussianBlur(radius=1))
-            
-            return np.array(img)
+            return self.atlas.compose(viseme_name, blend, out)
             
         except Exception as e:
             logger.error(f"Error generating frame: {e}")
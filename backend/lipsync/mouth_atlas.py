@@ -0,0 +1,180 @@
+import json
+import os
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from ..config import Config
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+class MouthAtlas:
+    """Pre-rendered mouth patches for every viseme at a fixed set of blend levels.
+
+    The avatar is blurred once into a base frame. Each viseme/blend pair is
+    drawn and blurred once inside a small region of interest (ROI) around the
+    mouth, so composing a frame only touches the ROI pixels.
+    """
+
+    # Ellipse layers drawn per mouth shape (see render_patch)
+    LAYERS = 3
+    LAYER_SPREAD = 2
+
+    # Files written by save(); arrays are .npy so load() can memory-map them
+    META_FILE = 'meta.json'
+    ARRAY_FILES = ('avatar', 'base', 'patches')
+
+    def __init__(self, avatar, mouth_shapes, mouth_center,
+                 blend_levels=Config.LIPSYNC_BLEND_LEVELS, blur_radius=1):
+        self.avatar = avatar
+        self.mouth_shapes = mouth_shapes
+        self.mouth_center = mouth_center
+        self.blur_radius = blur_radius
+        self.levels = np.linspace(0.0, 1.0, max(int(blend_levels), 1))
+
+        # Pixels beyond this distance are untouched by the blur kernel
+        self.blur_margin = 4 * math.ceil(blur_radius) + 4
+
+        self.roi = self.compute_roi()
+        self.base_frame = np.array(
+            Image.fromarray(avatar).filter(ImageFilter.GaussianBlur(radius=blur_radius))
+        )
+        self.patches = {
+            name: np.stack([self.render_patch(params, level) for level in self.levels])
+            for name, params in mouth_shapes.items()
+        }
+
+        y1, y2, x1, x2 = self.roi
+        logger.info(
+            f"Mouth atlas built: {len(self.patches)} visemes x {len(self.levels)} blend levels, "
+            f"ROI {x2 - x1}x{y2 - y1}"
+        )
+
+    def mouth_box(self, params, blend):
+        """Bounding box of the innermost mouth ellipse"""
+        width = int(params['width'] * (1 + blend * 0.2))
+        height = int(params['height'] * (1 + blend * 0.2))
+        cx = self.mouth_center[0] + params['x_offset']
+        cy = self.mouth_center[1] + params['y_offset']
+        return (cx - width // 2, cy - height // 2, cx + width // 2, cy + height // 2)
+
+    def compute_roi(self):
+        """Smallest region containing every pixel any viseme can change"""
+        spread = (self.LAYERS - 1) * self.LAYER_SPREAD + self.blur_margin
+        boxes = [self.mouth_box(params, 1.0) for params in self.mouth_shapes.values()]
+
+        height, width = self.avatar.shape[:2]
+        x1 = max(min(b[0] for b in boxes) - spread, 0)
+        y1 = max(min(b[1] for b in boxes) - spread, 0)
+        x2 = min(max(b[2] for b in boxes) + spread + 1, width)
+        y2 = min(max(b[3] for b in boxes) + spread + 1, height)
+        return (y1, y2, x1, x2)
+
+    def render_patch(self, params, blend):
+        """Draw and blur one mouth shape, returning only the ROI pixels"""
+        y1, y2, x1, x2 = self.roi
+        height, width = self.avatar.shape[:2]
+
+        # Blur a slightly larger crop so the ROI edges match a full-frame blur
+        cy1 = max(y1 - self.blur_margin, 0)
+        cy2 = min(y2 + self.blur_margin, height)
+        cx1 = max(x1 - self.blur_margin, 0)
+        cx2 = min(x2 + self.blur_margin, width)
+
+        img = Image.fromarray(np.ascontiguousarray(self.avatar[cy1:cy2, cx1:cx2]))
+        draw = ImageDraw.Draw(img)
+
+        bx1, by1, bx2, by2 = self.mouth_box(params, blend)
+        bx1, bx2 = bx1 - cx1, bx2 - cx1
+        by1, by2 = by1 - cy1, by2 - cy1
+
+        # Draw mouth with some gradient
+        for i in range(self.LAYERS):
+            alpha = 1 - i * 0.3
+            offset = i * self.LAYER_SPREAD
+            draw.ellipse(
+                [bx1 - offset, by1 - offset, bx2 + offset, by2 + offset],
+                fill=(int(255 * alpha), int(100 * alpha), int(100 * alpha))
+            )
+
+        img = img.filter(ImageFilter.GaussianBlur(radius=self.blur_radius))
+        patch = np.array(img)
+        return patch[y1 - cy1:y2 - cy1, x1 - cx1:x2 - cx1]
+
+    def level_index(self, blend):
+        """Map a blend factor onto the nearest pre-rendered level"""
+        blend = min(max(float(blend), 0.0), 1.0)
+        return int(np.abs(self.levels - blend).argmin())
+
+    def get_patch(self, viseme_name, blend=0):
+        """Look up the pre-rendered ROI patch for a viseme"""
+        patches = self.patches.get(viseme_name)
+        if patches is None:
+            patches = self.patches['viseme_silence']
+        return patches[self.level_index(blend)]
+
+    def new_frame(self):
+        """Fresh copy of the blurred base frame"""
+        return self.base_frame.copy()
+
+    def compose(self, viseme_name, blend=0, out=None):
+        """Paste the mouth patch into `out` (a base frame copy) and return it.
+
+        `out` must have been produced by `new_frame`; only the ROI is written,
+        so the same buffer can be reused frame after frame.
+        """
+        if out is None:
+            out = self.new_frame()
+        y1, y2, x1, x2 = self.roi
+        out[y1:y2, x1:x2] = self.get_patch(viseme_name, blend)
+        return out
+
+    @property
+    def nbytes(self):
+        """Memory held by the avatar, base frame and patches"""
+        return self.avatar.nbytes + self.base_frame.nbytes + sum(p.nbytes for p in self.patches.values())
+
+    def save(self, directory):
+        """Write the atlas as .npy arrays plus a JSON sidecar"""
+        os.makedirs(directory, exist_ok=True)
+        names = list(self.patches)
+        np.save(os.path.join(directory, 'avatar.npy'), self.avatar)
+        np.save(os.path.join(directory, 'base.npy'), self.base_frame)
+        np.save(os.path.join(directory, 'patches.npy'), np.stack([self.patches[name] for name in names]))
+
+        height, width = self.avatar.shape[:2]
+        meta = {
+            'resolution': [width, height],
+            'mouth_center': list(self.mouth_center),
+            'roi': list(self.roi),
+            'levels': self.levels.tolist(),
+            'blur_radius': self.blur_radius,
+            'visemes': names,
+        }
+        with open(os.path.join(directory, self.META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, mouth_shapes, mmap_mode='r'):
+        """Rebuild an atlas written by save(), memory-mapping the arrays
+
+        Raises FileNotFoundError when the directory is incomplete.
+        """
+        with open(os.path.join(directory, cls.META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls.ARRAY_FILES
+        }
+
+        atlas = cls.__new__(cls)
+        atlas.avatar = arrays['avatar']
+        atlas.mouth_shapes = mouth_shapes
+        atlas.mouth_center = tuple(meta['mouth_center'])
+        atlas.blur_radius = meta['blur_radius']
+        atlas.levels = np.array(meta['levels'])
+        atlas.blur_margin = 4 * math.ceil(atlas.blur_radius) + 4
+        atlas.roi = tuple(meta['roi'])
+        atlas.base_frame = arrays['base']
+        atlas.patches = dict(zip(meta['visemes'], arrays['patches']))
+        return atlas
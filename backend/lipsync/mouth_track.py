@@ -0,0 +1,97 @@
+import io
+import math
+import numpy as np
+from PIL import Image
+from ..config import Config
+from .viseme_timeline import VisemeTimeline
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MouthSheet:
+    """A mouth atlas packed into one image for client-side compositing.
+
+    The blurred base frame fills the top of the sheet and every ROI patch
+    sits below it on a grid, so the client decodes one image, draws the
+    base once and then copies a single patch rectangle per frame. Patch
+    `p` is viseme `p // len(levels)` at blend level `p % len(levels)`.
+    """
+
+    def __init__(self, atlas, atlas_id):
+        self.atlas_id = atlas_id
+        self.visemes = list(atlas.patches)
+        self.levels = len(atlas.levels)
+
+        y1, y2, x1, x2 = atlas.roi
+        self.roi = (x1, y1, x2 - x1, y2 - y1)
+        self.height, self.width = atlas.base_frame.shape[:2]
+        self.columns = max(self.width // self.roi[2], 1)
+
+        self.patch_count = len(self.visemes) * self.levels
+        self.image = self.pack(atlas)
+
+    def patch_origin(self, patch):
+        """Top-left corner of a patch on the sheet"""
+        _, _, roi_width, roi_height = self.roi
+        row, column = divmod(patch, self.columns)
+        return column * roi_width, self.height + row * roi_height
+
+    def pack(self, atlas):
+        """Encode the base frame and all patches as one PNG"""
+        _, _, roi_width, roi_height = self.roi
+        rows = math.ceil(self.patch_count / self.columns)
+        sheet = np.zeros((self.height + rows * roi_height, self.width, 3), dtype=np.uint8)
+        sheet[:self.height] = atlas.base_frame
+
+        for index, name in enumerate(self.visemes):
+            for level, patch in enumerate(atlas.patches[name]):
+                x, y = self.patch_origin(index * self.levels + level)
+                sheet[y:y + roi_height, x:x + roi_width] = patch
+
+        buffer = io.BytesIO()
+        Image.fromarray(sheet).save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+    def describe(self):
+        """Layout the client needs to cut patches out of the sheet"""
+        return {
+            'atlas_id': self.atlas_id,
+            'width': self.width,
+            'height': self.height,
+            'roi': list(self.roi),
+            'columns': self.columns,
+            'levels': self.levels,
+            'visemes': self.visemes,
+            'bytes': len(self.image),
+        }
+
+def build_mouth_track(atlas, viseme_sequence, fps=Config.VIDEO_FPS):
+    """Patch index of every frame, run-length encoded as [[frame, patch], ...]
+
+    Frames are timed exactly like LipSyncEngine.stream_frames, so the
+    track matches the mouth of a video rendered from the same sequence.
+    Returns (runs, frame_count).
+    """
+    timeline = VisemeTimeline(viseme_sequence)
+    total_duration = timeline.duration if len(timeline) else 5  # Default 5 seconds
+    viseme_ids, blends = timeline.lookup(timeline.frame_times(fps, total_duration))
+
+    # Timeline ids -> atlas viseme index (unknown visemes fall back to silence)
+    atlas_names = list(atlas.patches)
+    silence = atlas_names.index(VisemeTimeline.SILENCE)
+    name_index = np.array(
+        [atlas_names.index(name) if name in atlas.patches else silence for name in timeline.names],
+        dtype=np.int32
+    )
+
+    # Nearest pre-rendered level for every blend, as MouthAtlas.level_index
+    blends = np.clip(blends, 0.0, 1.0)
+    levels = np.abs(blends[:, None] - atlas.levels[None, :]).argmin(axis=1)
+    patches = name_index[viseme_ids] * len(atlas.levels) + levels
+
+    if not len(patches):
+        return [], 0
+    changes = np.flatnonzero(np.diff(patches)) + 1
+    starts = np.concatenate(([0], changes))
+    runs = np.stack([starts, patches[starts]], axis=1)
+    return runs.tolist(), len(patches)
@@ -0,0 +1,93 @@
+import numpy as np
+from ..viseme.viseme_generator import VISEME_NAMES
+import logging
+
+logger = logging.getLogger(__name__)
+
+class VisemeTimeline:
+    """Array-backed viseme timeline compiled once per utterance.
+
+    Lookup rules:
+    - A viseme is active on the half-open interval [start, end).
+    - Overlaps: the viseme that started most recently wins and cuts off
+      any earlier one; visemes with the same start resolve to the one
+      listed last in the sequence.
+    - Gaps (and zero-length visemes) resolve to silence with blend 0.
+    """
+
+    SILENCE = 'viseme_silence'
+
+    def __init__(self, viseme_sequence):
+        if isinstance(viseme_sequence, np.ndarray):
+            self.from_array(viseme_sequence)
+        else:
+            self.from_dicts(viseme_sequence)
+
+    def from_array(self, viseme_sequence):
+        """Structured array from VisemeGenerator (ids index VISEME_NAMES)"""
+        self.names = VISEME_NAMES
+        order = np.argsort(viseme_sequence['start'], kind='stable')
+        self.starts = viseme_sequence['start'][order].astype(np.float64)
+        self.ends = viseme_sequence['end'][order].astype(np.float64)
+        self.ids = viseme_sequence['viseme'][order].astype(np.int32)
+        self.blends = viseme_sequence['blend'][order].astype(np.float32)
+
+    def from_dicts(self, viseme_sequence):
+        """Legacy list of {'viseme', 'start', 'end', 'blend'} dicts"""
+        # Viseme id 0 is always silence
+        self.names = [self.SILENCE]
+        name_ids = {self.SILENCE: 0}
+
+        count = len(viseme_sequence)
+        starts = np.empty(count, dtype=np.float64)
+        ends = np.empty(count, dtype=np.float64)
+        ids = np.empty(count, dtype=np.int32)
+        blends = np.empty(count, dtype=np.float32)
+
+        for i, viseme in enumerate(viseme_sequence):
+            name = viseme['viseme']
+            if name not in name_ids:
+                name_ids[name] = len(self.names)
+                self.names.append(name)
+            starts[i] = viseme['start']
+            ends[i] = viseme['end']
+            ids[i] = name_ids[name]
+            blends[i] = viseme.get('blend', 0)
+
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.ids = ids[order]
+        self.blends = blends[order]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def duration(self):
+        """End time of the last viseme"""
+        return float(self.ends.max()) if len(self) else 0.0
+
+    def frame_times(self, fps, duration=None):
+        """Timestamps of every frame covering the timeline"""
+        if duration is None:
+            duration = self.duration
+        return np.arange(int(duration * fps), dtype=np.float64) / fps
+
+    def lookup(self, times):
+        """Resolve an array of timestamps to (viseme ids, blends) in one pass"""
+        times = np.asarray(times, dtype=np.float64)
+        ids = np.zeros(times.shape, dtype=np.int32)
+        blends = np.zeros(times.shape, dtype=np.float32)
+        if not len(self):
+            return ids, blends
+
+        # Index of the most recently started viseme at each timestamp
+        idx = np.searchsorted(self.starts, times, side='right') - 1
+        valid = idx >= 0
+        safe_idx = np.where(valid, idx, 0)
+        active = valid & (times < self.ends[safe_idx])
+
+        ids[active] = self.ids[safe_idx[active]]
+        blends[active] = self.blends[safe_idx[active]]
+        return ids, blends
@@ -1,4 +1,6 @@
 import asyncio
+import functools
+import time
 import websockets
 import json
 import logging
@@ -6,21 +8,60 @@ from .webrtc.signaling import WebRTCSignaling
 from .stt.speech_to_text import SpeechToText
 from .tts.text_to_speech import TextToSpeech
 from .viseme.viseme_generator import VisemeGenerator
-from .lipsync.lip_sync_engine import LipSyncEngine
+from .avatar.avatar_registry import AvatarRegistry
 from .avatar.avatar_renderer import AvatarRenderer
+from .avatar.render_cache import RenderCache
+from .avatar.video_store import VideoStore
 from .config import Config
+from .jobs.fair_queue import PRIORITY_INTERACTIVE
+from .jobs.render_queue import QueueBusyError, RenderJob, create_render_queue
+from .lipsync.mouth_track import MouthSheet, build_mouth_track
+from .protocol.binary_messages import (
+    MSG_ATLAS, MSG_AUDIO, MSG_AUDIO_STREAM, MSG_SEGMENT, MSG_SPEECH, MSG_VIDEO, PROTOCOL_VERSION, ProtocolError,
+    decode_message, iter_chunks, iter_file_chunks
+)
+from .pipeline.segmented_pipeline import SegmentedPipeline
+from .prewarm import load_phrases, prewarm
+from .session import ClientSession
+from .telemetry.metrics import BYTES_SENT, REGISTRY, REQUESTS
+from .telemetry.tracing import record_render, set_request_id, setup_tracing, span
+from .workers.loop_monitor import LoopLagMonitor
+from .workers.stage_executor import StageExecutor, render_with_stats
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
 class AIAvatarSystem:
     def __init__(self):
-        self.signaling = WebRTCSignaling()
-        self.stt = SpeechToText()
-        self.tts = TextToSpeech()
+        # Worker pools for blocking stages (None runs everything on the loop)
+        self.executor = StageExecutor() if Config.EXECUTOR_ENABLED else None
+        self.loop_monitor = LoopLagMonitor()
+        
+        self.stt = SpeechToText(executor=self.executor)
+        self.tts = TextToSpeech(executor=self.executor)
         self.viseme_gen = VisemeGenerator()
-        self.lipsync = LipSyncEngine()
+        self.avatars = AvatarRegistry()
+        self.signaling = WebRTCSignaling(create_media=self.create_media)
         self.renderer = AvatarRenderer()
+        self.render_cache = RenderCache(executor=self.executor) if Config.RENDER_CACHE_ENABLED else None
+        # Every render goes through the queue (priorities, fairness, "busy" admission)
+        self.render_queue = create_render_queue(
+            self.run_render_job, concurrency=self.executor.sizes['render'] if self.executor else 1
+        )
+        # Packed mouth atlases for mouth delivery, by avatar asset key
+        self.mouth_sheets = {}
+        # Links to rendered videos (served once the HTTP server is up) and output retention
+        self.videos = VideoStore(executor=self.executor)
+        self.video_links = False
+        
+        # Liveness is the open port; readiness waits for warm-up
+        self.created = time.perf_counter()
+        self.ready = False
+        self.warmup_stats = {}
         
     async def process_audio_to_video(self, audio_data):
         """Main pipeline: Audio -> Text -> Speech -> Viseme -> LipSync -> Video"""
@@ -46,8 +87,33 @@ class AIAvatarSystem:
             logger.error(f"Error in pipeline: {e}")
             return None
             
-    async def generate_avatar_response(self, text_response):
-        """Generate avatar video from text response"""
+    async def generate_avatar_response(self, text_response, avatar_id=None, tenant='default',
+                                       priority=PRIORITY_INTERACTIVE):
+        """Generate avatar video from text response
+
+        Raises QueueBusyError when the render queue refuses the job.
+        """
+        if self.render_cache is None:
+            return await self.render_avatar_response(text_response, avatar_id, tenant, priority)
+            
+        try:
+            # Identical text + voice + avatar + encoder settings -> same video
+            key = self.render_cache.make_key(
+                self.tts.cache_key(text_response), avatar_key=await self.avatar_key(avatar_id)
+            )
+            return await self.render_cache.get_or_render(
+                key, lambda: self.render_avatar_response(text_response, avatar_id, tenant, priority)
+            )
+            
+        except QueueBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating avatar response: {e}")
+            return None
+            
+    async def render_avatar_response(self, text_response, avatar_id=None, tenant='default',
+                                     priority=PRIORITY_INTERACTIVE):
+        """Run TTS, visemes, lip sync and encode for one response"""
         try:
             # Step 3: Text to Speech with timings
             logger.info("Generating speech from text...")
@@ -60,72 +126,616 @@ class AIAvatarSystem:
             logger.info("Generating visemes...")
             viseme_sequence = self.viseme_gen.text_to_visemes(text_response, timings)
             
-            # Step 5: Apply lip sync
-            logger.info("Applying lip sync...")
-            frames = self.lipsync.apply_lip_sync(viseme_sequence)
-            
-            # Step 6: Render video
-            logger.info("Rendering final video...")
-            video_path = self.renderer.render_video(frames, audio_data)
-            
-            return video_path
+            # Step 5+6: Apply lip sync and render video
+            logger.info("Rendering lip-synced video...")
+            return await self.render_queue.submit(RenderJob(
+                viseme_sequence, audio_data, avatar_id, tenant=tenant, priority=priority
+            ))
             
+        except QueueBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error generating avatar response: {e}")
             return None
             
-    async def handle_websocket(self, websocket, path):
+    async def render_video(self, viseme_sequence, audio_data, avatar_id=None, fragmented=False):
+        """Lip sync and encode on the render pool (or inline without an executor)"""
+        if self.executor is not None and self.executor.render_pool == 'process':
+            # Workers keep their own avatar registry; only the id is sent
+            return await self.executor.render(
+                viseme_sequence, audio_data, fragmented=fragmented, avatar_id=avatar_id
+            )
+            
+        lipsync = await self.load_avatar(avatar_id)
+        if self.executor is not None:
+            return await self.executor.render(
+                viseme_sequence, audio_data, lipsync, self.renderer, fragmented=fragmented
+            )
+        video_path, stats = render_with_stats(
+            lipsync, self.renderer, viseme_sequence, audio_data, fragmented=fragmented
+        )
+        record_render(stats)
+        return video_path
+        
+    async def render_segment(self, viseme_sequence, audio_data, avatar_id=None, tenant='default',
+                             priority=PRIORITY_INTERACTIVE):
+        """Render one response segment as a fragmented mp4"""
+        return await self.render_queue.submit(RenderJob(
+            viseme_sequence, audio_data, avatar_id, fragmented=True, tenant=tenant, priority=priority
+        ))
+        
+    async def run_render_job(self, job):
+        """Render a job taken off the local render queue"""
+        return await self.render_video(job.viseme_sequence, job.audio_data, job.avatar_id, job.fragmented)
+        
+    async def avatar_key(self, avatar_id=None):
+        """Asset hash of an avatar; hashing its image on first use runs off the event loop"""
+        return await self.run_io(self.avatars.asset_key, avatar_id)
+        
+    async def load_avatar(self, avatar_id=None):
+        """Lip sync engine for an avatar, loading it off the event loop on first use"""
+        if self.executor is not None:
+            return await self.executor.run('io', self.avatars.get, avatar_id)
+        return self.avatars.get(avatar_id)
+        
+    async def create_media(self):
+        """Live avatar tracks for a new WebRTC peer"""
+        # aiortc and PyAV load with the first peer, not at server start
+        from .webrtc.peer_connection import AvatarMedia
+        return AvatarMedia(await self.load_avatar(), executor=self.executor)
+        
+    async def warm_up(self, avatar_ids=Config.WARMUP_AVATARS, phrases=()):
+        """Preload what the first requests would otherwise wait for
+
+        - avatar assets and mouth sheets in this process
+        - render worker processes (spawned, with the avatars loaded)
+        - TTS audio for common phrases
+        Failures are logged; the server then starts serving cold.
+        """
+        started = time.perf_counter()
+        stats = {'avatars': 0, 'render_workers': 0, 'phrases': 0}
+        try:
+            for avatar_id in avatar_ids:
+                lipsync = await self.load_avatar(avatar_id)
+                await self.mouth_sheet(avatar_id, lipsync.atlas)
+                stats['avatars'] += 1
+                
+            if self.executor is not None:
+                stats['render_workers'] = await self.executor.warm_up(avatar_ids)
+                
+            for phrase in phrases:
+                audio_data, _ = await self.tts.generate_with_timings(phrase)
+                if audio_data:
+                    stats['phrases'] += 1
+                    
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            stats['error'] = str(e)
+            
+        stats['warmup_seconds'] = round(time.perf_counter() - started, 3)
+        return stats
+        
+    async def start_up(self, phrases=()):
+        """Warm up once the ports are bound, then render common phrases in the background"""
+        if Config.WARMUP_ENABLED:
+            self.warmup_stats = await self.warm_up(phrases=phrases)
+        self.warmup_stats['ready_seconds'] = round(time.perf_counter() - self.created, 3)
+        self.ready = True
+        logger.info(f"Ready: {self.warmup_stats}")
+        
+        if phrases:
+            await prewarm(self, phrases)
+            
+    async def speak_webrtc(self, session, request_id, text_response, media, avatar_id=None):
+        """Play the response live on a peer's avatar tracks (no mp4 is encoded)"""
+        try:
+            audio_data, timings = await self.tts.generate_with_timings(text_response)
+            if not audio_data:
+                return
+            viseme_sequence = self.viseme_gen.text_to_visemes(text_response, timings)
+            lipsync = await self.load_avatar(avatar_id)
+            duration = await media.speak(lipsync, viseme_sequence, audio_data)
+            
+        except Exception as e:
+            logger.error(f"Error speaking over WebRTC: {e}")
+            REQUESTS.inc('webrtc', 'error')
+            return
+            
+        REQUESTS.inc('webrtc', 'ok')
+        await session.websocket.send(json.dumps({
+            'type': 'speaking',
+            'request_id': request_id,
+            'duration': duration
+        }))
+        
+    async def speak_mouth(self, session, request_id, text_response, avatar_id=None):
+        """Send audio plus a mouth track for the client to composite (no video is encoded)
+
+        The avatar's mouth atlas goes out once per session; after that a
+        response costs its audio and a few bytes per mouth shape change.
+        """
+        try:
+            audio_data, timings = await self.tts.generate_with_timings(text_response)
+            if not audio_data:
+                REQUESTS.inc('mouth', 'error')
+                return
+            viseme_sequence = self.viseme_gen.text_to_visemes(text_response, timings)
+            lipsync = await self.load_avatar(avatar_id)
+            sheet = await self.mouth_sheet(avatar_id, lipsync.atlas)
+            runs, frame_count = build_mouth_track(lipsync.atlas, viseme_sequence)
+            
+        except Exception as e:
+            logger.error(f"Error building mouth track: {e}")
+            REQUESTS.inc('mouth', 'error')
+            return
+            
+        with span('send', kind='mouth'):
+            if sheet.atlas_id not in session.mouth_sheets:
+                await self.send_payload(session, {
+                    'type': 'mouth_atlas',
+                    'request_id': request_id,
+                    **sheet.describe()
+                }, 'image', MSG_ATLAS, request_id, sheet.image)
+                session.mouth_sheets.add(sheet.atlas_id)
+                
+            await self.send_payload(session, {
+                'type': 'mouth_track',
+                'request_id': request_id,
+                'atlas_id': sheet.atlas_id,
+                'fps': Config.VIDEO_FPS,
+                'frames': frame_count,
+                'runs': runs,
+                'audio_format': self.tts.synthesizer.audio_format
+            }, 'audio', MSG_SPEECH, request_id, audio_data)
+        REQUESTS.inc('mouth', 'ok')
+        
+    async def mouth_sheet(self, avatar_id, atlas):
+        """Packed atlas image for an avatar, encoded once per asset version"""
+        key = await self.avatar_key(avatar_id)
+        sheet = self.mouth_sheets.get(key)
+        if sheet is None:
+            if self.executor is not None:
+                sheet = await self.executor.run('io', MouthSheet, atlas, key[:16])
+            else:
+                sheet = MouthSheet(atlas, key[:16])
+            self.mouth_sheets[key] = sheet
+        return sheet
+        
+    async def send_payload(self, session, header, field, msg_type, request_id, data):
+        """Send a JSON header followed by its bytes, chunked or inlined under `field`"""
+        if session.binary:
+            await session.websocket.send(json.dumps(header))
+            for chunk in iter_chunks(msg_type, request_id, data):
+                await session.websocket.send(chunk)
+                BYTES_SENT.inc('mouth', amount=len(chunk))
+            return
+            
+        # Legacy JSON clients
+        message = json.dumps({**header, field: list(data)})
+        await session.websocket.send(message)
+        BYTES_SENT.inc('json', amount=len(message))
+        
+    async def stream_avatar_response(self, session, request_id, text_response, avatar_id=None):
+        """Generate and send the avatar response one segment at a time"""
+        async def send_segment(index, count, video_path):
+            header = {
+                'type': 'segment',
+                'request_id': request_id,
+                'index': index,
+                'count': count
+            }
+            with span('send', kind='segment'):
+                if self.video_links:
+                    # The client fetches (and prefetches) segments over HTTP
+                    header['url'] = await self.videos.publish(video_path)
+                    await session.websocket.send(json.dumps(header))
+                elif session.binary:
+                    await session.websocket.send(json.dumps(header))
+                    async for chunk in iter_file_chunks(MSG_SEGMENT, request_id, video_path, self.run_io):
+                        await session.websocket.send(chunk)
+                        BYTES_SENT.inc('segment', amount=len(chunk))
+                else:
+                    header['video'] = list(await self.read_video(video_path))
+                    message = json.dumps(header)
+                    await session.websocket.send(message)
+                    BYTES_SENT.inc('json', amount=len(message))
+                
+        render = functools.partial(self.render_segment, avatar_id=avatar_id, tenant=session.tenant)
+        pipeline = SegmentedPipeline(self.tts, self.viseme_gen, render)
+        try:
+            stats = await pipeline.run(text_response, send_segment)
+        except QueueBusyError as e:
+            await self.send_busy(session, request_id, e)
+            return
+        except Exception as e:
+            logger.error(f"Error streaming avatar response: {e}")
+            stats = {'segments': 0, 'sent': 0, 'ttff_seconds': None}
+        REQUESTS.inc('stream', 'ok' if stats['sent'] else 'error')
+            
+        ttff = stats['ttff_seconds']
+        await session.websocket.send(json.dumps({
+            'type': 'segments_done',
+            'request_id': request_id,
+            'segments': stats['segments'],
+            'sent': stats['sent'],
+            'ttff_ms': round(ttff * 1000) if ttff is not None else None
+        }))
+        
+    async def read_video(self, video_path):
+        """Read a rendered video off the event loop"""
+        return await self.run_io(read_file, video_path)
+        
+    async def run_io(self, fn, *args):
+        """Run blocking file I/O on the io pool"""
+        if self.executor is not None:
+            return await self.executor.run('io', fn, *args)
+        return fn(*args)
+        
+    async def handle_websocket(self, websocket, path=None):
         """Handle WebSocket connections"""
+        session = ClientSession(websocket)
         try:
             async for message in websocket:
+                if isinstance(message, bytes):
+                    # Binary protocol: raw payloads with a small header
+                    session.binary = True
+                    await self.handle_binary_message(session, message)
+                    continue
+                    
                 data = json.loads(message)
                 
-                if data['type'] == 'audio':
-                    # Process incoming audio
-                    audio_data = bytes(data['audio'])
-                    text = await self.process_audio_to_video(audio_data)
-                    
-                    # Send recognized text to client
+                if data['type'] == 'hello':
+                    # Client announces binary protocol support
+                    session.binary = data.get('protocol') == PROTOCOL_VERSION
                     await websocket.send(json.dumps({
-                        'type': 'text',
-                        'text': text
+                        'type': 'hello',
+                        'protocol': PROTOCOL_VERSION if session.binary else 0,
+                        'session_id': session.session_id,
+                        'avatars': self.avatars.list_avatars()
                     }))
                     
+                elif data['type'] == 'audio':
+                    # Process incoming audio (legacy JSON byte array)
+                    audio_data = bytes(data['audio'])
+                    request_id = data.get('request_id') or session.next_request_id()
+                    session.start_request(request_id, 'stt', self.run_request(
+                        'stt', request_id, self.handle_audio(session, audio_data, request_id)
+                    ))
+                    
+                elif data['type'] == 'audio_chunk':
+                    # Live recording (legacy JSON byte array); text arrives as it is spoken
+                    request_id = data.get('request_id') or 0
+                    await self.feed_audio_stream(session, request_id, bytes(data.get('audio', ())),
+                                                 data.get('final', False))
+                    
                 elif data['type'] == 'llm_response':
                     # Generate avatar video from LLM response
-                    video_path = await self.generate_avatar_response(data['text'])
+                    request_id = data.get('request_id') or session.next_request_id()
+                    if data.get('supersede', Config.SUPERSEDE_RESPONSES):
+                        # Barge-in: the new response replaces any still being prepared
+                        await self.cancel_requests(session, kind='response')
+                    # Runs as a task so a later cancel or response is not stuck behind it
+                    session.start_request(request_id, 'response', self.run_request(
+                        'response', request_id, self.respond(session, request_id, data)
+                    ))
                     
-                    # Send video path or video data back
-                    if video_path:
-                        with open(video_path, 'rb') as f:
-                            video_data = f.read()
-                            
-                        await websocket.send(json.dumps({
-                            'type': 'video',
-                            'video': list(video_data),
-                            'path': video_path
-                        }))
+                elif data['type'] == 'cancel':
+                    # Stop one request (or all of them) and any live WebRTC speech
+                    await self.cancel_requests(session, data.get('request_id'))
+                    media = self.signaling.get_media(session, data.get('peer_id'))
+                    if media is not None:
+                        media.interrupt()
                         
-                elif data['type'] == 'webrtc':
-                    # Handle WebRTC signaling
-                    await self.signaling.handle_signaling(websocket, data)
+                elif data['type'] in WebRTCSignaling.MESSAGE_TYPES:
+                    # WebRTC signaling shares this loop; peers live as long as the socket
+                    await self.signaling.handle_message(session, data)
                     
         except websockets.exceptions.ConnectionClosed:
             logger.info("WebSocket connection closed")
         except Exception as e:
             logger.error(f"Error in websocket handler: {e}")
+        finally:
+            # Nobody is left to receive them: stop renders and encoders now
+            await self.cancel_requests(session, notify=False)
+            await self.signaling.close_session(session)
+            session.close()
+            
+    async def respond(self, session, request_id, data):
+        """Render and send the avatar's response to one llm_response message"""
+        set_request_id(request_id)  # Correlates the stage spans below
+        
+        # Optional avatar id; unknown ids are rejected before any work
+        avatar_id = data.get('avatar')
+        try:
+            self.avatars.resolve(avatar_id)
+        except KeyError as e:
+            await session.websocket.send(json.dumps({
+                'type': 'error',
+                'error': e.args[0],
+                'request_id': request_id
+            }))
+            return
+            
+        media = self.signaling.get_media(session, data.get('peer_id'))
+        if media is not None:
+            # Client has a live peer: play on its tracks instead of sending a file
+            await self.speak_webrtc(session, request_id, data['text'], media, avatar_id)
+            return
+            
+        if data.get('delivery', Config.RESPONSE_DELIVERY) == 'mouth':
+            # The client composites mouth patches over the avatar it already has
+            await self.speak_mouth(session, request_id, data['text'], avatar_id)
+            return
+            
+        if data.get('stream', Config.SEGMENTED_RESPONSES):
+            # Render and send sentence by sentence
+            await self.stream_avatar_response(session, request_id, data['text'], avatar_id)
+            return
+            
+        try:
+            video_path = await self.generate_avatar_response(data['text'], avatar_id, session.tenant)
+        except QueueBusyError as e:
+            await self.send_busy(session, request_id, e)
+            return
+        REQUESTS.inc('video', 'ok' if video_path else 'error')
+        
+        # Send video path or video data back
+        if video_path:
+            await self.send_video(session, request_id, video_path)
+            
+    async def run_request(self, kind, request_id, handler):
+        """Await one request's handler, logging failures instead of ending the session"""
+        try:
+            await handler
+        except asyncio.CancelledError:
+            logger.info(f"Request {request_id} cancelled")
+            REQUESTS.inc(kind, 'cancelled')
+            raise
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Error handling request {request_id}: {e}")
+            
+    async def cancel_requests(self, session, request_id=None, kind=None, notify=True):
+        """Cancel in-flight requests and wait until their stages have stopped
 
+        Cancellation reaches TTS, the render queue and the render worker,
+        which stops its frame loop and kills its encoder. Each cancelled
+        request is acknowledged with a `cancelled` message so the client
+        can drop partially received media.
+        """
+        tasks = session.cancel_requests(request_id, kind)
+        if not tasks:
+            return
+        await asyncio.wait(tasks.values())
+        if notify:
+            for cancelled_id in sorted({request_id for _, request_id in tasks}):
+                await session.websocket.send(json.dumps({'type': 'cancelled', 'request_id': cancelled_id}))
+                
+    async def handle_binary_message(self, session, message):
+        """Dispatch one binary protocol message"""
+        try:
+            msg = decode_message(message)
+            if msg.msg_type == MSG_AUDIO_STREAM:
+                # Decoded chunk by chunk instead of reassembled
+                await self.feed_audio_stream(session, msg.request_id, msg.payload, msg.final)
+                return
+            payload = session.assembler.add(msg)
+        except ProtocolError as e:
+            logger.error(f"Bad binary message: {e}")
+            await session.websocket.send(json.dumps({'type': 'error', 'error': str(e)}))
+            return
+            
+        if payload is None:
+            return  # Waiting for more chunks
+            
+        if msg.msg_type == MSG_AUDIO:
+            session.start_request(msg.request_id, 'stt', self.run_request(
+                'stt', msg.request_id, self.handle_audio(session, payload, msg.request_id)
+            ))
+        else:
+            logger.warning(f"Unexpected binary message type {msg.msg_type}")
+            
+    async def handle_audio(self, session, audio_data, request_id=None):
+        """Recognize uploaded audio and send the text back"""
+        set_request_id(request_id)
+        text = await self.process_audio_to_video(audio_data)
+        REQUESTS.inc('stt', 'ok' if text else 'error')
+        
+        # Send recognized text to client
+        response = {'type': 'text', 'text': text}
+        if request_id is not None:
+            response['request_id'] = request_id
+        await session.websocket.send(json.dumps(response))
+        
+    async def feed_audio_stream(self, session, request_id, chunk, final=False):
+        """Pass one chunk of a live recording to its transcriber, opening it on the first"""
+        transcriber = session.audio_streams.get(request_id)
+        if transcriber is None:
+            if len(session.audio_streams) >= Config.STT_MAX_STREAMS_PER_CLIENT:
+                await session.websocket.send(json.dumps({
+                    'type': 'error',
+                    'error': f"More than {Config.STT_MAX_STREAMS_PER_CLIENT} live recordings",
+                    'request_id': request_id
+                }))
+                return
+            transcriber = session.audio_streams[request_id] = self.stt.open_stream()
+            session.start_request(request_id, 'stt', self.run_request(
+                'stt', request_id, self.stream_audio(session, request_id, transcriber)
+            ))
+        if transcriber.refused:
+            # Rest of a recording cut short for arriving too fast: dropped up to its final chunk
+            if final:
+                del session.audio_streams[request_id]
+            return
+        if len(chunk) and not transcriber.feed(chunk):
+            # The decoder cannot keep up: transcribe what arrived and refuse the rest
+            transcriber.close()
+            if final:
+                del session.audio_streams[request_id]
+            await session.websocket.send(json.dumps({
+                'type': 'busy',
+                'error': "Live recording arrives faster than it can be decoded",
+                'retry_after': 1,
+                'request_id': request_id
+            }))
+            return
+        if final:
+            transcriber.close()
+            
+    async def stream_audio(self, session, request_id, transcriber):
+        """Send transcript results while the recording arrives, then the full text"""
+        set_request_id(request_id)
+        
+        async def send_result(result):
+            await session.websocket.send(json.dumps({
+                'type': 'transcript',
+                'request_id': request_id,
+                'segment': result.segment,
+                'text': result.text,
+                'final': result.final
+            }))
+            
+        try:
+            text = await transcriber.run(send_result)
+        finally:
+            transcriber.abort()
+            # A refused recording keeps its slot until its final chunk, so the rest is not a new stream
+            if session.audio_streams.get(request_id) is transcriber and not transcriber.refused:
+                del session.audio_streams[request_id]
+        REQUESTS.inc('stt', 'ok' if text else 'error')
+        
+        # Same reply as a whole upload, so clients can hand it to the LLM
+        await session.websocket.send(json.dumps({
+            'type': 'text',
+            'text': text or None,
+            'request_id': request_id
+        }))
+        
+    async def send_busy(self, session, request_id, error):
+        """Tell the client its request was refused and when to retry"""
+        logger.warning(f"Render queue busy for request {request_id}: {error}")
+        REQUESTS.inc('render', 'busy')
+        await session.websocket.send(json.dumps({
+            'type': 'busy',
+            'error': str(error),
+            'retry_after': error.retry_after,
+            'request_id': request_id
+        }))
+        
+    async def send_video(self, session, request_id, video_path):
+        """Send a rendered video in the client's protocol"""
+        with span('send', kind='video'):
+            if self.video_links:
+                # Only a link: the HTTP server streams the file with sendfile and Range support
+                await session.websocket.send(json.dumps({
+                    'type': 'video',
+                    'url': await self.videos.publish(video_path),
+                    'request_id': request_id
+                }))
+                return
+                
+            if session.binary:
+                # Chunked binary transfer straight from disk
+                async for chunk in iter_file_chunks(MSG_VIDEO, request_id, video_path, self.run_io):
+                    await session.websocket.send(chunk)
+                    BYTES_SENT.inc('video', amount=len(chunk))
+                return
+                
+            # Legacy JSON clients
+            video_data = await self.read_video(video_path)
+            
+            message = json.dumps({
+                'type': 'video',
+                'video': list(video_data),
+                'path': video_path,
+                'request_id': request_id
+            })
+            await session.websocket.send(message)
+            BYTES_SENT.inc('json', amount=len(message))
+        
+    def collect_metrics(self):
+        """Scrape-time gauges for /metrics: cache hit rates, loop lag, pools, peers"""
+        tts_stats = self.tts.cache.get_stats()
+        yield 'avatar_cache_hit_ratio', "Cache hit rate since start", {'cache': 'tts'}, tts_stats['hit_rate']
+        yield 'avatar_cache_bytes', "Bytes held per cache tier", {'cache': 'tts_memory'}, tts_stats['memory_bytes']
+        yield 'avatar_cache_bytes', "Bytes held per cache tier", {'cache': 'tts_disk'}, tts_stats['disk_bytes']
+        if self.render_cache is not None:
+            render_stats = self.render_cache.get_stats()
+            yield 'avatar_cache_hit_ratio', "Cache hit rate since start", {'cache': 'render'}, render_stats['hit_rate']
+            yield 'avatar_cache_bytes', "Bytes held per cache tier", {'cache': 'render'}, render_stats['bytes']
+            
+        lag = self.loop_monitor.stats()
+        for quantile in ('p50', 'p99', 'max'):
+            yield ('avatar_event_loop_lag_recent_ms', "Event loop lag over the recent window",
+                   {'quantile': quantile}, lag[f'{quantile}_ms'])
+            
+        if self.executor is not None:
+            for stage, pool in self.executor.stats().items():
+                yield 'avatar_executor_active', "Jobs running per worker pool", {'stage': stage}, pool['active']
+                
+        queue_stats = self.render_queue.get_stats()
+        yield 'avatar_render_queue_depth', "Render jobs waiting in the queue", {}, queue_stats['depth']
+        yield 'avatar_render_queue_workers', "Live render workers behind the queue", {}, queue_stats['workers']
+        yield 'avatar_render_queue_rejected', "Render jobs refused as busy since start", {}, queue_stats['rejected']
+        
+        peers = self.signaling.peers.counts()
+        yield 'avatar_webrtc_peers', "Open WebRTC peer connections", {}, peers['peers']
+        yield 'avatar_webrtc_clients', "WebSocket sessions with a WebRTC peer", {}, peers['clients']
+        yield 'avatar_avatars_loaded', "Avatars loaded in the server process", {}, len(self.avatars.get_stats()['loaded'])
+        yield 'avatar_ready', "1 once startup warm-up has finished", {}, int(self.ready)
+        
+        video_stats = self.videos.get_stats()
+        yield 'avatar_video_links', "Live links to rendered videos", {}, video_stats['links']
+        yield 'avatar_output_bytes', "Rendered videos kept in the output directory", {}, video_stats['bytes']
+        
 async def main():
     """Main entry point"""
+    Config.ensure_directories()
     system = AIAvatarSystem()
+    REGISTRY.add_collector(system.collect_metrics)
+    setup_tracing()
+    
+    system.loop_monitor.start()
+    system.signaling.peers.start()
+    system.videos.start()
+    await system.render_queue.start()
     
-    async with websockets.serve(
-        system.handle_websocket,
-        Config.HOST,
-        Config.PORT
-    ):
-        logger.info(f"AI Avatar System running on ws://{Config.HOST}:{Config.PORT}")
-        await asyncio.Future()  # Run forever
+    http_runner = None
+    startup = None
+    try:
+        async with websockets.serve(
+            system.handle_websocket,
+            Config.HOST,
+            Config.PORT
+        ):
+            logger.info(f"AI Avatar System running on ws://{Config.HOST}:{Config.PORT}")
+            
+            if Config.HTTP_PORT:
+                # /metrics, /healthz, /readyz and /videos next to the WebSocket server
+                from .http_server import start_http_server
+                http_runner = await start_http_server(system, Config.HTTP_HOST, Config.HTTP_PORT)
+                # Only with an origin clients can reach: the bind address rarely is one
+                system.video_links = Config.VIDEO_DELIVERY == 'url' and bool(Config.VIDEO_URL_BASE)
+                if Config.VIDEO_DELIVERY == 'url' and not Config.VIDEO_URL_BASE:
+                    logger.warning("VIDEO_URL_BASE is not set; sending videos inline instead of by link")
+                
+            # Warm up (and pre-render common phrases) now that the ports are open
+            phrases = load_phrases(Config.PREWARM_PHRASES_FILE) if Config.PREWARM_PHRASES_FILE else []
+            startup = asyncio.create_task(system.start_up(phrases))
+            
+            await asyncio.Future()  # Run forever
+    finally:
+        if startup is not None:
+            startup.cancel()
+        if http_runner is not None:
+            await http_runner.cleanup()
+        await system.render_queue.stop()
+        await system.loop_monitor.stop()
+        await system.signaling.peers.stop()
+        await system.videos.stop()
+        if system.executor is not None:
+            system.executor.shutdown(wait=False)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
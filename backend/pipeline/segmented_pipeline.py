@@ -0,0 +1,93 @@
+import asyncio
+import time
+from ..config import Config
+from .text_segmenter import split_segments
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SegmentedPipeline:
+    """Render a response segment by segment and send each one as soon as it is encoded.
+
+    TTS and viseme generation run one segment ahead of rendering, and up to
+    `lookahead` renders can be in flight while earlier segments are sent, so
+    time-to-first-frame depends on the first segment only.
+    """
+
+    def __init__(self, tts, viseme_gen, render, lookahead=Config.SEGMENT_LOOKAHEAD):
+        self.tts = tts
+        self.viseme_gen = viseme_gen
+        # async render(viseme_sequence, audio_data) -> fragmented mp4 path or None
+        self.render = render
+        self.lookahead = max(int(lookahead), 1)
+
+    async def run(self, text, send_segment):
+        """Render `text`, awaiting send_segment(index, count, video_path) in order
+
+        Returns timing stats including time-to-first-frame (`ttff_seconds`).
+        """
+        started = time.perf_counter()
+        segments = split_segments(text)
+        ready = asyncio.Queue(maxsize=self.lookahead)
+
+        async def produce():
+            try:
+                for index, segment in enumerate(segments):
+                    audio_data, timings = await self.tts.generate_with_timings(segment)
+                    task = None
+                    if audio_data:
+                        viseme_sequence = self.viseme_gen.text_to_visemes(segment, timings)
+                        task = asyncio.ensure_future(self.render(viseme_sequence, audio_data))
+                    else:
+                        logger.error(f"No speech for segment {index}")
+                    try:
+                        await ready.put((index, task))
+                    except asyncio.CancelledError:
+                        # Not handed over yet, so the consumer cannot cancel it
+                        if task is not None:
+                            task.cancel()
+                        raise
+            except Exception as e:
+                # Hand the error to the consumer instead of leaving it waiting
+                await ready.put(e)
+                return
+            await ready.put(None)
+
+        producer = asyncio.create_task(produce())
+        first_sent = None
+        sent = 0
+
+        try:
+            while True:
+                item = await ready.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                index, task = item
+                video_path = await task if task is not None else None
+                if video_path is None:
+                    continue
+
+                await send_segment(index, len(segments), video_path)
+                sent += 1
+                if first_sent is None:
+                    first_sent = time.perf_counter()
+                    logger.info(f"First segment sent after {first_sent - started:.2f}s")
+
+        finally:
+            producer.cancel()
+            while not ready.empty():
+                item = ready.get_nowait()
+                if isinstance(item, tuple) and item[1] is not None:
+                    item[1].cancel()
+
+        total = time.perf_counter() - started
+        stats = {
+            'segments': len(segments),
+            'sent': sent,
+            'ttff_seconds': (first_sent - started) if first_sent is not None else None,
+            'total_seconds': total,
+        }
+        logger.info(f"Segmented response: {sent}/{len(segments)} segments in {total:.2f}s")
+        return stats
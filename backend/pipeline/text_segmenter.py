@@ -0,0 +1,64 @@
+import re
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sentence enders for English and Hindi (danda / double danda)
+SENTENCE_END = re.compile(r'(?<=[.!?।॥])\s+')
+# Clause boundaries used to break up long sentences
+CLAUSE_END = re.compile(r'(?<=[,;:—])\s+')
+
+def split_segments(text, max_chars=Config.SEGMENT_MAX_CHARS, min_chars=Config.SEGMENT_MIN_CHARS):
+    """Split a response into speakable segments for incremental rendering
+
+    Text is split into sentences; sentences longer than `max_chars` are
+    split at clause boundaries, then at word boundaries. Segments shorter
+    than `min_chars` are merged into the following one so each render has
+    enough speech to be worth a separate encode.
+    """
+    pieces = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in CLAUSE_END.split(sentence):
+            pieces.extend(split_words(clause.strip(), max_chars))
+
+    segments = []
+    carry = ''
+    for piece in pieces:
+        if carry and len(carry) + 1 + len(piece) > max_chars:
+            segments.append(carry)
+            carry = ''
+        piece = f"{carry} {piece}" if carry else piece
+        if len(piece) < min_chars:
+            carry = piece
+            continue
+        segments.append(piece)
+        carry = ''
+
+    if carry:
+        if segments and len(segments[-1]) + len(carry) < max_chars:
+            segments[-1] = f"{segments[-1]} {carry}"
+        else:
+            segments.append(carry)
+    return segments
+
+def split_words(text, max_chars):
+    """Split at word boundaries into chunks of at most `max_chars`"""
+    chunks = []
+    current = []
+    length = 0
+    for word in text.split():
+        if current and length + 1 + len(word) > max_chars:
+            chunks.append(' '.join(current))
+            current, length = [], 0
+        current.append(word)
+        length += len(word) + (1 if length else 0)
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Pre-render common phrases into the render cache
+
+Usage: python -m backend.prewarm phrases.txt
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from .jobs.fair_queue import PRIORITY_BACKGROUND
+from .jobs.render_queue import QueueBusyError
+
+logger = logging.getLogger(__name__)
+
+def load_phrases(path):
+    """One phrase per line; blank lines and '#' comments are skipped"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+async def prewarm(system, phrases):
+    """Render each phrase once so later requests are cache hits"""
+    started = time.perf_counter()
+    rendered = 0
+    for phrase in phrases:
+        while True:
+            try:
+                video_path = await system.generate_avatar_response(
+                    phrase, tenant='prewarm', priority=PRIORITY_BACKGROUND
+                )
+                break
+            except QueueBusyError as e:
+                # Live traffic first; try again once the queue drains
+                await asyncio.sleep(e.retry_after)
+        if video_path:
+            rendered += 1
+        else:
+            logger.error(f"Pre-warm failed for phrase: {phrase[:50]}")
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Pre-warmed {rendered}/{len(phrases)} phrases in {elapsed:.1f}s")
+    if system.render_cache is not None:
+        logger.info(f"Render cache: {system.render_cache.get_stats()}")
+    return rendered
+
+async def run(path):
+    from .main import AIAvatarSystem
+
+    system = AIAvatarSystem()
+    try:
+        await prewarm(system, load_phrases(path))
+    finally:
+        await system.render_queue.stop()
+        if system.executor is not None:
+            system.executor.shutdown()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Render a phrase list into the render cache")
+    parser.add_argument('phrases', help="text file with one phrase per line")
+    args = parser.parse_args()
+    asyncio.run(run(args.phrases))
@@ -0,0 +1,171 @@
+import os
+import struct
+import time
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Binary message layout (network byte order), followed by the raw payload:
+#   magic        2s  b'AV'
+#   version      B   PROTOCOL_VERSION
+#   type         B   one of the MSG_* constants
+#   flags        B   FLAG_* bits
+#   reserved     B   0
+#   request_id   I   id shared by every chunk of one transfer
+#   chunk_index  I   0-based position of this chunk
+#   total_size   I   payload bytes across all chunks (0 if unknown)
+HEADER = struct.Struct('!2sBBBBIII')
+MAGIC = b'AV'
+PROTOCOL_VERSION = 1
+
+# Message types
+MSG_AUDIO = 1  # client -> server: recorded audio (webm)
+MSG_VIDEO = 2  # server -> client: rendered video (mp4)
+MSG_SEGMENT = 3  # server -> client: one fragmented mp4 segment of a streamed response
+MSG_ATLAS = 4  # server -> client: avatar mouth atlas sheet (png), sent once per session
+MSG_SPEECH = 5  # server -> client: response audio for a mouth track
+MSG_AUDIO_STREAM = 6  # client -> server: live recording chunk, decoded as it arrives (FLAG_FINAL ends it)
+
+# Flags
+FLAG_FINAL = 0x01  # last chunk of a transfer
+
+class ProtocolError(ValueError):
+    """Raised for malformed binary messages"""
+
+class BinaryMessage:
+    __slots__ = ('msg_type', 'flags', 'request_id', 'chunk_index', 'total_size', 'payload')
+
+    def __init__(self, msg_type, request_id, payload, chunk_index=0, total_size=0, flags=FLAG_FINAL):
+        self.msg_type = msg_type
+        self.flags = flags
+        self.request_id = request_id
+        self.chunk_index = chunk_index
+        self.total_size = total_size
+        self.payload = payload
+
+    @property
+    def final(self):
+        return bool(self.flags & FLAG_FINAL)
+
+def encode_message(msg_type, request_id, payload, chunk_index=0, total_size=0, flags=FLAG_FINAL):
+    """Build one binary message"""
+    header = HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, flags, 0,
+                         request_id, chunk_index, total_size)
+    return header + payload
+
+def decode_message(data):
+    """Parse one binary message; the payload is a zero-copy memoryview"""
+    if len(data) < HEADER.size:
+        raise ProtocolError(f"Message shorter than header ({len(data)} bytes)")
+    magic, version, msg_type, flags, _, request_id, chunk_index, total_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ProtocolError("Bad magic")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    payload = memoryview(data)[HEADER.size:]
+    return BinaryMessage(msg_type, request_id, payload, chunk_index, total_size, flags)
+
+async def iter_file_chunks(msg_type, request_id, path, run_io, chunk_size=Config.WS_CHUNK_SIZE):
+    """Yield a file as a sequence of binary messages without loading it whole
+
+    The open and every read go through `run_io(fn, *args)` (an awaitable
+    running blocking calls off the event loop).
+    """
+    f = await run_io(open, path, 'rb')
+    try:
+        total_size = os.fstat(f.fileno()).st_size
+        chunk_index = 0
+        sent = 0
+        while True:
+            chunk = await run_io(f.read, chunk_size)
+            sent += len(chunk)
+            final = sent >= total_size or not chunk
+            yield encode_message(msg_type, request_id, chunk, chunk_index, total_size,
+                                 FLAG_FINAL if final else 0)
+            if final:
+                return
+            chunk_index += 1
+    finally:
+        f.close()
+
+def iter_chunks(msg_type, request_id, data, chunk_size=Config.WS_CHUNK_SIZE):
+    """Yield in-memory bytes as a sequence of binary messages"""
+    view = memoryview(data)
+    total_size = len(view)
+    for chunk_index, offset in enumerate(range(0, max(total_size, 1), chunk_size)):
+        final = offset + chunk_size >= total_size
+        yield encode_message(msg_type, request_id, view[offset:offset + chunk_size], chunk_index,
+                             total_size, FLAG_FINAL if final else 0)
+
+class ChunkAssembler:
+    """Reassemble chunked uploads keyed by (type, request id)
+
+    Bounded per session: each transfer to `max_size` bytes, at most
+    `max_pending` transfers open at once holding `max_pending_bytes`
+    together, and a transfer that gets no chunk for `timeout` seconds is
+    dropped.
+    """
+
+    def __init__(self, max_size=Config.WS_MAX_UPLOAD_SIZE, max_pending=Config.WS_MAX_PENDING_UPLOADS,
+                 max_pending_bytes=Config.WS_MAX_PENDING_BYTES, timeout=Config.WS_UPLOAD_TIMEOUT):
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self.timeout = timeout
+        # (type, request id) -> [buffer, next chunk index, last chunk time]
+        self.pending = {}
+        self.buffered = 0
+
+    def add(self, message):
+        """Add a chunk; returns the complete payload on the final chunk, else None"""
+        key = (message.msg_type, message.request_id)
+        now = time.monotonic()
+        self.expire(now)
+        entry = self.pending.get(key)
+
+        if entry is None:
+            if message.chunk_index != 0:
+                raise ProtocolError(f"Transfer {message.request_id} does not start at chunk 0")
+            if message.final and len(message.payload) <= self.max_size:
+                return bytes(message.payload)
+            if len(self.pending) >= self.max_pending:
+                raise ProtocolError(f"Too many uploads in progress ({self.max_pending})")
+            entry = self.pending[key] = [bytearray(), 0, now]
+
+        buffer, expected_index, _ = entry
+        if message.chunk_index != expected_index:
+            self.drop(key)
+            raise ProtocolError(
+                f"Transfer {message.request_id}: expected chunk {expected_index}, got {message.chunk_index}"
+            )
+        if len(buffer) + len(message.payload) > self.max_size:
+            self.drop(key)
+            raise ProtocolError(f"Transfer {message.request_id} exceeds {self.max_size} bytes")
+        if self.buffered + len(message.payload) > self.max_pending_bytes:
+            self.drop(key)
+            raise ProtocolError(f"Uploads in progress exceed {self.max_pending_bytes} bytes")
+
+        buffer += message.payload
+        self.buffered += len(message.payload)
+        entry[1] = expected_index + 1
+        entry[2] = now
+        if message.final:
+            self.drop(key)
+            return bytes(buffer)
+        return None
+
+    def expire(self, now):
+        """Drop transfers that stalled for longer than `timeout`"""
+        for key in [key for key, entry in self.pending.items() if now - entry[2] > self.timeout]:
+            logger.warning(f"Dropping stalled upload {key[1]} after {self.timeout}s")
+            self.drop(key)
+
+    def drop(self, key):
+        entry = self.pending.pop(key, None)
+        if entry is not None:
+            self.buffered -= len(entry[0])
+
+    def clear(self):
+        self.pending.clear()
+        self.buffered = 0
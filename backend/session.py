@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+import uuid
+from .config import Config
+from .protocol.binary_messages import ChunkAssembler
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Server-assigned request ids have the high bit set; client counters stay below it
+SERVER_REQUEST_ID_BASE = 0x80000000
+
+def connection_tenant(websocket, header=Config.TENANT_HEADER):
+    """Render queue fairness key for a connection, or None when unknown
+
+    Decided by the server, never by the client: the value of `header`
+    when a trusted proxy or auth gateway sets it (the last entry, for
+    appended lists like X-Forwarded-For), else the peer's address.
+    """
+    request = getattr(websocket, 'request', None)
+    if header and request is not None:
+        value = request.headers.get(header)
+        if value and value.split(',')[-1].strip():
+            return value.split(',')[-1].strip()
+    address = getattr(websocket, 'remote_address', None)
+    return str(address[0]) if address else None
+
+class ClientSession:
+    """Per-WebSocket connection state"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.session_id = str(uuid.uuid4())
+        # Render queue fairness key: every connection from one client shares its limits
+        self.tenant = connection_tenant(websocket) or self.session_id
+        # Switched on once the client sends a binary message or a hello
+        self.binary = False
+        self.assembler = ChunkAssembler()
+        self._request_ids = itertools.count(1)
+        # (kind, request_id) -> task for requests still in flight
+        self.requests = {}
+        # Mouth atlas sheets this client already holds (mouth delivery)
+        self.mouth_sheets = set()
+        # request_id -> StreamingTranscriber for live recordings
+        self.audio_streams = {}
+
+    def next_request_id(self):
+        """Server-assigned id for requests that did not carry one
+
+        Kept out of the range clients number their own requests in, so a
+        `cancelled` notice for one never matches a client's request.
+        """
+        return SERVER_REQUEST_ID_BASE | (next(self._request_ids) & 0x7FFFFFFF)
+
+    def start_request(self, request_id, kind, coro):
+        """Run a request as a task, replacing one of the same kind still running under the same id"""
+        self.cancel_requests(request_id, kind)
+        task = asyncio.get_running_loop().create_task(coro)
+        self.requests[(kind, request_id)] = task
+        task.add_done_callback(lambda _: self.forget_request(kind, request_id, task))
+        return task
+
+    def forget_request(self, kind, request_id, task):
+        if self.requests.get((kind, request_id)) is task:
+            del self.requests[(kind, request_id)]
+
+    def cancel_requests(self, request_id=None, kind=None):
+        """Cancel in-flight requests matching an id and/or kind (all by default)
+
+        Returns {(kind, request_id): task} of the requests cancelled.
+        """
+        cancelled = {}
+        for (rkind, rid), task in list(self.requests.items()):
+            if request_id is not None and rid != request_id:
+                continue
+            if kind is not None and rkind != kind:
+                continue
+            if not task.done():
+                task.cancel()
+                cancelled[(rkind, rid)] = task
+        return cancelled
+
+    def close(self):
+        self.assembler.clear()
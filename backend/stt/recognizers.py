@@ -0,0 +1,64 @@
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GoogleRecognizer:
+    """Google Web Speech API via speech_recognition (network)"""
+
+    name = 'google'
+
+    def __init__(self):
+        self._recognizer = None
+
+    @property
+    def recognizer(self):
+        """speech_recognition is imported on first use, not at server start"""
+        if self._recognizer is None:
+            import speech_recognition as sr
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+
+    def recognize(self, pcm, sample_rate, language):
+        """Blocking recognition of int16 mono PCM; None when nothing was understood"""
+        import speech_recognition as sr
+
+        # Raw samples go straight in; no WAV container round trip
+        audio = sr.AudioData(pcm.tobytes(), sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio, language=language)
+        except sr.UnknownValueError:
+            logger.info("Could not understand audio")
+            return None
+        except sr.RequestError as e:
+            logger.error(f"Speech recognition error: {e}")
+            return None
+
+class OfflineRecognizer:
+    """Deterministic local stand-in for tests and benchmarks
+
+    Returns `transcript` for every segment, or a placeholder naming the
+    segment length when none is given.
+    """
+
+    name = 'offline'
+
+    def __init__(self, transcript=Config.STT_OFFLINE_TRANSCRIPT):
+        self.transcript = transcript
+
+    def recognize(self, pcm, sample_rate, language):
+        if self.transcript:
+            return self.transcript
+        return f"[speech {len(pcm) / sample_rate:.1f}s]"
+
+RECOGNIZERS = {
+    GoogleRecognizer.name: GoogleRecognizer,
+    OfflineRecognizer.name: OfflineRecognizer,
+}
+
+def create_recognizer(name=Config.STT_BACKEND):
+    """Instantiate a recognizer by name"""
+    try:
+        return RECOGNIZERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown STT backend: {name}")
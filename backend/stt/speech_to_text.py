@@ -1,50 +1,111 @@
-import speech_recognition as sr
 import asyncio
-import io
-from pydub import AudioSegment
+from ..config import Config
+from ..telemetry.tracing import span
+from .recognizers import create_recognizer
+from .streaming import StreamingTranscriber, VoiceActivityDetector, decode_audio, speech_segments
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SpeechToText:
-    def __init__(self, language='hi-IN'):
-        self.recognizer = sr.Recognizer()
+    def __init__(self, language='hi-IN', executor=None, recognizer=None, sample_rate=Config.STT_SAMPLE_RATE,
+                 upload_vad=Config.STT_UPLOAD_VAD):
         self.language = language
+        self.executor = executor  # StageExecutor; None runs inline
+        self.recognizer = recognizer or create_recognizer()
+        self.sample_rate = sample_rate
+        self.upload_vad = upload_vad
         
     async def convert_audio_to_text(self, audio_data):
         """Convert audio bytes to text"""
+        with span('stt'):
+            if self.executor is not None:
+                return await self.executor.run('stt', self.transcribe, audio_data)
+            return self.transcribe(audio_data)
+        
+    def transcribe(self, audio_data):
+        """Blocking decode + recognition of a complete recording
+        
+        The recording is decoded straight to PCM once and recognized as a
+        whole. With `upload_vad` only the speech segments found by the VAD
+        are sent, which also drops speech quieter than its threshold.
+        """
         try:
-            # Convert audio bytes to AudioSegment
-            audio_segment = AudioSegment.from_file(io.BytesIO(audio_data), format="webm")
-            
-            # Convert to WAV for speech recognition
-            wav_io = io.BytesIO()
-            audio_segment.export(wav_io, format="wav")
-            wav_io.seek(0)
-            
-            # Use speech recognition
-            with sr.AudioFile(wav_io) as source:
-                audio = self.recognizer.record(source)
+            pcm = decode_audio(audio_data, self.sample_rate)
+            if self.upload_vad:
+                segments = speech_segments(pcm, VoiceActivityDetector(self.sample_rate))
+            else:
+                segments = [(0, len(pcm))] if len(pcm) else []
+            texts = []
+            for start, end in segments:
+                text = self.recognizer.recognize(pcm[start:end], self.sample_rate, self.language)
+                if text:
+                    texts.append(text)
+                    
+            if not texts:
+                logger.error("Could not understand audio")
+                return None
                 
-            # Recognize speech
-            text = self.recognizer.recognize_google(audio, language=self.language)
+            text = ' '.join(texts)
             logger.info(f"Recognized text: {text}")
-            
             return text
             
-        except sr.UnknownValueError:
-            logger.error("Could not understand audio")
-            return None
-        except sr.RequestError as e:
-            logger.error(f"Speech recognition error: {e}")
-            return None
         except Exception as e:
             logger.error(f"Error in speech to text: {e}")
             return None
             
+    async def recognize_pcm(self, pcm):
+        """Recognize one speech segment of int16 PCM"""
+        with span('stt', samples=len(pcm)):
+            try:
+                if self.executor is not None:
+                    return await self.executor.run(
+                        'stt', self.recognizer.recognize, pcm, self.sample_rate, self.language
+                    )
+                return self.recognizer.recognize(pcm, self.sample_rate, self.language)
+            except Exception as e:
+                logger.error(f"Error in speech to text: {e}")
+                return None
+                
+    def open_stream(self, partial_interval=Config.STT_PARTIAL_INTERVAL):
+        """StreamingTranscriber for a live recording; feed() it chunks, then close()"""
+        return StreamingTranscriber(self.recognize_pcm, self.sample_rate, partial_interval=partial_interval)
+        
     async def process_audio_stream(self, audio_generator):
-        """Process continuous audio stream"""
-        async for audio_chunk in audio_generator:
-            text = await self.convert_audio_to_text(audio_chunk)
-            if text:
-                yield text
\ No newline at end of file
+        """Process continuous audio stream, yielding each utterance's text as it ends"""
+        transcriber = self.open_stream(partial_interval=0)
+        texts = asyncio.Queue()
+        
+        async def on_result(result):
+            if result.text:
+                await texts.put(result.text)
+                
+        async def pump():
+            try:
+                async for audio_chunk in audio_generator:
+                    # The decoder is behind: hold the source back instead of buffering
+                    while not transcriber.feed(audio_chunk):
+                        await asyncio.sleep(0.05)
+            finally:
+                transcriber.close()
+                
+        def runner_done(task):
+            # Retrieved here so asyncio does not log it as never retrieved; re-raised below
+            if not task.cancelled():
+                task.exception()
+            texts.put_nowait(None)
+            
+        feeder = asyncio.ensure_future(pump())
+        runner = asyncio.ensure_future(transcriber.run(on_result))
+        runner.add_done_callback(runner_done)
+        try:
+            while True:
+                text = await texts.get()
+                if text is None:
+                    break
+                yield text
+            if not runner.cancelled() and runner.exception() is not None:
+                raise runner.exception()
+        finally:
+            feeder.cancel()
+            runner.cancel()
@@ -0,0 +1,326 @@
+import asyncio
+import collections
+import queue
+import subprocess
+import threading
+import numpy as np
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One recognized utterance (final) or an interim guess for the one in progress
+TranscriptResult = collections.namedtuple('TranscriptResult', 'segment text final start end')
+
+def decode_command(sample_rate, live=True):
+    """ffmpeg reading any container on stdin, writing int16 mono PCM to stdout"""
+    cmd = [Config.FFMPEG_BINARY, '-loglevel', 'error']
+    if live:
+        # Start decoding after the first few KB instead of probing seconds of input
+        # (complete files are probed normally: the short probe can drop their tail)
+        cmd += ['-fflags', 'nobuffer', '-probesize', '4096', '-analyzeduration', '0']
+    return cmd + ['-i', 'pipe:0', '-vn', '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1']
+
+def decode_audio(audio_data, sample_rate=Config.STT_SAMPLE_RATE):
+    """Decode a complete recording to int16 mono PCM in one ffmpeg call"""
+    result = subprocess.run(decode_command(sample_rate, live=False), input=audio_data,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode audio: {result.stderr.decode(errors='replace')[-500:]}")
+    return np.frombuffer(result.stdout[:len(result.stdout) // 2 * 2], dtype=np.int16)
+
+class PCMRingBuffer:
+    """Fixed-size int16 ring addressed by absolute sample index"""
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.total = 0  # Samples ever written
+
+    @property
+    def oldest(self):
+        """First absolute index still held"""
+        return max(self.total - self.capacity, 0)
+
+    def write(self, samples):
+        count = len(samples)
+        if count > self.capacity:
+            self.total += count - self.capacity
+            samples = samples[-self.capacity:]
+            count = self.capacity
+        start = self.total % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:count - first] = samples[first:]
+        self.total += count
+
+    def read(self, start, end):
+        """Copy of samples [start, end), clipped to what is still held"""
+        start = max(start, self.oldest)
+        end = min(end, self.total)
+        if end <= start:
+            return np.empty(0, dtype=np.int16)
+        return self.buffer[np.arange(start, end) % self.capacity]
+
+class VoiceActivityDetector:
+    """Energy-based voice activity detection that cuts PCM into utterances
+
+    Frame levels (dBFS) are computed for a whole chunk at once and compared
+    with an adaptive noise floor. A small state machine then applies the
+    minimum speech length, the end-of-utterance silence, padding and a
+    maximum utterance length. Positions are absolute sample indices.
+    """
+
+    def __init__(self, sample_rate=Config.STT_SAMPLE_RATE, frame_ms=Config.STT_VAD_FRAME_MS,
+                 threshold_db=Config.STT_VAD_THRESHOLD_DB, margin_db=Config.STT_VAD_MARGIN_DB,
+                 min_speech_ms=Config.STT_MIN_SPEECH_MS, end_silence_ms=Config.STT_END_SILENCE_MS,
+                 pad_ms=Config.STT_SPEECH_PAD_MS, max_segment_seconds=Config.STT_MAX_SEGMENT_SECONDS):
+        self.frame = sample_rate * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.min_speech_frames = max(min_speech_ms // frame_ms, 1)
+        self.end_silence_frames = max(end_silence_ms // frame_ms, 1)
+        self.pad = sample_rate * pad_ms // 1000
+        self.max_segment = int(sample_rate * max_segment_seconds)
+
+        self.noise_db = threshold_db
+        self.pending = np.empty(0, dtype=np.int16)
+        self.position = 0  # Absolute index of pending[0]
+
+        self.in_speech = False
+        self.speech_start = 0
+        self.candidate_start = 0
+        self.voiced_run = 0
+        self.silence_run = 0
+        self.last_voiced_end = 0
+
+    def frame_levels(self, frames):
+        """dBFS of each row of an (n, frame) int16 array"""
+        samples = frames.astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        return 20 * np.log10(rms + 1e-9)
+
+    def classify(self, levels):
+        """Voiced flags per frame; quiet frames pull the noise floor toward them"""
+        voiced = levels > max(self.threshold_db, self.noise_db + self.margin_db)
+        quiet = levels[~voiced]
+        if len(quiet):
+            self.noise_db += 0.1 * (float(np.median(quiet)) - self.noise_db)
+        return voiced
+
+    def process(self, samples):
+        """Feed PCM; returns [(start, end), ...] of utterances completed by it"""
+        samples = np.concatenate((self.pending, samples)) if len(self.pending) else samples
+        count = len(samples) // self.frame
+        base = self.position
+        self.pending = samples[count * self.frame:]
+        self.position += count * self.frame
+        if not count:
+            return []
+
+        voiced = self.classify(self.frame_levels(samples[:count * self.frame].reshape(count, self.frame)))
+        segments = []
+        for index, is_voiced in enumerate(voiced.tolist()):
+            frame_start = base + index * self.frame
+            frame_end = frame_start + self.frame
+            if is_voiced:
+                self.silence_run = 0
+                self.last_voiced_end = frame_end
+                if not self.in_speech:
+                    if not self.voiced_run:
+                        self.candidate_start = frame_start
+                    self.voiced_run += 1
+                    if self.voiced_run >= self.min_speech_frames:
+                        self.in_speech = True
+                        self.speech_start = max(self.candidate_start - self.pad, 0)
+            else:
+                self.voiced_run = 0
+                self.silence_run += 1
+                if self.in_speech and self.silence_run >= self.end_silence_frames:
+                    segments.append((self.speech_start, self.last_voiced_end + self.pad))
+                    self.in_speech = False
+
+            if self.in_speech and frame_end - self.speech_start >= self.max_segment:
+                # Long monologue: cut here and carry on with a new utterance
+                segments.append((self.speech_start, frame_end))
+                self.speech_start = frame_end
+        return segments
+
+    def flush(self):
+        """End of input: close the utterance in progress, if any"""
+        if not self.in_speech:
+            return []
+        self.in_speech = False
+        return [(self.speech_start, min(self.last_voiced_end + self.pad, self.position))]
+
+def speech_segments(pcm, vad=None):
+    """Utterances in a complete recording as [(start, end), ...] sample ranges"""
+    vad = vad or VoiceActivityDetector()
+    return vad.process(pcm) + vad.flush()
+
+class StreamingTranscriber:
+    """Incremental speech-to-text for one recording stream
+
+    Pushed webm/Opus bytes are decoded once by a long-lived ffmpeg into a
+    PCM ring buffer. The VAD drops silence, and each finished utterance is
+    recognized once and reported as final. With `partial_interval` set,
+    the utterance in progress is also re-recognized after every that many
+    seconds of new audio and reported as a partial result.
+
+    At most `max_buffered` encoded bytes wait for the decoder; feed()
+    refuses more, so a client sending faster than decoding keeps up
+    cannot grow memory without limit.
+    """
+
+    def __init__(self, recognize, sample_rate=Config.STT_SAMPLE_RATE,
+                 buffer_seconds=Config.STT_BUFFER_SECONDS, partial_interval=Config.STT_PARTIAL_INTERVAL,
+                 vad=None, max_buffered=Config.STT_STREAM_MAX_BUFFER_KB * 1024):
+        self.recognize = recognize  # async fn(int16 pcm) -> text or None
+        self.sample_rate = sample_rate
+        self.partial_samples = int(partial_interval * sample_rate)
+        self.vad = vad or VoiceActivityDetector(sample_rate)
+        self.ring = PCMRingBuffer(int(buffer_seconds * sample_rate))
+
+        self.input = queue.Queue()
+        self.max_buffered = max_buffered
+        self.buffered = 0  # Bytes fed but not yet written to the decoder
+        self.buffer_lock = threading.Lock()
+        self.closed = False
+        self.refused = False  # feed() turned data away
+        self.decoder = None
+        self.segment = 0
+        self.partial_from = None
+        self.partial_at = 0
+        self.stats = {'audio_seconds': 0.0, 'speech_seconds': 0.0, 'upstream_seconds': 0.0,
+                      'segments': 0, 'partials': 0}
+
+    def feed(self, data):
+        """Queue encoded bytes for the decoder (non-blocking)
+
+        Returns False, queuing nothing, while `max_buffered` bytes are
+        already waiting. Data fed after close() is ignored.
+        """
+        if self.closed:
+            return True
+        with self.buffer_lock:
+            if self.buffered + len(data) > self.max_buffered:
+                self.refused = True
+                return False
+            self.buffered += len(data)
+        self.input.put(bytes(data))
+        return True
+
+    def close(self):
+        """No more input; run() finishes once the decoder has drained"""
+        self.closed = True
+        self.input.put(None)
+
+    def abort(self):
+        """Stop the decoder immediately"""
+        self.closed = True
+        if self.decoder is not None and self.decoder.poll() is None:
+            self.decoder.kill()
+        self.input.put(None)
+
+    def start(self, pcm_queue, loop):
+        self.decoder = subprocess.Popen(
+            decode_command(self.sample_rate), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+        def write():
+            try:
+                while True:
+                    data = self.input.get()
+                    if data is None:
+                        break
+                    self.decoder.stdin.write(data)
+                    self.decoder.stdin.flush()
+                    with self.buffer_lock:
+                        self.buffered -= len(data)
+            except (BrokenPipeError, OSError, ValueError):
+                pass
+            finally:
+                try:
+                    self.decoder.stdin.close()
+                except OSError:
+                    pass
+
+        def read():
+            leftover = b''
+            try:
+                while True:
+                    data = self.decoder.stdout.read1(65536)
+                    if not data:
+                        break
+                    data = leftover + data
+                    usable = len(data) // 2 * 2
+                    leftover = data[usable:]
+                    samples = np.frombuffer(data[:usable], dtype=np.int16)
+                    loop.call_soon_threadsafe(pcm_queue.put_nowait, samples)
+            finally:
+                self.decoder.wait()
+                loop.call_soon_threadsafe(pcm_queue.put_nowait, None)
+
+        threading.Thread(target=write, name='stt-decode-in', daemon=True).start()
+        threading.Thread(target=read, name='stt-decode-out', daemon=True).start()
+
+    async def run(self, on_result=None):
+        """Decode, gate and recognize until the input ends; returns the full transcript
+
+        `on_result` (async, optional) receives every TranscriptResult as
+        soon as it is available.
+        """
+        pcm_queue = asyncio.Queue()
+        self.start(pcm_queue, asyncio.get_running_loop())
+        finals = []
+        try:
+            while True:
+                samples = await pcm_queue.get()
+                if samples is None:
+                    break
+                self.ring.write(samples)
+                self.stats['audio_seconds'] += len(samples) / self.sample_rate
+
+                for start, end in self.vad.process(samples):
+                    await self.finish_segment(start, end, finals, on_result)
+                await self.maybe_partial(on_result)
+
+            for start, end in self.vad.flush():
+                await self.finish_segment(start, end, finals, on_result)
+        finally:
+            self.abort()
+
+        logger.info(f"Streamed STT: {self.stats}")
+        return ' '.join(finals)
+
+    async def recognize_range(self, start, end):
+        pcm = self.ring.read(start, end)
+        self.stats['upstream_seconds'] += len(pcm) / self.sample_rate
+        return await self.recognize(pcm)
+
+    async def finish_segment(self, start, end, finals, on_result):
+        text = await self.recognize_range(start, end)
+        self.stats['segments'] += 1
+        self.stats['speech_seconds'] += (end - start) / self.sample_rate
+        if text:
+            finals.append(text)
+        if on_result is not None:
+            await on_result(TranscriptResult(self.segment, text or '', True, start, end))
+        self.segment += 1
+        self.partial_from = None
+
+    async def maybe_partial(self, on_result):
+        if not self.partial_samples or on_result is None or not self.vad.in_speech:
+            return
+        if self.partial_from != self.vad.speech_start:
+            # New utterance: first partial once enough of it has arrived
+            self.partial_from = self.vad.speech_start
+            self.partial_at = self.vad.speech_start
+        if self.ring.total - self.partial_at < self.partial_samples:
+            return
+        self.partial_at = self.ring.total
+        text = await self.recognize_range(self.partial_from, self.ring.total)
+        if text:
+            self.stats['partials'] += 1
+            await on_result(TranscriptResult(self.segment, text, False, self.partial_from, self.ring.total))
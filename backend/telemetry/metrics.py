@@ -0,0 +1,145 @@
+import bisect
+import threading
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond viseme lookups up to long renders
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class Metric:
+    """Base for labelled metrics; every update is a no-op when the registry is disabled"""
+
+    kind = None
+
+    def __init__(self, registry, name, help_text, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                label_str = format_labels(self.label_names + ('le',), labels + (bound,))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text format.
+
+    Counters and histograms are updated inline. Values that already live
+    elsewhere (cache hit rates, loop lag, peer counts) are read at scrape
+    time through collectors, so they cost nothing between scrapes.
+    """
+
+    def __init__(self, enabled=Config.METRICS_ENABLED):
+        self.enabled = enabled
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(self, name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() -> iterable of (name, help, {label: value}, value) gauge samples"""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        gauges = {}
+        for collect in self.collectors:
+            try:
+                for name, help_text, labels, value in collect():
+                    gauges.setdefault((name, help_text), []).append((labels, value))
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        for (name, help_text), samples in gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'avatar_stage_seconds', "Time spent per pipeline stage", ('stage',)
+)
+REQUESTS = REGISTRY.counter(
+    'avatar_requests_total', "Responses handled by kind and outcome", ('kind', 'outcome')
+)
+FRAMES_RENDERED = REGISTRY.counter(
+    'avatar_frames_rendered_total', "Lip-synced frames encoded"
+)
+BYTES_SENT = REGISTRY.counter(
+    'avatar_bytes_sent_total', "Bytes sent to clients by payload kind", ('kind',)
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    'avatar_event_loop_lag_seconds', "Event loop wake-up lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
@@ -0,0 +1,93 @@
+import contextvars
+import time
+from ..config import Config
+from .metrics import FRAMES_RENDERED, REGISTRY, STAGE_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Request being handled by the current task; copied into tasks it creates
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# OpenTelemetry tracer once setup_tracing() succeeds
+_tracer = None
+
+def setup_tracing(enabled=Config.OTEL_ENABLED):
+    """Export spans through OpenTelemetry when enabled and installed
+
+    Only the API is used here; exporters are configured through the
+    standard OTEL_* environment variables or opentelemetry-instrument.
+    """
+    global _tracer
+    if not enabled:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry-api is not installed")
+        return None
+    _tracer = trace.get_tracer('ai-avatar')
+    return _tracer
+
+def set_request_id(request_id):
+    return request_id_var.set(request_id)
+
+def record_span(stage, seconds, error=False, **attributes):
+    """Record a finished stage, including ones timed in worker processes"""
+    STAGE_SECONDS.observe(seconds, stage)
+    request_id = request_id_var.get()
+
+    if _tracer is not None:
+        end = time.time_ns()
+        otel_span = _tracer.start_span(
+            f"avatar.{stage}",
+            start_time=end - int(seconds * 1e9),
+            attributes={'avatar.request_id': str(request_id), 'error': error, **attributes},
+        )
+        otel_span.end(end_time=end)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"[request {request_id}] {stage} took {seconds * 1000:.1f} ms")
+
+class Span:
+    """Times a block as one pipeline stage (usable around sync or awaited code)"""
+
+    __slots__ = ('stage', 'attributes', 'started')
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_span(self.stage, time.perf_counter() - self.started, exc_type is not None, **self.attributes)
+        return False
+
+class NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = NoopSpan()
+
+def span(stage, **attributes):
+    """Context manager timing `stage`; a shared no-op when telemetry is off"""
+    if not REGISTRY.enabled and _tracer is None:
+        return NOOP_SPAN
+    return Span(stage, attributes)
+
+def record_render(stats):
+    """Record lip sync / encode timings returned by a render"""
+    if not stats or not (REGISTRY.enabled or _tracer is not None):
+        return
+    FRAMES_RENDERED.inc(amount=stats['frames'])
+    record_span('lipsync', stats['lipsync_seconds'])
+    # Lip sync and encode overlap when streaming; encode gets the remainder
+    record_span('encode', max(stats['render_seconds'] - stats['lipsync_seconds'], 0.0))
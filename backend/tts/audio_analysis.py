@@ -0,0 +1,201 @@
+import io
+import wave
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the features change; cached analyses of another version are recomputed
+ANALYSIS_VERSION = 1
+
+# Above this frequency (Hz) energy counts as hiss (s, sh, f)
+SIBILANT_HZ = 3000
+
+def analysis_settings():
+    """Every setting that changes an analysis or the timings aligned from it"""
+    return {
+        'version': ANALYSIS_VERSION,
+        'frame_ms': Config.AUDIO_FRAME_MS,
+        'silence_db': Config.AUDIO_SILENCE_DB,
+        'dynamic_range_db': Config.AUDIO_DYNAMIC_RANGE_DB,
+        'min_pause_ms': Config.AUDIO_MIN_PAUSE_MS,
+        'min_speech_ms': Config.AUDIO_MIN_SPEECH_MS,
+    }
+
+def decode_pcm(audio_data, sample_rate=16000):
+    """Decode TTS audio to (int16 mono PCM, sample rate)
+
+    16-bit PCM wav is read directly at its own rate; anything else (gTTS
+    mp3) goes through one ffmpeg call at `sample_rate`.
+    """
+    if audio_data[:4] == b'RIFF' and audio_data[8:12] == b'WAVE':
+        try:
+            with wave.open(io.BytesIO(audio_data), 'rb') as wav:
+                if wav.getsampwidth() == 2 and wav.getcomptype() == 'NONE':
+                    channels = wav.getnchannels()
+                    pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+                    if channels > 1:
+                        pcm = pcm[:len(pcm) // channels * channels].reshape(-1, channels).mean(axis=1).astype(np.int16)
+                    return pcm, wav.getframerate()
+        except wave.Error:
+            pass
+
+    from ..stt.streaming import decode_audio
+    return decode_audio(audio_data, sample_rate), sample_rate
+
+class AudioAnalysis:
+    """Short-time features of one TTS utterance, one row per frame
+
+    `energy_db` is the frame level in dBFS, `centroid` the spectral
+    centroid in Hz and `sibilance` the share of energy above SIBILANT_HZ.
+    `voiced` marks frames that carry speech, judged against
+    `threshold_db`. Frames start every `frame_seconds`; `duration` is the
+    exact length of the decoded audio.
+    """
+
+    FIELDS = ('energy_db', 'centroid', 'sibilance', 'voiced')
+
+    def __init__(self, duration, frame_seconds, threshold_db, energy_db, centroid, sibilance, voiced):
+        self.duration = float(duration)
+        self.frame_seconds = float(frame_seconds)
+        self.threshold_db = float(threshold_db)
+        self.energy_db = energy_db
+        self.centroid = centroid
+        self.sibilance = sibilance
+        self.voiced = voiced
+
+    def __len__(self):
+        return len(self.voiced)
+
+    def speech_ranges(self, min_pause_ms=Config.AUDIO_MIN_PAUSE_MS, min_speech_ms=Config.AUDIO_MIN_SPEECH_MS):
+        """(n, 2) array of [start, end) seconds holding speech
+
+        Pauses shorter than `min_pause_ms` are bridged, then bursts shorter
+        than `min_speech_ms` (clicks, breaths) are dropped.
+        """
+        edges = np.diff(np.concatenate(([0], self.voiced.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        if len(starts) > 1:
+            keep = (starts[1:] - ends[:-1]) * self.frame_seconds * 1000 >= min_pause_ms
+            starts = starts[np.concatenate(([True], keep))]
+            ends = ends[np.concatenate((keep, [True]))]
+        long_enough = (ends - starts) * self.frame_seconds * 1000 >= min_speech_ms
+        if long_enough.any():
+            starts, ends = starts[long_enough], ends[long_enough]
+        ranges = np.stack((starts, ends), axis=1).astype(np.float64) * self.frame_seconds
+        return np.minimum(ranges, self.duration)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, version=ANALYSIS_VERSION, duration=self.duration, frame_seconds=self.frame_seconds,
+                 threshold_db=self.threshold_db, **{name: getattr(self, name) for name in self.FIELDS})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Inverse of to_bytes; raises ValueError for another ANALYSIS_VERSION"""
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            if int(arrays['version']) != ANALYSIS_VERSION:
+                raise ValueError(f"analysis version {int(arrays['version'])}, expected {ANALYSIS_VERSION}")
+            return cls(float(arrays['duration']), float(arrays['frame_seconds']), float(arrays['threshold_db']),
+                       *(arrays[name] for name in cls.FIELDS))
+
+def analyze_pcm(pcm, sample_rate, frame_ms=Config.AUDIO_FRAME_MS, silence_db=Config.AUDIO_SILENCE_DB,
+                dynamic_range_db=Config.AUDIO_DYNAMIC_RANGE_DB):
+    """Frame features of int16 mono PCM, computed for all frames at once
+
+    Frames of two hops (Hann window) start every `frame_ms`. A frame is
+    speech when it is louder than both `silence_db` and `dynamic_range_db`
+    below the loud end of the utterance. Quieter frames still count when
+    most of their energy is hiss, so fricatives are not taken for pauses.
+    """
+    hop = max(sample_rate * frame_ms // 1000, 1)
+    window = 2 * hop
+    count = -(-len(pcm) // hop)  # Every sample falls in some frame
+    if not count:
+        empty = np.empty(0, dtype=np.float32)
+        return AudioAnalysis(0.0, hop / sample_rate, silence_db, empty, empty, empty, np.empty(0, dtype=bool))
+
+    samples = np.zeros((count - 1) * hop + window, dtype=np.float32)
+    samples[:len(pcm)] = pcm
+    samples /= 32768.0
+    frames = sliding_window_view(samples, window)[::hop]
+
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    energy_db = (20 * np.log10(rms + 1e-9)).astype(np.float32)
+
+    power = np.abs(np.fft.rfft(frames * np.hanning(window).astype(np.float32), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(window, 1 / sample_rate)
+    total = power.sum(axis=1) + 1e-12
+    centroid = (power @ freqs / total).astype(np.float32)
+    sibilance = (power[:, freqs >= SIBILANT_HZ].sum(axis=1) / total).astype(np.float32)
+
+    threshold = max(silence_db, float(np.percentile(energy_db, 95)) - dynamic_range_db)
+    voiced = (energy_db > threshold) | ((energy_db > threshold - 10) & (sibilance > 0.5))
+
+    return AudioAnalysis(len(pcm) / sample_rate, hop / sample_rate, threshold, energy_db, centroid, sibilance, voiced)
+
+def analyze_audio(audio_data):
+    """Decode TTS audio once and analyze it (blocking)"""
+    pcm, sample_rate = decode_pcm(audio_data)
+    return analyze_pcm(pcm, sample_rate)
+
+def align_words(words, analysis):
+    """Word timings aligned to the speech in `analysis`
+
+    Words share the speech time in proportion to their length, then each
+    pause moves the nearest word boundary onto itself when it is within
+    half a word. Pauses (leading, between words and trailing) come back as
+    {'word': '', 'pause': True} entries, so the timings cover the whole
+    audio.
+    """
+    ranges = analysis.speech_ranges()
+    if not len(words):
+        return [pause(0.0, analysis.duration)] if analysis.duration > 0 else []
+    if not len(ranges):
+        ranges = np.array([[0.0, analysis.duration]])
+
+    lengths = ranges[:, 1] - ranges[:, 0]
+    run_ends = np.cumsum(lengths)  # Speech time at the end of each range
+    weights = np.fromiter((len(word) + 1 for word in words), dtype=np.float64, count=len(words))
+    bounds = np.concatenate(([0.0], np.cumsum(weights))) / weights.sum() * run_ends[-1]
+
+    pauses = run_ends[:-1]
+    if len(pauses) and len(words) > 1:
+        internal = bounds[1:-1]
+        distance = np.abs(internal[None, :] - pauses[:, None])
+        nearest = distance.argmin(axis=1)
+        tolerance = run_ends[-1] / len(words) / 2
+        # Closest pause first, so each boundary takes at most one pause
+        taken = set()
+        for p in np.argsort(distance[np.arange(len(pauses)), nearest]).tolist():
+            j = int(nearest[p])
+            if j not in taken and distance[p, j] <= tolerance:
+                internal[j] = pauses[p]
+                taken.add(j)
+        bounds[1:-1] = np.maximum.accumulate(internal)
+
+    def to_time(speech_time, side):
+        # A boundary on a pause ends the word before it and starts the one after
+        run = np.minimum(np.searchsorted(run_ends, speech_time, side=side), len(ranges) - 1)
+        return ranges[run, 0] + speech_time - (run_ends[run] - lengths[run])
+
+    word_starts = to_time(bounds[:-1], 'right')
+    word_ends = to_time(bounds[1:], 'left')
+
+    timings = []
+    previous_end = 0.0
+    for word, start, end in zip(words, word_starts.tolist(), word_ends.tolist()):
+        if start - previous_end > analysis.frame_seconds:
+            timings.append(pause(previous_end, start))
+        timings.append({'word': word, 'start': start, 'end': max(end, start)})
+        previous_end = max(end, start)
+    if analysis.duration - previous_end > 0:
+        timings.append(pause(previous_end, analysis.duration))
+    return timings
+
+def pause(start, end):
+    return {'word': '', 'start': start, 'end': end, 'pause': True}
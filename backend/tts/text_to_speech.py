@@ -1,80 +1,111 @@
-from gtts import gTTS
-import io
 import asyncio
-import hashlib
-import os
 from ..config import Config
+from ..telemetry.tracing import span
+from .audio_analysis import align_words, analysis_settings, analyze_audio
+from .synthesizers import create_synthesizer
+from .tts_cache import TTSCache, make_cache_key
 import logging
 
 logger = logging.getLogger(__name__)
 
 class TextToSpeech:
-    def __init__(self, language=Config.TTS_LANGUAGE, tld=Config.TTS_TLD):
+    def __init__(self, language=Config.TTS_LANGUAGE, tld=Config.TTS_TLD, executor=None,
+                 synthesizer=None, cache=None, slow=False):
         self.language = language
         self.tld = tld
-        self.cache_dir = "cache/tts"
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.slow = slow
+        self.executor = executor  # StageExecutor; None runs inline
+        self.synthesizer = synthesizer or create_synthesizer()
+        self.cache = cache or TTSCache(extension=self.synthesizer.audio_format, executor=executor)
+        
+    def cache_key(self, text):
+        """Cache key covering the text and every voice parameter"""
+        return make_cache_key(
+            text,
+            backend=self.synthesizer.name,
+            language=self.language,
+            tld=self.tld,
+            slow=self.slow
+        )
         
     async def generate_speech(self, text):
         """Convert text to speech audio"""
         try:
-            # Generate cache key
-            cache_key = hashlib.md5(f"{text}_{self.language}".encode()).hexdigest()
-            cache_path = f"{self.cache_dir}/{cache_key}.mp3"
-            
-            # Check cache
-            if os.path.exists(cache_path):
-                with open(cache_path, 'rb') as f:
-                    audio_data = f.read()
-                return audio_data
-                
-            # Generate speech
-            tts = gTTS(text=text, lang=self.language, tld=self.tld, slow=False)
+            return await self.cache.get_or_create(
+                self.cache_key(text), lambda: self.synthesize_async(text)
+            )
             
-            # Save to bytes
-            audio_bytes = io.BytesIO()
-            tts.write_to_fp(audio_bytes)
-            audio_bytes.seek(0)
-            audio_data = audio_bytes.read()
+        except Exception as e:
+            logger.error(f"Error in text to speech: {e}")
+            return None
             
-            # Cache the audio
-            with open(cache_path, 'wb') as f:
-                f.write(audio_data)
+    async def synthesize_async(self, text):
+        """Run the blocking synthesizer off the event loop"""
+        if self.executor is not None:
+            return await self.executor.run('io', self.synthesize, text)
+        return await asyncio.to_thread(self.synthesize, text)
+        
+    def synthesize(self, text):
+        """Blocking speech synthesis (no cache)"""
+        audio_data = self.synthesizer.synthesize(text, self.language, self.tld, self.slow)
+        logger.info(f"Generated speech for text: {text[:50]}...")
+        return audio_data
+        
+    async def analyze(self, text, audio_data):
+        """AudioAnalysis of the speech for `text` (cached with the audio), or None"""
+        try:
+            with span('audio_analysis'):
+                # Keyed on the analysis settings too, so changing them recomputes
+                key = make_cache_key(self.cache_key(text), **analysis_settings())
+                return await self.cache.get_or_analyze(key, audio_data, analyze_audio)
                 
-            logger.info(f"Generated speech for text: {text[:50]}...")
-            
-            return audio_data
-            
         except Exception as e:
-            logger.error(f"Error in text to speech: {e}")
+            logger.warning(f"Audio analysis failed, estimating word timings: {e}")
             return None
             
     async def generate_with_timings(self, text):
-        """Generate speech with word timings for viseme sync"""
+        """Generate speech with word timings for viseme sync
+        
+        Timings are aligned to the speech in the decoded audio and cover
+        all of it: silences come back as {'word': '', 'pause': True}
+        entries. With TTS_ALIGNMENT=estimate, or when the audio cannot be
+        decoded, word lengths are estimated from the audio size instead.
+        """
         try:
             # Generate audio
-            audio_data = await self.generate_speech(text)
+            with span('tts'):
+                audio_data = await self.generate_speech(text)
             
             if not audio_data:
                 return None, None
                 
-            # Calculate approximate word timings (simplified)
             words = text.split()
-            word_duration = len(audio_data) / (len(words) * 16000)  # Rough estimate
-            
-            timings = []
-            current_time = 0
-            
-            for word in words:
-                timings.append({
-                    'word': word,
-                    'start': current_time,
-                    'end': current_time + word_duration
-                })
-                current_time += word_duration
+            analysis = None
+            if Config.TTS_ALIGNMENT == 'audio':
+                analysis = await self.analyze(text, audio_data)
+            if analysis is not None:
+                return audio_data, align_words(words, analysis)
                 
-            return audio_data, timings
+            return audio_data, self.estimate_timings(words, audio_data)
             
         except Exception as e:
             logger.error(f"Error generating speech with timings: {e}")
-            return None, None
\ No newline at end of file
+            return None, None
+            
+    @staticmethod
+    def estimate_timings(words, audio_data):
+        """Equal-length words over a duration guessed from the audio size"""
+        word_duration = len(audio_data) / (max(len(words), 1) * 16000)  # Rough estimate
+        
+        timings = []
+        current_time = 0
+        
+        for word in words:
+            timings.append({
+                'word': word,
+                'start': current_time,
+                'end': current_time + word_duration
+            })
+            current_time += word_duration
+            
+        return timings
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+import collections
+import hashlib
+import os
+from ..cache.disk_lru import DiskLRU
+from ..cache.single_flight import SingleFlight
+from ..config import Config
+from .audio_analysis import AudioAnalysis
+import logging
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(text, **params):
+    """Stable key over the text and every parameter that changes the audio"""
+    parts = [text] + [f"{name}={params[name]}" for name in sorted(params)]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+class TTSCache:
+    """In-memory LRU over a size-capped disk cache, with single-flight misses.
+
+    - Memory tier: OrderedDict LRU bounded by total bytes.
+    - Disk tier: DiskLRU, evicted least-recently-used first once the
+      directory exceeds `disk_bytes`; writes are atomic renames.
+    - Concurrent misses for the same key share a single synthesis.
+    - The AudioAnalysis of each entry is kept alongside it (`analysis/`
+      under the cache directory), so a phrase is decoded and analyzed once.
+    """
+
+    def __init__(self, cache_dir=Config.TTS_CACHE_DIR, extension='mp3',
+                 memory_bytes=Config.TTS_MEMORY_CACHE_MB * 1024 * 1024,
+                 disk_bytes=Config.TTS_DISK_CACHE_MB * 1024 * 1024, executor=None, analysis_entries=1024):
+        self.memory_limit = memory_bytes
+        self.executor = executor  # StageExecutor; None uses asyncio.to_thread
+
+        self.memory = collections.OrderedDict()
+        self.memory_size = 0
+        self.disk = DiskLRU(cache_dir, extension, disk_bytes)
+        self.single_flight = SingleFlight()
+
+        # Analyses are a few KB each: bounded by count in memory, a slice of the budget on disk
+        self.analyses = collections.OrderedDict()
+        self.analysis_entries = analysis_entries
+        self.analysis_disk = DiskLRU(os.path.join(cache_dir, 'analysis'), 'npz', disk_bytes // 16)
+
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'errors': 0,
+            'analysis_hits': 0,
+            'analysis_misses': 0,
+        }
+
+    async def get_or_create(self, key, create):
+        """Return cached bytes for `key`, calling `await create()` once on a miss"""
+        data = self.memory_get(key)
+        if data is not None:
+            self.stats['memory_hits'] += 1
+            return data
+
+        async def load():
+            data = await self.run_io(self.disk.read, key)
+            if data is not None:
+                self.stats['disk_hits'] += 1
+            else:
+                self.stats['misses'] += 1
+                data = await create()
+                if data:
+                    await self.run_io(self.disk.write, key, data)
+            if data:
+                self.memory_put(key, data)
+            return data
+
+        try:
+            return await self.single_flight.run(key, load)
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+
+    async def get_or_analyze(self, key, audio_data, analyze):
+        """Return the AudioAnalysis of the audio cached under `key`
+
+        `analyze(audio_data)` (blocking) runs in a worker thread once per
+        key; later calls, and concurrent ones, share its result.
+        """
+        analysis = self.analyses.get(key)
+        if analysis is not None:
+            self.analyses.move_to_end(key)
+            self.stats['analysis_hits'] += 1
+            return analysis
+
+        async def load():
+            data = await self.run_io(self.analysis_disk.read, key)
+            analysis = None
+            if data is not None:
+                try:
+                    analysis = AudioAnalysis.from_bytes(data)
+                    self.stats['analysis_hits'] += 1
+                except Exception as e:
+                    logger.info(f"Recomputing cached audio analysis {key[:12]}: {e}")
+            if analysis is None:
+                self.stats['analysis_misses'] += 1
+                analysis = await self.run_io(analyze, audio_data)
+                await self.run_io(self.analysis_disk.write, key, analysis.to_bytes())
+
+            self.analyses[key] = analysis
+            while len(self.analyses) > self.analysis_entries:
+                self.analyses.popitem(last=False)
+            return analysis
+
+        return await self.single_flight.run(f"analysis:{key}", load)
+
+    async def run_io(self, fn, *args):
+        if self.executor is not None:
+            return await self.executor.run('io', fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    def memory_get(self, key):
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+        return data
+
+    def memory_put(self, key, data):
+        if len(data) > self.memory_limit:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_size -= len(old)
+        self.memory[key] = data
+        self.memory_size += len(data)
+        while self.memory_size > self.memory_limit:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+            self.stats['memory_evictions'] += 1
+
+    def get_stats(self):
+        """Hit/miss counters and tier sizes"""
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return {
+            **self.stats,
+            'coalesced': self.single_flight.coalesced,
+            'disk_evictions': self.disk.evictions,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory_size,
+            'disk_entries': self.disk.entries(),
+            'disk_bytes': self.disk.size,
+            'analysis_entries': len(self.analyses),
+        }
@@ -1,11 +1,74 @@
+import functools
+import itertools
 import json
+import re
+import unicodedata
 import numpy as np
+from ..telemetry.tracing import span
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Viseme ids used in viseme sequences; id 0 is silence
+VISEME_NAMES = [
+    'viseme_silence', 'viseme_aa', 'viseme_ii', 'viseme_uu', 'viseme_e', 'viseme_o',
+    'viseme_k', 'viseme_g', 'viseme_ch', 'viseme_j', 'viseme_t', 'viseme_d',
+    'viseme_n', 'viseme_m', 'viseme_p', 'viseme_b', 'viseme_y', 'viseme_r',
+    'viseme_l', 'viseme_v', 'viseme_s', 'viseme_h'
+]
+VISEME_IDS = {name: i for i, name in enumerate(VISEME_NAMES)}
+
+# Viseme ids of a {'pause': True} timing entry
+PAUSE_IDS = (VISEME_IDS['viseme_silence'],)
+
+# One row per viseme: [start, end) in seconds, viseme id and blend factor
+VISEME_DTYPE = np.dtype([
+    ('start', np.float64),
+    ('end', np.float64),
+    ('viseme', np.uint8),
+    ('blend', np.float32),
+])
+
+# Devanagari letters (consonants carry an inherent 'a' unless followed by a
+# vowel sign or virama); None marks signs that shape neighbours but have no
+# mouth shape of their own
+DEVANAGARI_CONSONANTS = {
+    'क': 'viseme_k', 'ख': 'viseme_k', 'ग': 'viseme_g', 'घ': 'viseme_g', 'ङ': 'viseme_n',
+    'च': 'viseme_ch', 'छ': 'viseme_ch', 'ज': 'viseme_j', 'झ': 'viseme_j', 'ञ': 'viseme_n',
+    'ट': 'viseme_t', 'ठ': 'viseme_t', 'ड': 'viseme_d', 'ढ': 'viseme_d', 'ण': 'viseme_n',
+    'त': 'viseme_t', 'थ': 'viseme_t', 'द': 'viseme_d', 'ध': 'viseme_d', 'न': 'viseme_n',
+    'प': 'viseme_p', 'फ': 'viseme_p', 'ब': 'viseme_b', 'भ': 'viseme_b', 'म': 'viseme_m',
+    'य': 'viseme_y', 'र': 'viseme_r', 'ल': 'viseme_l', 'व': 'viseme_v',
+    'श': 'viseme_s', 'ष': 'viseme_s', 'स': 'viseme_s', 'ह': 'viseme_h', 'ळ': 'viseme_l',
+}
+# A consonant plus nukta is one consonant (ज़ z, फ़ f, ड़/ढ़ flapped r); it
+# keeps the inherent vowel like any other
+NUKTA = '़'
+DEVANAGARI_NUKTA_CONSONANTS = {
+    consonant + NUKTA: {'ज': 'viseme_s', 'फ': 'viseme_v', 'ड': 'viseme_r', 'ढ': 'viseme_r'}.get(consonant, viseme)
+    for consonant, viseme in DEVANAGARI_CONSONANTS.items()
+}
+DEVANAGARI_CONSONANT_TOKENS = DEVANAGARI_CONSONANTS.keys() | DEVANAGARI_NUKTA_CONSONANTS.keys()
+# Precomposed nukta letters (क़ ख़ ग़ ज़ ड़ ढ़ फ़ य़ ऩ ऱ ऴ) spelled out as consonant + nukta
+NUKTA_DECOMPOSITION = {
+    code: unicodedata.normalize('NFD', chr(code))
+    for code in (*range(0x0958, 0x0960), 0x0929, 0x0931, 0x0934)
+}
+DEVANAGARI_VOWEL_SIGNS = {
+    'ा': 'viseme_aa', 'ि': 'viseme_ii', 'ी': 'viseme_ii', 'ु': 'viseme_uu', 'ू': 'viseme_uu',
+    'ृ': 'viseme_r', 'े': 'viseme_e', 'ै': 'viseme_e', 'ो': 'viseme_o', 'ौ': 'viseme_o',
+    'ॉ': 'viseme_o', '्': None,
+}
+DEVANAGARI_OTHER = {
+    'अ': 'viseme_aa', 'आ': 'viseme_aa', 'इ': 'viseme_ii', 'ई': 'viseme_ii', 'उ': 'viseme_uu',
+    'ऊ': 'viseme_uu', 'ऋ': 'viseme_r', 'ए': 'viseme_e', 'ऐ': 'viseme_e', 'ओ': 'viseme_o',
+    'औ': 'viseme_o', 'ऑ': 'viseme_o',
+    'ं': 'viseme_n', 'ँ': 'viseme_n', 'ः': 'viseme_h', '़': None,
+    '।': 'viseme_silence', '॥': 'viseme_silence',
+}
+
 class VisemeGenerator:
-    def __init__(self):
+    def __init__(self, word_cache_size=4096):
         # Viseme mapping for Hindi/English
         self.viseme_map = {
             # Vowels
@@ -35,58 +98,117 @@ class VisemeGenerator:
             '.': 'viseme_silence',
             ',': 'viseme_silence',
             '?': 'viseme_silence',
-            '!': 'viseme_silence'
+            '!': 'viseme_silence',
+            
+            # Devanagari
+            **DEVANAGARI_CONSONANTS,
+            **DEVANAGARI_NUKTA_CONSONANTS,
+            **DEVANAGARI_VOWEL_SIGNS,
+            **DEVANAGARI_OTHER
         }
         
+        # Greedy longest match over every key; any other character is silence
+        keys = sorted(self.viseme_map, key=len, reverse=True)
+        self.token_pattern = re.compile('|'.join(map(re.escape, keys)) + '|.', re.DOTALL)
+        
+        # Per-word memo of viseme ids
+        self.tokenize_word = functools.lru_cache(maxsize=word_cache_size)(self._tokenize_word)
+        
+    def _tokenize_word(self, word):
+        """Viseme ids for one lower-cased word"""
+        ids = []
+        tokens = self.token_pattern.findall(word.translate(NUKTA_DECOMPOSITION))
+        for i, token in enumerate(tokens):
+            viseme = self.viseme_map.get(token, 'viseme_silence')
+            if viseme is not None:
+                ids.append(VISEME_IDS[viseme])
+                
+            # Inherent vowel after a Devanagari consonant, except before a
+            # vowel sign/virama and at the end of the word (schwa deletion)
+            if token in DEVANAGARI_CONSONANT_TOKENS and i + 1 < len(tokens):
+                if tokens[i + 1] not in DEVANAGARI_VOWEL_SIGNS:
+                    ids.append(VISEME_IDS['viseme_aa'])
+        return tuple(ids)
+        
     def text_to_visemes(self, text, timings):
-        """Convert text to viseme sequence with timings"""
-        try:
-            viseme_sequence = []
-            
-            for timing in timings:
-                word = timing['word'].lower()
-                word_duration = timing['end'] - timing['start']
+        """Convert text to a viseme sequence (structured array of VISEME_DTYPE)"""
+        with span('visemes'):
+            try:
+                if not timings:
+                    return np.empty(0, dtype=VISEME_DTYPE)
                 
-                # Process each character in word
-                char_duration = word_duration / len(word)
+                word_ids = [
+                    PAUSE_IDS if timing.get('pause') else self.tokenize_word(timing['word'].lower())
+                    for timing in timings
+                ]
+                counts = np.fromiter(map(len, word_ids), dtype=np.int64, count=len(word_ids))
+                total = int(counts.sum())
                 
-                for i, char in enumerate(word):
-                    char_time = timing['start'] + (i * char_duration)
-                    viseme = self.viseme_map.get(char, 'viseme_silence')
-                    
-                    viseme_sequence.append({
-                        'viseme': viseme,
-                        'start': char_time,
-                        'end': char_time + char_duration,
-                        'blend': 0.1  # Blend factor for smooth transition
-                    })
-                    
-            return viseme_sequence
+                word_starts = np.fromiter((t['start'] for t in timings), dtype=np.float64, count=len(timings))
+                word_ends = np.fromiter((t['end'] for t in timings), dtype=np.float64, count=len(timings))
+                
+                # Each word's duration is split evenly over its visemes
+                token_duration = np.repeat((word_ends - word_starts) / np.maximum(counts, 1), counts)
+                position = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                
+                sequence = np.empty(total, dtype=VISEME_DTYPE)
+                sequence['start'] = np.repeat(word_starts, counts) + position * token_duration
+                sequence['end'] = sequence['start'] + token_duration
+                sequence['viseme'] = np.fromiter(itertools.chain.from_iterable(word_ids), dtype=np.uint8, count=total)
+                sequence['blend'] = 0.1  # Blend factor for smooth transition
+                
+                return self.merge_repeats(sequence)
+                
+            except Exception as e:
+                logger.error(f"Error generating visemes: {e}")
+                return np.empty(0, dtype=VISEME_DTYPE)
             
-        except Exception as e:
-            logger.error(f"Error generating visemes: {e}")
+    @staticmethod
+    def merge_repeats(sequence):
+        """Collapse back-to-back rows of the same viseme into one"""
+        if len(sequence) < 2:
+            return sequence
+        starts_run = np.ones(len(sequence), dtype=bool)
+        starts_run[1:] = (
+            (sequence['viseme'][1:] != sequence['viseme'][:-1])
+            | (sequence['start'][1:] != sequence['end'][:-1])
+        )
+        run_index = np.flatnonzero(starts_run)
+        merged = sequence[run_index]
+        merged['end'] = np.maximum.reduceat(sequence['end'], run_index)
+        return merged
+        
+    def get_phonemes_from_audio(self, audio_data, sample_rate=16000):
+        """Coarse phoneme classes from the audio itself
+        
+        `audio_data` is encoded audio (decoded at `sample_rate` unless it
+        is wav) or an AudioAnalysis. Each run of frames becomes one entry:
+        'sil' for silence, 's' where hiss dominates (fricatives) and 'aa'
+        for other speech, with the speech/silence margin as confidence.
+        """
+        from ..tts.audio_analysis import AudioAnalysis, analyze_pcm, decode_pcm
+        
+        if isinstance(audio_data, AudioAnalysis):
+            analysis = audio_data
+        else:
+            analysis = analyze_pcm(*decode_pcm(audio_data, sample_rate))
+        if not len(analysis):
             return []
             
-    def get_phonemes_from_audio(self, audio_data, sample_rate=16000):
-        """Extract phonemes from audio (simplified version)"""
-        # This is a simplified version
-        # In production, use a proper phoneme recognition model
+        labels = np.where(analysis.voiced, np.where(analysis.sibilance > 0.5, 2, 1), 0)
+        run_starts = np.flatnonzero(np.concatenate(([True], labels[1:] != labels[:-1])))
+        run_ends = np.append(run_starts[1:], len(labels))
         
-        duration = len(audio_data) / sample_rate
-        num_phonemes = int(duration * 10)  # Assume ~10 phonemes per second
+        # Distance from the voicing threshold; 12 dB or more is certain
+        margin = np.abs(analysis.energy_db - analysis.threshold_db)
         
         phonemes = []
-        for i in range(num_phonemes):
-            start_time = i * 0.1
-            end_time = min((i + 1) * 0.1, duration)
-            
-            # Simplified phoneme detection
-            phoneme = {
-                'phoneme': 'sil' if i % 3 == 0 else 'aa',
-                'start': start_time,
-                'end': end_time,
-                'confidence': 0.8
-            }
-            phonemes.append(phoneme)
+        for start, end in zip(run_starts.tolist(), run_ends.tolist()):
+            phonemes.append({
+                'phoneme': ('sil', 'aa', 's')[labels[start]],
+                'start': start * analysis.frame_seconds,
+                'end': min(end * analysis.frame_seconds, analysis.duration),
+                'confidence': round(float(np.clip(margin[start:end].mean() / 12, 0.0, 1.0)), 3)
+            })
             
         return phonemes
\ No newline at end of file
@@ -0,0 +1,314 @@
+import asyncio
+import fractions
+import io
+import queue
+import threading
+import time
+
+import av
+import numpy as np
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import VIDEO_CLOCK_RATE, MediaStreamError
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUDIO_RATE = 48000
+AUDIO_PTIME = 0.02  # Seconds of audio per packet
+AUDIO_SAMPLES = int(AUDIO_RATE * AUDIO_PTIME)
+
+def decode_audio(audio_data, rate=AUDIO_RATE):
+    """Decode TTS audio (mp3/wav bytes) to mono int16 PCM at `rate`"""
+    resampler = av.AudioResampler(format='s16', layout='mono', rate=rate)
+    chunks = []
+    with av.open(io.BytesIO(audio_data)) as container:
+        for frame in container.decode(audio=0):
+            chunks.extend(out.to_ndarray().reshape(-1) for out in resampler.resample(frame))
+        # Flush samples buffered in the resampler
+        chunks.extend(out.to_ndarray().reshape(-1) for out in resampler.resample(None))
+    if not chunks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(chunks).astype(np.int16, copy=False)
+
+class MediaClock:
+    """Wall-clock origin shared by an audio/video track pair.
+
+    Both tracks derive their timestamps from the same origin, so a sample
+    and a frame scheduled for the same media time are sent together.
+    """
+
+    def __init__(self):
+        self.origin = None
+
+    def start(self):
+        if self.origin is None:
+            self.origin = time.time()
+        return self.origin
+
+    def now(self):
+        """Seconds of media time elapsed since the origin"""
+        return time.time() - self.start()
+
+class FrameProducer:
+    """Runs a lip-sync frame generator on a thread into a bounded queue"""
+
+    END = object()  # Queued after the last frame
+
+    def __init__(self, frames, queue_size=Config.FRAME_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max(int(queue_size), 1))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(frames,), daemon=True,
+                                       name='webrtc-frames')
+        self.thread.start()
+
+    def run(self, frames):
+        try:
+            for item in enumerate(frames):
+                if not self.put(item):
+                    return
+        except Exception as e:
+            logger.error(f"Error producing WebRTC frames: {e}")
+        finally:
+            self.put(self.END)
+
+    def put(self, item):
+        """Blocking put that gives up once stopped"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stop(self):
+        self.stopped.set()
+
+class AvatarVideoTrack(MediaStreamTrack):
+    """Video track paced by wall clock at `fps`, fed from a FrameProducer.
+
+    Each tick shows the newest produced frame due at that media time:
+    frames the producer made too late are dropped, and when it falls
+    behind the previous frame is repeated. Between utterances the idle
+    (silent mouth) frame is sent.
+    """
+
+    kind = 'video'
+
+    def __init__(self, clock, idle_frame, fps=Config.VIDEO_FPS):
+        super().__init__()
+        self.clock = clock
+        self.fps = fps
+        self.time_base = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+        self.set_idle_frame(idle_frame)
+        self.last = self.idle
+
+        self.frame_index = None
+        self.producer = None
+        self.pending = None
+        self.start_time = 0.0
+        self.stats = {'sent': 0, 'rendered': 0, 'dropped': 0, 'duplicated': 0, 'skipped_ticks': 0}
+
+    def set_idle_frame(self, frame):
+        self.idle = av.VideoFrame.from_ndarray(np.ascontiguousarray(frame), format='rgb24')
+
+    def play(self, producer, start_time):
+        """Show frames from `producer`, frame 0 at media time `start_time`"""
+        self.stop_playback()
+        self.producer = producer
+        self.pending = None
+        self.start_time = start_time
+
+    def stop_playback(self):
+        if self.producer is not None:
+            self.producer.stop()
+        self.producer = None
+        self.pending = None
+        self.last = self.idle
+
+    async def next_timestamp(self):
+        """Sleep until the next tick and return its pts"""
+        origin = self.clock.start()
+        if self.frame_index is None:
+            self.frame_index = int((time.time() - origin) * self.fps)
+        else:
+            self.frame_index += 1
+
+        wait = origin + self.frame_index / self.fps - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        elif wait < -1 / self.fps:
+            # Fell behind (slow encoder or loop lag): skip the missed ticks
+            missed = int(-wait * self.fps)
+            self.frame_index += missed
+            self.stats['skipped_ticks'] += missed
+        return int(self.frame_index * VIDEO_CLOCK_RATE / self.fps)
+
+    async def recv(self):
+        if self.readyState != 'live':
+            raise MediaStreamError
+
+        pts = await self.next_timestamp()
+        frame = self.current_frame(self.frame_index / self.fps)
+        frame.pts = pts
+        frame.time_base = self.time_base
+        self.stats['sent'] += 1
+        return frame
+
+    def current_frame(self, media_time):
+        """Frame to show at `media_time`"""
+        if self.producer is None:
+            return self.idle
+
+        index = int(round((media_time - self.start_time) * self.fps))
+        if index < 0:
+            return self.last
+
+        newest = None
+        finished = False
+        while True:
+            if self.pending is None:
+                try:
+                    self.pending = self.producer.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if self.pending is FrameProducer.END:
+                finished = True
+                break
+            if self.pending[0] > index:
+                break  # Ahead of the clock; keep it for a later tick
+            if newest is not None:
+                self.stats['dropped'] += 1
+            newest, self.pending = self.pending, None
+
+        if newest is not None:
+            self.last = av.VideoFrame.from_ndarray(newest[1], format='rgb24')
+            self.stats['rendered'] += 1
+        elif finished:
+            # Utterance over; back to the idle face
+            self.producer = None
+            self.pending = None
+            self.last = self.idle
+        else:
+            self.stats['duplicated'] += 1
+        return self.last
+
+    def stop(self):
+        self.stop_playback()
+        super().stop()
+
+class AvatarAudioTrack(MediaStreamTrack):
+    """Audio track paced by wall clock in 20 ms packets of 48 kHz mono PCM"""
+
+    kind = 'audio'
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.time_base = fractions.Fraction(1, AUDIO_RATE)
+        self.sample_index = None
+        self.pcm = None
+        self.start_sample = 0
+        self.silence = np.zeros(AUDIO_SAMPLES, dtype=np.int16)
+        self.stats = {'sent': 0, 'skipped_packets': 0}
+
+    def play(self, pcm, start_time):
+        """Play `pcm` with its first sample at media time `start_time`"""
+        self.pcm = pcm
+        self.start_sample = int(round(start_time * AUDIO_RATE))
+
+    def stop_playback(self):
+        self.pcm = None
+
+    async def recv(self):
+        if self.readyState != 'live':
+            raise MediaStreamError
+
+        origin = self.clock.start()
+        if self.sample_index is None:
+            self.sample_index = int((time.time() - origin) * AUDIO_RATE) // AUDIO_SAMPLES * AUDIO_SAMPLES
+        else:
+            self.sample_index += AUDIO_SAMPLES
+
+        wait = origin + self.sample_index / AUDIO_RATE - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        elif wait < -AUDIO_PTIME:
+            # Stay on the shared clock rather than drifting behind the video
+            missed = int(-wait / AUDIO_PTIME)
+            self.sample_index += missed * AUDIO_SAMPLES
+            self.stats['skipped_packets'] += missed
+
+        frame = av.AudioFrame.from_ndarray(
+            self.samples_at(self.sample_index).reshape(1, -1), format='s16', layout='mono'
+        )
+        frame.sample_rate = AUDIO_RATE
+        frame.pts = self.sample_index
+        frame.time_base = self.time_base
+        self.stats['sent'] += 1
+        return frame
+
+    def samples_at(self, sample_index):
+        """One packet of the current utterance (zero padded), or silence"""
+        if self.pcm is None:
+            return self.silence
+        offset = sample_index - self.start_sample
+        if offset >= len(self.pcm):
+            self.pcm = None
+            return self.silence
+        if offset + AUDIO_SAMPLES <= 0:
+            return self.silence
+
+        packet = np.zeros(AUDIO_SAMPLES, dtype=np.int16)
+        src_start = max(offset, 0)
+        src_end = min(offset + AUDIO_SAMPLES, len(self.pcm))
+        packet[src_start - offset:src_end - offset] = self.pcm[src_start:src_end]
+        return packet
+
+class AvatarMedia:
+    """Live avatar audio/video for one peer connection.
+
+    Frames come straight from the lip-sync engine and audio from the TTS
+    bytes, so nothing is encoded to a file. Add `audio` and `video` to an
+    RTCPeerConnection, then call `speak` for each response.
+    """
+
+    def __init__(self, lipsync, fps=Config.VIDEO_FPS, queue_size=Config.FRAME_QUEUE_SIZE,
+                 lead=0.1, executor=None):
+        self.fps = fps
+        self.queue_size = queue_size
+        self.lead = lead  # Head start for the frame producer and audio decode
+        self.executor = executor  # StageExecutor; None uses asyncio.to_thread
+
+        self.clock = MediaClock()
+        self.video = AvatarVideoTrack(self.clock, lipsync.atlas.compose('viseme_silence'), fps)
+        self.audio = AvatarAudioTrack(self.clock)
+
+    async def speak(self, lipsync, viseme_sequence, audio_data):
+        """Start playing one utterance, replacing any in progress; returns its duration"""
+        pcm = await self.run_io(decode_audio, audio_data)
+
+        self.video.set_idle_frame(lipsync.atlas.compose('viseme_silence'))
+        start_time = self.clock.now() + self.lead
+        producer = FrameProducer(lipsync.stream_frames(viseme_sequence, self.fps), self.queue_size)
+        self.video.play(producer, start_time)
+        self.audio.play(pcm, start_time)
+        return len(pcm) / AUDIO_RATE
+
+    def interrupt(self):
+        """Stop the current utterance and return to idle"""
+        self.video.stop_playback()
+        self.audio.stop_playback()
+
+    async def run_io(self, fn, *args):
+        if self.executor is not None:
+            return await self.executor.run('io', fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    def get_stats(self):
+        return {'video': dict(self.video.stats), 'audio': dict(self.audio.stats)}
+
+    def close(self):
+        self.video.stop()
+        self.audio.stop()
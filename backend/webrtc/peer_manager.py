@@ -0,0 +1,160 @@
+import asyncio
+import collections
+import time
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PeerLimitError(Exception):
+    """Raised when a new peer would exceed the process or per-client limit"""
+
+class Peer:
+    """One RTCPeerConnection and its avatar media, owned by a WebSocket session"""
+
+    __slots__ = ('owner', 'peer_id', 'pc', 'media', 'created', 'last_active')
+
+    def __init__(self, owner, peer_id, pc, media=None):
+        self.owner = owner
+        self.peer_id = peer_id
+        self.pc = pc
+        self.media = media
+        self.created = self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+class PeerManager:
+    """Tracks every peer connection so none outlives its client.
+
+    - Peers are keyed by (session id, client peer id) and closed together
+      with their WebSocket session.
+    - New peers are refused past `max_peers` per process or
+      `max_peers_per_client` per session.
+    - A background task closes peers that are not connected and have seen
+      no signaling or speech for `idle_timeout` seconds (abandoned
+      handshakes, dropped media); peers whose connection failed are closed
+      at once. A connected peer lives as long as its media and session.
+    """
+
+    def __init__(self, max_peers=Config.WEBRTC_MAX_PEERS,
+                 max_peers_per_client=Config.WEBRTC_MAX_PEERS_PER_CLIENT,
+                 idle_timeout=Config.WEBRTC_IDLE_TIMEOUT, reap_interval=Config.WEBRTC_REAP_INTERVAL):
+        self.max_peers = max_peers
+        self.max_peers_per_client = max_peers_per_client
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+
+        self.peers = {}
+        self.by_owner = collections.defaultdict(set)
+        self.stats = {'opened': 0, 'closed': 0, 'reaped': 0, 'rejected': 0}
+        self.task = None
+
+    def check_capacity(self, owner, peer_id):
+        """Raise PeerLimitError unless `owner` may open (or replace) `peer_id`"""
+        if (owner, peer_id) in self.peers:
+            return  # Replacing an existing peer frees its slot
+        if len(self.peers) >= self.max_peers:
+            self.stats['rejected'] += 1
+            raise PeerLimitError(f"Server peer limit reached ({self.max_peers})")
+        if len(self.by_owner.get(owner, ())) >= self.max_peers_per_client:
+            self.stats['rejected'] += 1
+            raise PeerLimitError(f"Client peer limit reached ({self.max_peers_per_client})")
+
+    async def add(self, owner, peer_id, pc, media=None):
+        """Register a peer, closing any previous peer with the same id"""
+        self.check_capacity(owner, peer_id)
+        await self.close(owner, peer_id)
+
+        peer = Peer(owner, peer_id, pc, media)
+        self.peers[(owner, peer_id)] = peer
+        self.by_owner[owner].add(peer_id)
+        self.stats['opened'] += 1
+
+        @pc.on('connectionstatechange')
+        async def on_connectionstatechange():
+            if pc.connectionState in ('failed', 'closed') and self.peers.get((owner, peer_id)) is peer:
+                logger.info(f"Peer {peer_id} connection {pc.connectionState}")
+                await self.close(owner, peer_id)
+
+        return peer
+
+    def get(self, owner, peer_id):
+        """Live peer (marking it active) or None"""
+        peer = self.peers.get((owner, peer_id))
+        if peer is not None:
+            peer.touch()
+        return peer
+
+    async def close(self, owner, peer_id):
+        peer = self.peers.pop((owner, peer_id), None)
+        if peer is None:
+            return False
+        peer_ids = self.by_owner.get(owner)
+        if peer_ids is not None:
+            peer_ids.discard(peer_id)
+            if not peer_ids:
+                del self.by_owner[owner]
+
+        self.stats['closed'] += 1
+        if peer.media is not None:
+            peer.media.close()
+        try:
+            await peer.pc.close()
+        except Exception as e:
+            logger.warning(f"Error closing peer {peer_id}: {e}")
+        return True
+
+    async def close_owner(self, owner):
+        """Close every peer of a WebSocket session"""
+        for peer_id in list(self.by_owner.get(owner, ())):
+            await self.close(owner, peer_id)
+
+    async def close_all(self):
+        for owner, peer_id in list(self.peers):
+            await self.close(owner, peer_id)
+
+    async def reap_idle(self):
+        """Close unconnected peers idle for longer than the timeout; returns how many"""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [key for key, peer in self.peers.items()
+                if peer.last_active < cutoff and peer.pc.connectionState != 'connected']
+        for owner, peer_id in idle:
+            logger.info(f"Reaping idle peer {peer_id}")
+            await self.close(owner, peer_id)
+        self.stats['reaped'] += len(idle)
+        return len(idle)
+
+    def start(self):
+        if self.task is None and self.idle_timeout > 0:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.close_all()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                logger.error(f"Error reaping peers: {e}")
+
+    def counts(self):
+        """Live peer counts by connection state, plus lifetime counters"""
+        states = collections.Counter(peer.pc.connectionState for peer in self.peers.values())
+        return {
+            'peers': len(self.peers),
+            'clients': len(self.by_owner),
+            'max_peers': self.max_peers,
+            'states': dict(states),
+            **self.stats,
+        }
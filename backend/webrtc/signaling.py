@@ -1,49 +1,75 @@
-import asyncio
 import json
-import websockets
-from aiortc import RTCSessionDescription, RTCPeerConnection, RTCConfiguration, RTCIceServer
+from .peer_manager import PeerLimitError, PeerManager
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class WebRTCSignaling:
-    def __init__(self):
-        self.peer_connections = {}
+    # Client message types handled here (routed by the main WebSocket loop)
+    MESSAGE_TYPES = ('offer', 'answer', 'ice-candidate', 'close')
+    
+    def __init__(self, create_media=None, peers=None):
+        self.peers = peers or PeerManager()
+        # async create_media() -> AvatarMedia whose tracks each new peer receives
+        self.create_media = create_media
         
-    async def handle_signaling(self, websocket, path):
-        """Handle WebRTC signaling via WebSocket"""
+    async def handle_message(self, session, data):
+        """Handle one WebRTC signaling message from a client session"""
         try:
-            async for message in websocket:
-                data = json.loads(message)
+            if data['type'] == 'offer':
+                await self.handle_offer(session, data)
+            elif data['type'] == 'answer':
+                await self.handle_answer(session, data)
+            elif data['type'] == 'ice-candidate':
+                await self.handle_ice_candidate(session, data)
+            elif data['type'] == 'close':
+                await self.handle_close(session, data)
                 
-                if data['type'] == 'offer':
-                    await self.handle_offer(websocket, data)
-                elif data['type'] == 'answer':
-                    await self.handle_answer(data)
-                elif data['type'] == 'ice-candidate':
-                    await self.handle_ice_candidate(data)
-                elif data['type'] == 'close':
-                    await self.handle_close(data)
-                    
-        except websockets.exceptions.ConnectionClosed:
-            logger.info("WebSocket connection closed")
+        except PeerLimitError as e:
+            logger.warning(f"Refused peer {data.get('peer_id')}: {e}")
+            await session.websocket.send(json.dumps({
+                'type': 'error',
+                'error': str(e),
+                'peer_id': data.get('peer_id')
+            }))
             
-    async def handle_offer(self, websocket, data):
+    async def handle_offer(self, session, data):
         """Handle incoming WebRTC offer"""
+        # aiortc loads with the first call, not at server start
+        from aiortc import RTCPeerConnection, RTCSessionDescription
+        
         peer_id = data['peer_id']
+        self.peers.check_capacity(session.session_id, peer_id)
         
         # Create RTCPeerConnection
         pc = RTCPeerConnection()
-        self.peer_connections[peer_id] = pc
-        
-        # Set remote description
-        offer = RTCSessionDescription(sdp=data['sdp'], type=data['type'])
-        await pc.setRemoteDescription(offer)
-        
-        # Create answer
-        answer = await pc.createAnswer()
-        await pc.setLocalDescription(answer)
+        media = None
+        try:
+            # Set remote description
+            offer = RTCSessionDescription(sdp=data['sdp'], type=data['type'])
+            await pc.setRemoteDescription(offer)
+            
+            # Live avatar audio/video, answered on the offered transceivers
+            if self.create_media is not None:
+                media = await self.create_media()
+                offered = {t.kind for t in pc.getTransceivers()}
+                for track in (media.audio, media.video):
+                    if track.kind in offered:
+                        pc.addTrack(track)
+                
+            # Create answer (aiortc gathers ICE candidates into the SDP)
+            answer = await pc.createAnswer()
+            await pc.setLocalDescription(answer)
+            
+            # Re-checks the limits: other offers may have landed meanwhile
+            await self.peers.add(session.session_id, peer_id, pc, media)
+            
+        except Exception:
+            if media is not None:
+                media.close()
+            await pc.close()
+            raise
         
         # Send answer back
         response = {
@@ -51,42 +77,39 @@ class WebRTCSignaling:
             'peer_id': peer_id,
             'sdp': pc.localDescription.sdp
         }
-        await websocket.send(json.dumps(response))
+        await session.websocket.send(json.dumps(response))
         
-        # Handle ICE candidates
-        @pc.on('icecandidate')
-        async def on_icecandidate(candidate):
-            if candidate:
-                await websocket.send(json.dumps({
-                    'type': 'ice-candidate',
-                    'peer_id': peer_id,
-                    'candidate': {
-                        'candidate': candidate.candidate,
-                        'sdpMid': candidate.sdpMid,
-                        'sdpMLineIndex': candidate.sdpMLineIndex
-                    }
-                }))
-                
-    async def handle_answer(self, data):
+    async def handle_answer(self, session, data):
         """Handle answer from client"""
-        peer_id = data['peer_id']
-        pc = self.peer_connections.get(peer_id)
+        peer = self.peers.get(session.session_id, data['peer_id'])
         
-        if pc:
+        if peer:
+            from aiortc import RTCSessionDescription
             answer = RTCSessionDescription(sdp=data['sdp'], type=data['type'])
-            await pc.setRemoteDescription(answer)
+            await peer.pc.setRemoteDescription(answer)
             
-    async def handle_ice_candidate(self, data):
+    async def handle_ice_candidate(self, session, data):
         """Handle ICE candidate from client"""
-        peer_id = data['peer_id']
-        pc = self.peer_connections.get(peer_id)
+        peer = self.peers.get(session.session_id, data['peer_id'])
+        candidate = data.get('candidate')
         
-        if pc and data['candidate']:
-            await pc.addIceCandidate(data['candidate'])
+        if peer and candidate and candidate.get('candidate'):
+            from aiortc.sdp import candidate_from_sdp
+            # Browser candidates are {'candidate': 'candidate:...', 'sdpMid', 'sdpMLineIndex'}
+            ice = candidate_from_sdp(candidate['candidate'].split(':', 1)[1])
+            ice.sdpMid = candidate.get('sdpMid')
+            ice.sdpMLineIndex = candidate.get('sdpMLineIndex')
+            await peer.pc.addIceCandidate(ice)
             
-    async def handle_close(self, data):
+    async def handle_close(self, session, data):
         """Close peer connection"""
-        peer_id = data['peer_id']
-        if peer_id in self.peer_connections:
-            await self.peer_connections[peer_id].close()
-            del self.peer_connections[peer_id]
\ No newline at end of file
+        await self.peers.close(session.session_id, data['peer_id'])
+        
+    def get_media(self, session, peer_id):
+        """Avatar media of a live peer owned by `session`, or None"""
+        peer = self.peers.get(session.session_id, peer_id) if peer_id else None
+        return peer.media if peer is not None else None
+        
+    async def close_session(self, session):
+        """Close every peer opened over a WebSocket session"""
+        await self.peers.close_owner(session.session_id)
@@ -0,0 +1,53 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RenderCancelled(Exception):
+    """Raised inside a render whose request was cancelled or superseded"""
+
+class CancelFlags:
+    """Per-job cancel flags in shared memory, polled by render workers.
+
+    The event loop takes a free slot for each render and sets its byte to
+    cancel; the worker (thread or process) checks the byte once per frame.
+    A slot is only reused after the worker has finished with it.
+    """
+
+    def __init__(self, mp_context, slots):
+        self.flags = mp_context.RawArray('B', slots)
+        self.free = list(range(slots))
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Free slot cleared for a new job, or None when all are in use"""
+        with self.lock:
+            if not self.free:
+                return None
+            slot = self.free.pop()
+        self.flags[slot] = 0
+        return slot
+
+    def release(self, slot):
+        # Called from pool threads when the job's future completes
+        with self.lock:
+            self.free.append(slot)
+
+    def cancel(self, slot):
+        self.flags[slot] = 1
+
+class CancelToken:
+    """Worker-side view of one job's flag"""
+
+    __slots__ = ('flags', 'slot')
+
+    def __init__(self, flags, slot):
+        self.flags = flags
+        self.slot = slot
+
+    def cancelled(self):
+        return self.flags[self.slot] != 0
+
+    def check(self):
+        if self.flags[self.slot]:
+            raise RenderCancelled("Render cancelled")
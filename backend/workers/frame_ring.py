@@ -0,0 +1,132 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from ..config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FrameRingClosed(Exception):
+    """The other side of a FrameRing aborted"""
+
+class FrameRing:
+    """Fixed-size ring of frame slots in shared memory.
+
+    One producer fills slots in order and one consumer reads them in the
+    same order, both through NumPy views of the shared block, so a frame
+    is written once and never copied or pickled on its way to the
+    encoder. A slot is recycled once the consumer asks for the next frame;
+    a producer that gets `slots` frames ahead blocks (backpressure).
+
+    Producer: `acquire()` a slot view, write it, `publish()`; `finish()` at
+    the end, `abort()` on error. Consumer: iterate the ring. The producer
+    and consumer may be threads of one process or separate processes (the
+    ring pickles into spawned children; child processes must `close()`
+    their copy, the creating side also unlinks the block).
+
+    `template` pre-fills every slot, for producers that rewrite only part
+    of a frame (MouthAtlas.compose rewrites just the mouth region).
+    """
+
+    POLL_SECONDS = 0.1  # How often blocked sides look for an abort
+
+    def __init__(self, shape, slots=Config.FRAME_QUEUE_SIZE, template=None, mp_context=None):
+        mp_context = mp_context or multiprocessing.get_context('spawn')
+        self.shape = tuple(shape)
+        self.slot_count = max(int(slots), 2)
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(self.shape)) * self.slot_count
+        )
+        self.owner = True
+
+        self.free = mp_context.Semaphore(self.slot_count)
+        self.filled = mp_context.Semaphore(0)
+        # [frames in the stream once finished (-1 before), aborted]
+        self.state = mp_context.RawArray('q', [-1, 0])
+        self.attach()
+        if template is not None:
+            np.copyto(self.frames, template)
+
+    def attach(self):
+        """Views of the shared block and per-side positions"""
+        self.frames = np.ndarray((self.slot_count,) + self.shape, dtype=np.uint8, buffer=self.memory.buf)
+        # One view object per slot: producers can hand them out as buffers
+        self.slots = list(self.frames)
+        self.written = 0
+        self.read = 0
+
+    def __getstate__(self):
+        return {
+            'name': self.memory.name, 'shape': self.shape, 'slot_count': self.slot_count,
+            'free': self.free, 'filled': self.filled, 'state': self.state,
+        }
+
+    def __setstate__(self, state):
+        name = state.pop('name')
+        self.__dict__.update(state)
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.owner = False
+        self.attach()
+
+    @property
+    def aborted(self):
+        return bool(self.state[1])
+
+    def wait(self, semaphore):
+        """Acquire `semaphore`, raising FrameRingClosed once the ring is aborted"""
+        while not semaphore.acquire(timeout=self.POLL_SECONDS):
+            if self.aborted:
+                raise FrameRingClosed("Frame ring aborted")
+        if self.aborted:
+            raise FrameRingClosed("Frame ring aborted")
+
+    def acquire(self):
+        """Next slot to write, blocking while the consumer is `slots` frames behind"""
+        self.wait(self.free)
+        return self.slots[self.written % self.slot_count]
+
+    def publish(self):
+        """Hand the slot from the last acquire() to the consumer"""
+        self.written += 1
+        self.filled.release()
+
+    def finish(self):
+        """No more frames; the consumer stops after the published ones"""
+        self.state[0] = self.written
+        self.filled.release()
+
+    def abort(self):
+        """Stop both sides; blocked calls raise FrameRingClosed"""
+        self.state[1] = 1
+        self.free.release()
+        self.filled.release()
+
+    def __iter__(self):
+        """Consumer side: frame views in order, each valid until the next is requested"""
+        while True:
+            self.wait(self.filled)
+            if self.read == self.state[0]:
+                return
+            yield self.slots[self.read % self.slot_count]
+            self.read += 1
+            self.free.release()
+
+    def close(self):
+        """Drop this side's views, and remove the block on the creating side"""
+        self.frames = None
+        self.slots = []
+        try:
+            self.memory.close()
+        except BufferError:
+            # A frame view is still referenced; the mapping goes with it
+            pass
+        if self.owner:
+            self.memory.unlink()
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
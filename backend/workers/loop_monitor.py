@@ -0,0 +1,78 @@
+import asyncio
+import collections
+import time
+from ..config import Config
+from ..telemetry.metrics import LOOP_LAG_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed-interval sleep.
+
+    A responsive loop reports lag close to zero; a blocking call on the loop
+    shows up as lag roughly equal to its duration.
+    """
+
+    def __init__(self, interval=Config.LOOP_LAG_INTERVAL, log_interval=Config.LOOP_LAG_LOG_INTERVAL,
+                 window=600):
+        self.interval = interval
+        self.log_interval = log_interval
+        self.samples = collections.deque(maxlen=window)
+        self.max_lag = 0.0
+        self.count = 0
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        last_log = time.perf_counter()
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.record(max(now - expected, 0.0))
+
+            if self.log_interval and now - last_log >= self.log_interval:
+                last_log = now
+                stats = self.stats()
+                logger.info(
+                    f"Event loop lag: p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, "
+                    f"max {stats['max_ms']:.1f} ms"
+                )
+
+    def record(self, lag):
+        LOOP_LAG_SECONDS.observe(lag)
+        self.samples.append(lag)
+        self.count += 1
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(int(q * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+    def stats(self):
+        """Lag summary in milliseconds over the recent window"""
+        return {
+            'samples': self.count,
+            'last_ms': (self.samples[-1] if self.samples else 0.0) * 1000,
+            'p50_ms': self.percentile(0.50) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max_lag * 1000,
+        }
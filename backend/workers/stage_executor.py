@@ -0,0 +1,228 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ..config import Config
+from ..telemetry.tracing import record_render
+from .cancellation import CancelFlags, CancelToken
+from .frame_ring import FrameRing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Lip sync + encoder instances owned by a render worker process
+_worker_state = {}
+
+def init_render_worker(output_path, cancel_flags=None, warmed=None):
+    """Process pool initializer: one avatar registry and encoder per worker
+
+    Avatars load on first use from the memory-mapped assets, so workers
+    share those pages through the OS cache. `cancel_flags` is the shared
+    array behind CancelFlags; `warmed` counts workers done warming up.
+    """
+    from ..avatar.avatar_registry import AvatarRegistry
+    from ..avatar.avatar_renderer import AvatarRenderer
+
+    _worker_state['avatars'] = AvatarRegistry()
+    _worker_state['renderer'] = AvatarRenderer(output_path)
+    _worker_state['cancel_flags'] = cancel_flags
+    _worker_state['warmed'] = warmed
+    logger.info(f"Render worker {os.getpid()} ready")
+
+def timed_frames(frames, stats, token=None):
+    """Pass frames through, adding the time spent producing them to `stats`
+
+    Raises RenderCancelled between frames once `token` is cancelled.
+    """
+    iterator = iter(frames)
+    while True:
+        if token is not None:
+            token.check()
+        started = time.perf_counter()
+        try:
+            frame = next(iterator)
+        except StopIteration:
+            stats['lipsync_seconds'] += time.perf_counter() - started
+            return
+        stats['lipsync_seconds'] += time.perf_counter() - started
+        stats['frames'] += 1
+        yield frame
+
+def render_avatar_video(lipsync, renderer, viseme_sequence, audio_data, fps=Config.VIDEO_FPS,
+                        fragmented=False, stats=None, token=None):
+    """Lip sync + encode in one call so frames never leave the worker
+
+    `stats` (a dict) receives frames, lipsync_seconds and render_seconds.
+    A cancelled `token` (CancelToken) stops the frame loop and the encoder.
+    """
+    if token is not None:
+        token.check()
+    stats = {} if stats is None else stats
+    stats.update(frames=0, lipsync_seconds=0.0)
+    started = time.perf_counter()
+    try:
+        if Config.FRAME_STREAMING or fragmented:
+            # Frames are composed straight into the ring slots the encoder reads
+            base_frame = lipsync.atlas.base_frame
+            with FrameRing(base_frame.shape, Config.FRAME_QUEUE_SIZE, template=base_frame) as ring:
+                frames = lipsync.stream_frames(viseme_sequence, fps, buffers=ring.slots)
+                return renderer.render_video_stream(timed_frames(frames, stats, token), audio_data, fps,
+                                                    fragmented=fragmented, ring=ring)
+
+        frames = lipsync.apply_lip_sync(viseme_sequence, fps)
+        if token is not None:
+            token.check()
+        stats['lipsync_seconds'] = time.perf_counter() - started
+        stats['frames'] = len(frames)
+        return renderer.render_video(frames, audio_data, fps)
+    finally:
+        stats['render_seconds'] = time.perf_counter() - started
+
+def render_with_stats(lipsync, renderer, viseme_sequence, audio_data, fps=Config.VIDEO_FPS,
+                      fragmented=False, token=None):
+    """render_avatar_video returning (video path, stats)"""
+    stats = {}
+    video_path = render_avatar_video(
+        lipsync, renderer, viseme_sequence, audio_data, fps, fragmented, stats, token
+    )
+    return video_path, stats
+
+def render_in_worker(viseme_sequence, audio_data, fps=Config.VIDEO_FPS, fragmented=False,
+                     avatar_id=None, cancel_slot=None):
+    """Process pool entry point; only the visemes, audio, avatar id and output path are pickled"""
+    token = None
+    if cancel_slot is not None and _worker_state['cancel_flags'] is not None:
+        token = CancelToken(_worker_state['cancel_flags'], cancel_slot)
+    return render_with_stats(
+        _worker_state['avatars'].get(avatar_id), _worker_state['renderer'], viseme_sequence,
+        audio_data, fps, fragmented, token
+    )
+
+def warm_render_worker(avatar_ids, workers, timeout=30):
+    """Load avatars in a render worker ahead of its first job
+
+    Holds the worker until `workers` warm-up jobs are running at once, so
+    each job lands on a different worker instead of one fast worker
+    taking them all.
+    """
+    for avatar_id in avatar_ids:
+        _worker_state['avatars'].get(avatar_id)
+
+    warmed = _worker_state['warmed']
+    with warmed.get_lock():
+        warmed.value += 1
+    deadline = time.monotonic() + timeout
+    while warmed.value < workers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return os.getpid()
+
+class StageExecutor:
+    """Per-stage worker pools that keep blocking work off the event loop.
+
+    Stages:
+    - render: lip sync + encode (process pool by default, frames stay in the worker)
+    - stt:    audio decoding and speech recognition (threads; ffmpeg/network bound)
+    - io:     TTS synthesis and cache file access (threads)
+    """
+
+    def __init__(self, render_workers=Config.RENDER_WORKERS, render_pool=Config.RENDER_POOL,
+                 stt_workers=Config.STT_WORKERS, io_workers=Config.IO_WORKERS,
+                 output_path=Config.OUTPUT_PATH, cancel_slots=Config.RENDER_CANCEL_SLOTS):
+        self.render_pool = render_pool
+        mp_context = multiprocessing.get_context('spawn')
+        # Lets a cancelled request stop its render mid-frame-loop
+        self.cancel_flags = CancelFlags(mp_context, cancel_slots)
+        self.warmed = mp_context.Value('i', 0)
+        self.pools = {
+            'stt': ThreadPoolExecutor(max_workers=stt_workers, thread_name_prefix='stt'),
+            'io': ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='io'),
+        }
+
+        if render_pool == 'process':
+            self.pools['render'] = ProcessPoolExecutor(
+                max_workers=render_workers,
+                mp_context=mp_context,
+                initializer=init_render_worker,
+                initargs=(output_path, self.cancel_flags.flags, self.warmed),
+            )
+        else:
+            self.pools['render'] = ThreadPoolExecutor(
+                max_workers=render_workers, thread_name_prefix='render'
+            )
+
+        self.sizes = {'render': render_workers, 'stt': stt_workers, 'io': io_workers}
+        self.active = {stage: 0 for stage in self.pools}
+
+    async def warm_up(self, avatar_ids=()):
+        """Spawn every render worker process now and load `avatar_ids` in each
+
+        Process pools start workers on demand, so without this the first
+        requests pay for the spawn, the imports and the avatar loads.
+        Returns the number of workers reached.
+        """
+        if self.render_pool != 'process':
+            return 0
+        loop = asyncio.get_running_loop()
+        workers = self.sizes['render']
+        pids = await asyncio.gather(*(
+            loop.run_in_executor(self.pools['render'], warm_render_worker, list(avatar_ids), workers)
+            for _ in range(workers)
+        ))
+        return len(set(pids))
+
+    async def run(self, stage, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool for `stage`"""
+        loop = asyncio.get_running_loop()
+        self.active[stage] += 1
+        try:
+            return await loop.run_in_executor(self.pools[stage], functools.partial(fn, *args, **kwargs))
+        finally:
+            self.active[stage] -= 1
+
+    async def render(self, viseme_sequence, audio_data, lipsync=None, renderer=None,
+                     fps=Config.VIDEO_FPS, fragmented=False, avatar_id=None):
+        """Lip sync and encode a video on the render pool, returning its path
+
+        Process workers look `avatar_id` up in their own registry; thread
+        workers use the `lipsync` engine passed in. Cancelling the caller
+        sets the job's cancel flag, so the worker stops at the next frame
+        and kills its encoder instead of finishing a render nobody wants.
+        """
+        slot = self.cancel_flags.acquire()
+        if self.render_pool == 'process':
+            future = self.pools['render'].submit(
+                render_in_worker, viseme_sequence, audio_data, fps, fragmented, avatar_id, slot
+            )
+        else:
+            token = CancelToken(self.cancel_flags.flags, slot) if slot is not None else None
+            future = self.pools['render'].submit(
+                render_with_stats, lipsync, renderer, viseme_sequence, audio_data, fps, fragmented, token
+            )
+        if slot is not None:
+            # Reusable only once the worker is done with it
+            future.add_done_callback(lambda _: self.cancel_flags.release(slot))
+
+        self.active['render'] += 1
+        try:
+            video_path, stats = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if slot is not None:
+                self.cancel_flags.cancel(slot)
+            raise
+        finally:
+            self.active['render'] -= 1
+        record_render(stats)
+        return video_path
+
+    def stats(self):
+        """Pool sizes and in-flight jobs per stage"""
+        return {
+            stage: {'workers': self.sizes[stage], 'active': self.active[stage]}
+            for stage in self.pools
+        }
+
+    def shutdown(self, wait=True):
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,103 @@
+"""
+Encoder backend benchmark
+
+Renders the same synthetic utterance through the moviepy and ffmpeg pipe
+encoders and prints the encode cost per frame.
+
+Usage: python -m benchmarks.encoders [--seconds 20] [--json results.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from backend.avatar.avatar_renderer import AvatarRenderer
+from backend.config import Config
+from backend.lipsync.lip_sync_engine import LipSyncEngine
+from backend.workers.frame_ring import FrameRing
+
+def synthetic_visemes(engine, seconds, step=0.08):
+    """Cycle through every mouth shape for `seconds`"""
+    names = list(engine.mouth_shapes)
+    count = int(seconds / step)
+    return [
+        {'viseme': names[i % len(names)], 'start': i * step, 'end': (i + 1) * step, 'blend': 0.1}
+        for i in range(count)
+    ]
+
+def synthetic_audio(seconds, sample_rate=24000):
+    """In-memory WAV tone standing in for TTS output"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def run(seconds, fps=Config.VIDEO_FPS):
+    engine = LipSyncEngine()
+    visemes = synthetic_visemes(engine, seconds)
+    audio = synthetic_audio(seconds)
+
+    cases = [
+        ('moviepy list', 'moviepy', None, False),
+        ('moviepy stream', 'moviepy', None, True),
+        ('ffmpeg realtime', 'ffmpeg', 'realtime', True),
+        ('ffmpeg archival', 'ffmpeg', 'archival', True),
+    ]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='encoder-bench-') as output_path:
+        for label, encoder, preset, streaming in cases:
+            renderer = AvatarRenderer(output_path=output_path, encoder=encoder,
+                                      preset=preset or Config.VIDEO_PRESET)
+            started = time.perf_counter()
+            if streaming:
+                base_frame = engine.atlas.base_frame
+                with FrameRing(base_frame.shape, Config.FRAME_QUEUE_SIZE, template=base_frame) as ring:
+                    frames = engine.stream_frames(visemes, fps, buffers=ring.slots)
+                    video_path = renderer.render_video_stream(frames, audio, fps, ring=ring)
+            else:
+                video_path = renderer.render_video(engine.apply_lip_sync(visemes, fps), audio, fps)
+            elapsed = time.perf_counter() - started
+
+            stats = renderer.last_stats or {}
+            results.append({
+                'case': label,
+                'ok': video_path is not None,
+                'frames': stats.get('frames', 0),
+                'total_seconds': round(elapsed, 3),
+                'encode_ms_per_frame': round(stats.get('ms_per_frame', 0.0), 3),
+                'bytes': os.path.getsize(video_path) if video_path else 0,
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark video encoder backends")
+    parser.add_argument('--seconds', type=float, default=20.0, help="utterance length")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.seconds)
+
+    print(f"{'case':<18}{'frames':>8}{'total s':>10}{'ms/frame':>10}{'KB':>10}")
+    for r in results:
+        status = '' if r['ok'] else '  FAILED'
+        print(f"{r['case']:<18}{r['frames']:>8}{r['total_seconds']:>10.2f}"
+              f"{r['encode_ms_per_frame']:>10.2f}{r['bytes'] / 1024:>10.0f}{status}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
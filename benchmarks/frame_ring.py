@@ -0,0 +1,123 @@
+"""
+Frame hand-off benchmark: shared-memory ring vs pickled queue
+
+A producer process composes lip-sync frames and hands them to this
+process, once through a multiprocessing.Queue (every frame pickled and
+copied through a pipe) and once through a FrameRing (frames composed
+straight into shared slots). The consumer reads every byte of each frame,
+as an encoder would. Reports frames/s and CPU time on each side.
+
+Usage: python -m benchmarks.frame_ring [--frames 3000] [--json results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+import zlib
+
+import numpy as np
+
+from backend.config import Config
+from backend.lipsync.lip_sync_engine import LipSyncEngine
+from backend.workers.frame_ring import FrameRing
+
+def viseme_track(frames, fps=Config.VIDEO_FPS):
+    """Alternating open/closed mouth long enough for `frames` frames"""
+    names = ['viseme_aa', 'viseme_m', 'viseme_o', 'viseme_silence']
+    step = 0.1
+    count = int(frames / fps / step) + 1
+    return [{'viseme': names[i % len(names)], 'start': i * step, 'end': (i + 1) * step, 'blend': 0.5}
+            for i in range(count)]
+
+def produce_queue(frame_queue, frames, cpu):
+    engine = LipSyncEngine()
+    started = time.process_time()
+    # New array per frame: put() pickles in a feeder thread, after the loop moves on
+    for index, frame in enumerate(engine.stream_frames(viseme_track(frames))):
+        if index == frames:
+            break
+        frame_queue.put(frame)
+    frame_queue.put(None)
+    cpu.value = time.process_time() - started
+
+def produce_ring(ring, frames, cpu):
+    engine = LipSyncEngine()
+    started = time.process_time()
+    written = 0
+    stream = engine.stream_frames(viseme_track(frames), buffers=ring.slots)
+    while written < frames:
+        ring.acquire()
+        next(stream)  # Composes into the acquired slot
+        ring.publish()
+        written += 1
+    ring.finish()
+    cpu.value = time.process_time() - started
+    stream.close()
+    ring.close()
+
+def queued_frames(frame_queue):
+    while True:
+        frame = frame_queue.get()
+        if frame is None:
+            return
+        yield frame
+
+def consume(frames):
+    """Read every byte of each frame, as the encoder pipe would"""
+    count = 0
+    for frame in frames:
+        zlib.crc32(frame)
+        count += 1
+    return count
+
+def run_case(name, frames, mp_context, base_frame):
+    cpu = mp_context.Value('d', 0.0)
+    consumer_started = time.process_time()
+    started = time.perf_counter()
+
+    if name == 'queue':
+        frame_queue = mp_context.Queue(maxsize=Config.FRAME_QUEUE_SIZE)
+        process = mp_context.Process(target=produce_queue, args=(frame_queue, frames, cpu))
+        process.start()
+        count = consume(queued_frames(frame_queue))
+        process.join()
+    else:
+        with FrameRing(base_frame.shape, Config.FRAME_QUEUE_SIZE, template=base_frame,
+                       mp_context=mp_context) as ring:
+            process = mp_context.Process(target=produce_ring, args=(ring, frames, cpu))
+            process.start()
+            count = consume(ring)
+            process.join()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'case': name,
+        'frames': count,
+        'frames_per_second': round(count / elapsed, 1),
+        'producer_cpu_ms_per_frame': round(cpu.value * 1000 / max(count, 1), 3),
+        'consumer_cpu_ms_per_frame': round((time.process_time() - consumer_started) * 1000 / max(count, 1), 3),
+        'mb_per_frame': round(base_frame.nbytes / 1e6, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare frame hand-off between processes")
+    parser.add_argument('--frames', type=int, default=3000, help="frames per case")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    mp_context = multiprocessing.get_context('spawn')
+    base_frame = np.ascontiguousarray(LipSyncEngine().atlas.base_frame)
+    results = [run_case(name, args.frames, mp_context, base_frame) for name in ('queue', 'ring')]
+
+    for r in results:
+        print(f"{r['case']:<6} {r['frames']} frames  {r['frames_per_second']:>8.1f} frames/s  "
+              f"producer {r['producer_cpu_ms_per_frame']:.3f} ms/frame  "
+              f"consumer {r['consumer_cpu_ms_per_frame']:.3f} ms/frame")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Import-time budget for the avatar server
+
+Imports each entry module in a fresh interpreter with `-X importtime` and
+reports its cumulative import time (median over --repeat runs), the wall
+time of the whole interpreter start and the slowest dependencies.
+
+Usage:
+    python -m benchmarks.import_time [--repeat 5] [--budget-ms 400] [--json results.json]
+
+The run fails (exit code 1) when a module is over budget, or when it
+eagerly imports one of the heavy dependencies that are meant to load on
+first use.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Entry points: the server, and what every spawned render worker imports
+MODULES = ('backend.main', 'backend.workers.stage_executor')
+
+# Loaded on first use; importing any of these at startup is a regression
+LAZY_MODULES = ('cv2', 'moviepy', 'aiortc', 'av', 'speech_recognition', 'pydub', 'gtts', 'aiohttp')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us, depth)} from `-X importtime` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+def measure(module):
+    """One fresh-interpreter import: (wall ms, parsed importtime)"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=ROOT, stderr=subprocess.PIPE, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return wall_ms, parse_importtime(result.stderr)
+
+def run(repeat, top=8):
+    report = {'python': sys.version.split()[0], 'results': []}
+    for module in MODULES:
+        walls = []
+        imports = []
+        for _ in range(repeat):
+            wall_ms, modules = measure(module)
+            walls.append(wall_ms)
+            imports.append(modules)
+
+        import_ms = [modules[module][1] / 1000 for modules in imports]
+        median_run = imports[import_ms.index(statistics.median_low(import_ms))]
+        # Heaviest direct and indirect dependencies by their own cumulative time
+        slowest = sorted(
+            ((name, cumulative / 1000) for name, (_, cumulative, depth) in median_run.items()
+             if name != module and depth <= 2),
+            key=lambda item: item[1], reverse=True
+        )[:top]
+        report['results'].append({
+            'module': module,
+            'import_ms': round(statistics.median(import_ms), 1),
+            'process_ms': round(statistics.median(walls), 1),
+            'modules_imported': len(median_run),
+            'eager_heavy': sorted(name for name in LAZY_MODULES if name in median_run),
+            'slowest': [{'module': name, 'ms': round(ms, 1)} for name, ms in slowest],
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure server import time against a budget")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per module (median is kept)")
+    parser.add_argument('--budget-ms', type=float, default=400,
+                        help="max cumulative import time per module (default 400)")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    report['budget_ms'] = args.budget_ms
+
+    failures = []
+    for r in report['results']:
+        print(f"{r['module']}: import {r['import_ms']:.1f} ms, process {r['process_ms']:.1f} ms, "
+              f"{r['modules_imported']} modules")
+        for dep in r['slowest']:
+            print(f"    {dep['ms']:>8.1f} ms  {dep['module']}")
+        if r['import_ms'] > args.budget_ms:
+            failures.append(f"{r['module']} imports in {r['import_ms']:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if r['eager_heavy']:
+            failures.append(f"{r['module']} eagerly imports {', '.join(r['eager_heavy'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"All modules within {args.budget_ms:.0f} ms and free of eager heavy imports")
+
+if __name__ == "__main__":
+    main()
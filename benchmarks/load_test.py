@@ -0,0 +1,329 @@
+"""
+Multi-client WebSocket load test and capacity report
+
+Starts a server process with the offline TTS stand-in and a canned STT
+recognizer (or targets --url), then opens N simulated clients per load
+level. Each client replays `llm_response` and binary `audio` messages at
+--rate requests/second with texts of realistic lengths, waiting for each
+response before sending the next (the protocol answers in order).
+
+Per level it reports throughput, error rate, time-to-first-byte and
+end-to-end latency percentiles, plus the server's event-loop lag when
+its /metrics endpoint is reachable. The capacity is the largest level
+whose end-to-end p95 and error rate stay within --slo-p95 and
+--max-error-rate.
+
+Usage:
+    python -m benchmarks.load_test [--clients 1,2,4,8] [--duration 20] [--rate 0.2]
+    python -m benchmarks.load_test --url ws://host:8765 --metrics-url http://host:8766/metrics
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import websockets
+
+from backend.protocol.binary_messages import (
+    MSG_AUDIO, MSG_VIDEO, PROTOCOL_VERSION, decode_message, encode_message
+)
+from benchmarks.pipeline import TEXTS
+
+# What the canned recognizer "hears" in every uploaded recording
+OFFLINE_TRANSCRIPT = "namaste, kaise ho?"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def serve(port, http_port):
+    """Run backend.main with offline stand-ins (child process entry point)"""
+    from backend import main as server
+
+    try:
+        asyncio.run(server.main())
+    except KeyboardInterrupt:
+        pass
+
+def start_server(port, http_port, render_cache=False):
+    env = {
+        **os.environ,
+        'TTS_BACKEND': 'offline',
+        'STT_BACKEND': 'offline',
+        'STT_OFFLINE_TRANSCRIPT': OFFLINE_TRANSCRIPT,
+        'PORT': str(port),
+        'HTTP_PORT': str(http_port),
+        'RENDER_CACHE_ENABLED': 'true' if render_cache else 'false',
+        'PREWARM_PHRASES_FILE': '',
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.load_test', '--serve', str(port), str(http_port)],
+        env=env
+    )
+
+async def wait_for_server(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with websockets.connect(url):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+            await asyncio.sleep(0.5)
+
+def recording():
+    """Browser-style webm/opus upload of a synthesized utterance"""
+    from backend.tts.synthesizers import OfflineSynthesizer
+    from benchmarks.pipeline import to_webm
+
+    audio = OfflineSynthesizer().synthesize(OFFLINE_TRANSCRIPT, 'hi', 'co.in', False)
+    return to_webm(audio)
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else None
+
+def download(url):
+    """Fetch a video link, as the browser does before playing it; returns the size"""
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return len(response.read())
+
+async def await_downloads(downloads):
+    """None once every linked video has arrived, else the first error"""
+    try:
+        await asyncio.gather(*downloads)
+    except OSError as e:
+        return f"download failed: {e}"
+    return None
+
+async def await_response(ws, kind, request_id, sent_at, timeout):
+    """(ttfb seconds, total seconds, error or None) for one request
+
+    Responses that arrive as links count as done once they are downloaded.
+    """
+    ttfb = None
+    deadline = sent_at + timeout
+    downloads = []
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return ttfb, None, 'timeout'
+        try:
+            message = await asyncio.wait_for(ws.recv(), remaining)
+        except asyncio.TimeoutError:
+            return ttfb, None, 'timeout'
+        now = time.perf_counter()
+
+        if isinstance(message, bytes):
+            msg = decode_message(message)
+            if msg.request_id != request_id:
+                continue
+            ttfb = ttfb or now - sent_at
+            if msg.msg_type == MSG_VIDEO and msg.final:
+                return ttfb, now - sent_at, None
+            continue
+
+        data = json.loads(message)
+        if data.get('request_id') != request_id:
+            continue
+        ttfb = ttfb or now - sent_at
+        if data['type'] == 'error':
+            return ttfb, now - sent_at, data.get('error', 'error')
+        if data['type'] == 'text':
+            return ttfb, now - sent_at, None if data.get('text') else 'not recognized'
+        if data['type'] == 'video' and data.get('url'):
+            error = await await_downloads([asyncio.to_thread(download, data['url'])])
+            return ttfb, time.perf_counter() - sent_at, error
+        if data['type'] == 'segment' and data.get('url'):
+            downloads.append(asyncio.ensure_future(asyncio.to_thread(download, data['url'])))
+        if data['type'] == 'segments_done':
+            error = await await_downloads(downloads)
+            if error is None and not data.get('sent'):
+                error = 'no segments'
+            return ttfb, time.perf_counter() - sent_at, error
+
+async def run_client(url, client_id, stop_at, args, audio, results):
+    rng = random.Random(args.seed + client_id)
+    texts = list(TEXTS.values())
+    interval = 1 / args.rate
+    request_id = client_id * 1_000_000
+
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({'type': 'hello', 'protocol': PROTOCOL_VERSION}))
+            await ws.recv()
+
+            # Stagger clients so they do not all fire in the same instant
+            next_at = time.perf_counter() + rng.uniform(0, interval)
+            while next_at < stop_at:
+                await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+                request_id += 1
+                kind = 'audio' if rng.random() < args.audio_share else 'llm_response'
+                sent_at = time.perf_counter()
+
+                if kind == 'audio':
+                    await ws.send(encode_message(MSG_AUDIO, request_id, audio))
+                else:
+                    await ws.send(json.dumps({
+                        'type': 'llm_response',
+                        'request_id': request_id,
+                        'text': rng.choice(texts),
+                        'stream': args.stream,
+                    }))
+
+                ttfb, total, error = await await_response(ws, kind, request_id, sent_at, args.timeout)
+                results.append({'kind': kind, 'ttfb': ttfb, 'total': total, 'error': error})
+                # Closed loop: a slow response delays the next request instead of queueing it
+                next_at = max(next_at + interval, time.perf_counter())
+
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        results.append({'kind': 'connect', 'ttfb': None, 'total': None, 'error': str(e)})
+
+async def warm_up(url, timeout):
+    """One untimed request so worker start-up and avatar loading are not measured"""
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({'type': 'hello', 'protocol': PROTOCOL_VERSION}))
+        await ws.recv()
+        await ws.send(json.dumps({'type': 'llm_response', 'request_id': 1, 'text': TEXTS['roman_short']}))
+        await await_response(ws, 'llm_response', 1, time.perf_counter(), timeout)
+
+def scrape_loop_lag(metrics_url):
+    """Server event-loop lag p99 (ms) from /metrics, if reachable"""
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=5) as response:
+            body = response.read().decode()
+    except OSError:
+        return None
+    for line in body.splitlines():
+        if line.startswith('avatar_event_loop_lag_recent_ms{quantile="p99"}'):
+            return round(float(line.split()[-1]), 1)
+    return None
+
+async def run_level(url, clients, args, audio):
+    results = []
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    await asyncio.gather(*(run_client(url, i, stop_at, args, audio, results) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r['error'] is None]
+    errors = [r for r in results if r['error'] is not None]
+    ttfb = [r['ttfb'] for r in ok]
+    total = [r['total'] for r in ok]
+    by_kind = {}
+    for r in results:
+        entry = by_kind.setdefault(r['kind'], {'requests': 0, 'errors': 0})
+        entry['requests'] += 1
+        entry['errors'] += r['error'] is not None
+
+    return {
+        'clients': clients,
+        'requests': len(results),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(results), 3) if results else None,
+        'throughput_rps': round(len(ok) / elapsed, 2),
+        'ttfb_ms': {q: percentile(ttfb, q) for q in (50, 95, 99)},
+        'latency_ms': {q: percentile(total, q) for q in (50, 95, 99)},
+        'server_loop_lag_p99_ms': scrape_loop_lag(args.metrics_url) if args.metrics_url else None,
+        'by_kind': by_kind,
+        'error_samples': sorted({r['error'] for r in errors})[:5],
+    }
+
+def within_slo(level, args):
+    p95 = level['latency_ms'][95]
+    return (level['error_rate'] is not None and level['error_rate'] <= args.max_error_rate
+            and p95 is not None and p95 <= args.slo_p95 * 1000)
+
+async def run(args):
+    audio = recording() if args.audio_share > 0 else b''
+    await wait_for_server(args.url)
+    await warm_up(args.url, args.timeout)
+    levels = []
+    for clients in args.clients:
+        level = await run_level(args.url, clients, args, audio)
+        level['within_slo'] = within_slo(level, args)
+        levels.append(level)
+        print(f"{clients:>4} clients  {level['requests']:>5} req  {level['throughput_rps']:>6.2f} req/s  "
+              f"err {level['error_rate'] or 0:>6.1%}  ttfb p50 {level['ttfb_ms'][50]} ms  "
+              f"e2e p50/p95/p99 {level['latency_ms'][50]}/{level['latency_ms'][95]}/{level['latency_ms'][99]} ms"
+              f"{'' if level['within_slo'] else '  OVER SLO'}", flush=True)
+        # Let queued work drain so levels do not bleed into each other
+        await asyncio.sleep(args.cooldown)
+
+    passing = [level['clients'] for level in levels if level['within_slo']]
+    return {
+        'meta': {
+            'url': args.url,
+            'duration': args.duration,
+            'rate_per_client': args.rate,
+            'audio_share': args.audio_share,
+            'stream': args.stream,
+            'slo_p95_seconds': args.slo_p95,
+            'max_error_rate': args.max_error_rate,
+            'cpus': os.cpu_count(),
+        },
+        'levels': levels,
+        'capacity_clients': max(passing) if passing else 0,
+    }
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]), int(sys.argv[3]))
+        return
+
+    parser = argparse.ArgumentParser(description="Load test the avatar WebSocket server")
+    parser.add_argument('--url', help="server to test (default: start a local offline server)")
+    parser.add_argument('--metrics-url', help="server /metrics for loop lag (default: the local server's)")
+    parser.add_argument('--clients', default='1,2,4,8', help="comma-separated client counts, one level each")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds per level")
+    parser.add_argument('--rate', type=float, default=0.2, help="requests per second per client")
+    parser.add_argument('--audio-share', type=float, default=0.3, help="fraction of requests that upload audio")
+    parser.add_argument('--stream', action='store_true', help="ask for segmented responses")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds before a request counts as failed")
+    parser.add_argument('--cooldown', type=float, default=2.0, help="pause between levels")
+    parser.add_argument('--slo-p95', type=float, default=3.0, help="end-to-end p95 target in seconds")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--render-cache', action='store_true',
+                        help="keep the render cache on in the local server (repeated texts become hits)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the report to this file")
+    args = parser.parse_args()
+    args.clients = [int(n) for n in args.clients.split(',')]
+
+    server = None
+    if args.url is None:
+        port, http_port = free_port(), free_port()
+        server = start_server(port, http_port, args.render_cache)
+        args.url = f"ws://localhost:{port}"
+        args.metrics_url = args.metrics_url or f"http://localhost:{http_port}/metrics"
+
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            # SIGINT runs main()'s cleanup, which also stops the render workers
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    print(f"Capacity: {report['capacity_clients']} concurrent clients at {args.rate} req/s each "
+          f"(e2e p95 <= {args.slo_p95}s, errors <= {args.max_error_rate:.0%})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
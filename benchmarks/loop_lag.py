@@ -0,0 +1,83 @@
+"""
+Event-loop responsiveness benchmark
+
+Runs concurrent avatar renders with the worker pools enabled and disabled
+and reports how late the event loop wakes up meanwhile.
+
+Usage: python -m benchmarks.loop_lag [--renders 4] [--seconds 8]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from backend.config import Config
+from backend.main import AIAvatarSystem
+from backend.workers.loop_monitor import LoopLagMonitor
+from benchmarks.encoders import synthetic_audio
+
+def offline_timings(text, seconds):
+    """Evenly spaced word timings standing in for TTS output"""
+    words = text.split()
+    step = seconds / len(words)
+    return [{'word': w, 'start': i * step, 'end': (i + 1) * step} for i, w in enumerate(words)]
+
+async def run_case(executor_enabled, renders, seconds):
+    Config.EXECUTOR_ENABLED = executor_enabled
+    system = AIAvatarSystem()
+    audio = synthetic_audio(seconds)
+
+    async def offline_tts(text):
+        return audio, offline_timings(text, seconds)
+
+    system.tts.generate_with_timings = offline_tts
+
+    monitor = LoopLagMonitor(interval=0.01, log_interval=0)
+    monitor.start()
+    # Let the monitor enter its first sleep before any render starts
+    await asyncio.sleep(monitor.interval * 2)
+    text = "namaste main aapka AI avatar hoon aaj main aapki kaise madad kar sakta hoon " * 2
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        system.generate_avatar_response(text, tenant=f"bench-{i}") for i in range(renders)
+    ))
+    elapsed = time.perf_counter() - started
+
+    # Give the monitor a chance to record the last stall
+    await asyncio.sleep(monitor.interval * 2)
+    await monitor.stop()
+    if system.executor is not None:
+        system.executor.shutdown()
+
+    return {
+        'executor': executor_enabled,
+        'pool': Config.RENDER_POOL if executor_enabled else 'event loop',
+        'renders_ok': sum(r is not None for r in results),
+        'wall_seconds': round(elapsed, 2),
+        **{k: round(v, 1) for k, v in monitor.stats().items() if k.endswith('_ms')},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure event-loop lag during renders")
+    parser.add_argument('--renders', type=int, default=4, help="concurrent renders")
+    parser.add_argument('--seconds', type=float, default=8.0, help="utterance length")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(run_case(False, args.renders, args.seconds)),
+        asyncio.run(run_case(True, args.renders, args.seconds)),
+    ]
+
+    for r in results:
+        print(f"{r['pool']:<12} renders {r['renders_ok']}/{args.renders}  wall {r['wall_seconds']:.2f}s  "
+              f"lag p50 {r['p50_ms']:.1f} ms  p99 {r['p99_ms']:.1f} ms  max {r['max_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
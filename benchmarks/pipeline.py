@@ -0,0 +1,214 @@
+"""
+Offline per-stage pipeline benchmark
+
+Runs synthetic utterances of several lengths (romanized and Devanagari
+Hindi) through each stage with deterministic local stand-ins for gTTS and
+Google STT, and reports ms/utterance, frames/sec and peak RSS per stage.
+
+Usage:
+    python -m benchmarks.pipeline [--repeat 3] [--json results.json]
+    python -m benchmarks.pipeline --baseline baseline.json [--threshold 0.2]
+
+With --baseline the run fails (exit code 1) when any stage is slower than
+the baseline by more than the threshold fraction.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from backend.avatar.avatar_renderer import AvatarRenderer
+from backend.config import Config
+from backend.lipsync.lip_sync_engine import LipSyncEngine
+from backend.stt.recognizers import OfflineRecognizer
+from backend.stt.speech_to_text import SpeechToText
+from backend.tts.audio_analysis import analyze_audio
+from backend.tts.synthesizers import OfflineSynthesizer
+from backend.tts.text_to_speech import TextToSpeech
+from backend.tts.tts_cache import TTSCache
+from backend.viseme.viseme_generator import VisemeGenerator
+from backend.workers.frame_ring import FrameRing
+
+TEXTS = {
+    'roman_short': "namaste, kaise ho?",
+    'roman_medium': "namaste main aapka AI avatar hoon. aaj main aapki kaise madad kar sakta hoon?",
+    'roman_long': ("namaste main aapka AI avatar hoon. aaj main aapki kaise madad kar sakta hoon? "
+                   "aap mujhse kuch bhi pooch sakte hain, main hindi aur angrezi dono bolta hoon. ") * 3,
+    'hindi_short': "नमस्ते, आप कैसे हैं?",
+    'hindi_medium': "नमस्ते, मैं आपका AI अवतार हूँ। आज मैं आपकी कैसे मदद कर सकता हूँ?",
+    'hindi_long': ("नमस्ते, मैं आपका AI अवतार हूँ। आज मैं आपकी कैसे मदद कर सकता हूँ? "
+                   "आप मुझसे कुछ भी पूछ सकते हैं, मैं हिंदी और अंग्रेज़ी दोनों बोलता हूँ। ") * 3,
+}
+
+STAGES = ('tts', 'analysis', 'visemes', 'frames', 'encode', 'stt')
+
+def peak_rss_mb():
+    """High-water resident set size of this process in MB"""
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    scale = 1 if sys.platform == 'darwin' else 1024  # bytes on macOS, KB elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
+
+def to_webm(audio_data):
+    """Browser-style webm/opus recording of the TTS audio, for the STT stage"""
+    result = subprocess.run(
+        [Config.FFMPEG_BINARY, '-loglevel', 'error', '-i', 'pipe:0', '-c:a', 'libopus', '-f', 'webm', 'pipe:1'],
+        input=audio_data, stdout=subprocess.PIPE, check=True
+    )
+    return result.stdout
+
+def offline_stt(text):
+    """SpeechToText whose recognizer returns `text` instead of calling Google"""
+    return SpeechToText(recognizer=OfflineRecognizer(text))
+
+def timed(fn, repeat, min_seconds=0.05):
+    """(best seconds per call, last result) over `repeat` samples
+
+    Each sample calls `fn` until at least `min_seconds` have passed, so
+    sub-millisecond stages are not lost in timer noise.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        calls = 0
+        started = time.perf_counter()
+        while True:
+            result = fn()
+            calls += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_seconds:
+                break
+        per_call = elapsed / calls
+        best = per_call if best is None else min(best, per_call)
+    return best, result
+
+def drain(frames):
+    count = 0
+    for _ in frames:
+        count += 1
+    return count
+
+def run(repeat=3, fps=Config.VIDEO_FPS, texts=TEXTS):
+    engine = LipSyncEngine()
+    viseme_gen = VisemeGenerator()
+    results = []
+    stage_rss = {}
+
+    with tempfile.TemporaryDirectory(prefix='pipeline-bench-') as work_dir:
+        tts = TextToSpeech(
+            synthesizer=OfflineSynthesizer(),
+            cache=TTSCache(cache_dir=os.path.join(work_dir, 'tts'), extension='wav')
+        )
+        renderer = AvatarRenderer(output_path=os.path.join(work_dir, 'out'))
+        os.makedirs(renderer.output_path, exist_ok=True)
+
+        for name, text in texts.items():
+            def record(stage, seconds, frames=None, ok=True):
+                row = {'text': name, 'stage': stage, 'ok': ok, 'ms_per_utterance': round(seconds * 1000, 3)}
+                if frames is not None:
+                    row['frames'] = frames
+                    row['fps'] = round(frames / seconds, 1) if seconds else None
+                results.append(row)
+                stage_rss[stage] = round(peak_rss_mb(), 1)
+
+            seconds, audio_data = timed(lambda: tts.synthesize(text), repeat)
+            record('tts', seconds)
+            seconds, _ = timed(lambda: analyze_audio(audio_data), repeat)
+            record('analysis', seconds)
+            _, timings = asyncio.run(tts.generate_with_timings(text))
+
+            seconds, visemes = timed(lambda: viseme_gen.text_to_visemes(text, timings), repeat)
+            record('visemes', seconds)
+
+            buffers = Config.FRAME_QUEUE_SIZE + 2
+            seconds, frames = timed(lambda: drain(engine.stream_frames(visemes, fps, buffers=buffers)), repeat)
+            record('frames', seconds, frames)
+
+            def encode():
+                base_frame = engine.atlas.base_frame
+                with FrameRing(base_frame.shape, Config.FRAME_QUEUE_SIZE, template=base_frame) as ring:
+                    stream = engine.stream_frames(visemes, fps, buffers=ring.slots)
+                    video_path = renderer.render_video_stream(stream, audio_data, fps, ring=ring)
+                if video_path:
+                    os.remove(video_path)
+                return (renderer.last_stats or {}).get('frames', 0)
+
+            seconds, frames = timed(encode, repeat)
+            record('encode', seconds, frames, ok=frames > 0)
+
+            recording = to_webm(audio_data)
+            stt = offline_stt(text)
+            seconds, recognized = timed(lambda: stt.transcribe(recording), repeat)
+            # The stand-in answers once per speech segment; long texts span several
+            record('stt', seconds, ok=bool(recognized) and recognized.startswith(text))
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fps': fps,
+            'encoder': Config.VIDEO_ENCODER,
+            'preset': Config.VIDEO_PRESET,
+            'repeat': repeat,
+        },
+        'results': results,
+        'peak_rss_mb': stage_rss,
+    }
+
+def compare(report, baseline, threshold):
+    """Rows slower than the baseline by more than `threshold` (a fraction)"""
+    base = {(r['text'], r['stage']): r['ms_per_utterance'] for r in baseline['results'] if r.get('ok', True)}
+    regressions = []
+    for row in report['results']:
+        before = base.get((row['text'], row['stage']))
+        if not before or not row['ok']:
+            continue
+        change = row['ms_per_utterance'] / before - 1
+        if change > threshold:
+            regressions.append({**row, 'baseline_ms': before, 'change': round(change, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each avatar pipeline stage offline")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage (best is kept)")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed slowdown vs baseline as a fraction (default 0.2)")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+
+    print(f"{'text':<14}{'stage':<9}{'ms/utt':>10}{'frames':>8}{'fps':>9}")
+    for r in report['results']:
+        fps = f"{r['fps']:>9.1f}" if r.get('fps') else f"{'':>9}"
+        status = '' if r['ok'] else '  FAILED'
+        print(f"{r['text']:<14}{r['stage']:<9}{r['ms_per_utterance']:>10.2f}{r.get('frames', ''):>8}{fps}{status}")
+    print("peak RSS (MB) after each stage: " +
+          ", ".join(f"{stage} {report['peak_rss_mb'][stage]}" for stage in STAGES if stage in report['peak_rss_mb']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['text']}/{r['stage']}: {r['ms_per_utterance']:.2f} ms "
+                  f"vs {r['baseline_ms']:.2f} ms (+{r['change'] * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than baseline by more than {args.threshold * 100:.0f}%")
+
+if __name__ == "__main__":
+    main()
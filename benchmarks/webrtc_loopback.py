@@ -0,0 +1,140 @@
+"""
+WebRTC loopback check for the live avatar tracks
+
+Connects two in-process peers, plays a synthetic utterance on the avatar
+tracks and reports the received frame rate, the sender's drop/duplicate
+counters and the offset between the first voiced audio packet and the
+first moving-mouth frame.
+
+Usage: python -m benchmarks.webrtc_loopback [--seconds 5] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from aiortc import RTCPeerConnection
+from aiortc.mediastreams import MediaStreamError
+
+from backend.config import Config
+from backend.lipsync.lip_sync_engine import LipSyncEngine
+from backend.webrtc.peer_connection import AvatarMedia
+from benchmarks.encoders import synthetic_audio, synthetic_visemes
+
+def delayed(visemes, audio_seconds, lead):
+    """Shift synthetic visemes so speech starts `lead` seconds in"""
+    return [
+        {**v, 'start': v['start'] + lead, 'end': v['end'] + lead}
+        for v in visemes if v['end'] <= audio_seconds
+    ]
+
+def voiced_audio(seconds, lead, sample_rate=24000):
+    """Silence for `lead` seconds, then a tone"""
+    import io
+    import wave
+
+    tone = np.frombuffer(synthetic_audio(seconds, sample_rate)[44:], dtype=np.int16)
+    samples = np.concatenate([np.zeros(int(lead * sample_rate), dtype=np.int16), tone])
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+async def consume(track, on_frame):
+    try:
+        while True:
+            on_frame(await track.recv(), time.perf_counter())
+    except MediaStreamError:
+        pass
+
+async def run(seconds, lead=0.5, fps=Config.VIDEO_FPS):
+    engine = LipSyncEngine()
+    media = AvatarMedia(engine, fps=fps)
+    sender = RTCPeerConnection()
+    receiver = RTCPeerConnection()
+    sender.addTrack(media.audio)
+    sender.addTrack(media.video)
+
+    y1, y2, x1, x2 = engine.atlas.roi
+    idle_mouth = engine.atlas.compose('viseme_silence')[y1:y2, x1:x2].astype(np.int16)
+    received = {'video': [], 'audio': []}
+    first = {}
+    tasks = []
+
+    def on_video(frame, now):
+        received['video'].append(now)
+        if 'speak' in first and 'video' not in first:
+            mouth = frame.to_ndarray(format='rgb24')[y1:y2, x1:x2].astype(np.int16)
+            if np.abs(mouth - idle_mouth).mean() > 8:
+                first['video'] = now
+
+    def on_audio(frame, now):
+        received['audio'].append(now)
+        if 'speak' in first and 'audio' not in first:
+            samples = frame.to_ndarray().astype(np.float32)
+            if np.sqrt(np.mean(samples ** 2)) > 500:
+                first['audio'] = now
+
+    @receiver.on('track')
+    def on_track(track):
+        tasks.append(asyncio.ensure_future(
+            consume(track, on_video if track.kind == 'video' else on_audio)
+        ))
+
+    # Loopback signaling: candidates are gathered before the SDP is returned
+    await sender.setLocalDescription(await sender.createOffer())
+    await receiver.setRemoteDescription(sender.localDescription)
+    await receiver.setLocalDescription(await receiver.createAnswer())
+    await sender.setRemoteDescription(receiver.localDescription)
+
+    # Let the connection settle before speaking
+    await asyncio.sleep(1.0)
+    audio = voiced_audio(seconds, lead)
+    visemes = delayed(synthetic_visemes(engine, seconds), seconds, lead)
+    first['speak'] = time.perf_counter()
+    duration = await media.speak(engine, visemes, audio)
+    window_start = time.perf_counter()
+    await asyncio.sleep(duration + 0.5)
+    window = time.perf_counter() - window_start
+
+    stats = media.get_stats()
+    media.close()
+    await sender.close()
+    await receiver.close()
+    for task in tasks:
+        task.cancel()
+
+    in_window = [t for t in received['video'] if t >= window_start]
+    offset = None
+    if 'audio' in first and 'video' in first:
+        offset = (first['video'] - first['audio']) * 1000
+    return {
+        'utterance_seconds': round(duration, 3),
+        'target_fps': fps,
+        'received_fps': round(len(in_window) / window, 2),
+        'video_frames': len(received['video']),
+        'audio_packets': len(received['audio']),
+        'av_offset_ms': round(offset, 1) if offset is not None else None,
+        'sender': stats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback test of the live WebRTC avatar tracks")
+    parser.add_argument('--seconds', type=float, default=5.0, help="utterance length")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.seconds))
+    print(json.dumps(results, indent=2))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
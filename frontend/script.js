@@ -5,6 +5,34 @@ let peerConnection = null;
 let websocket = null;
 let mediaRecorder = null;
 let recordedChunks = [];
+let useBinaryProtocol = false;
+let nextRequestId = 1;
+const pendingTransfers = new Map();
+const segmentQueue = [];
+let segmentPlaying = false;
+// Mouth delivery: atlases by id (sent once), headers awaiting their bytes
+const mouthAtlases = new Map();
+const mouthHeaders = new Map();
+let mouthPlayback = null;
+// Live recording: chunks are sent in order as the recorder produces them
+let audioSendChain = Promise.resolve();
+const transcriptSegments = [];
+// Composite the mouth client-side on small screens and data-saver connections
+const MOUTH_DELIVERY = /Mobi/i.test(navigator.userAgent) ||
+    Boolean(navigator.connection && navigator.connection.saveData);
+
+// Binary protocol (must match backend/protocol/binary_messages.py)
+const PROTOCOL_VERSION = 1;
+const HEADER_SIZE = 18;
+const MSG_AUDIO = 1;
+const MSG_VIDEO = 2;
+const MSG_SEGMENT = 3;
+const MSG_ATLAS = 4;
+const MSG_SPEECH = 5;
+const MSG_AUDIO_STREAM = 6;
+const FLAG_FINAL = 0x01;
+const CHUNK_SIZE = 256 * 1024;
+const RECORD_TIMESLICE_MS = 250;  // Live recording chunk length
 
 const configuration = {
     iceServers: [
@@ -15,38 +43,121 @@ const configuration = {
 // DOM elements
 const localVideo = document.getElementById('localVideo');
 const remoteVideo = document.getElementById('remoteVideo');
+const avatarCanvas = document.getElementById('avatarCanvas');
 const statusText = document.getElementById('statusText');
 const recognizedText = document.getElementById('recognizedText');
 const llmResponse = document.getElementById('llmResponse');
 const debugInfo = document.getElementById('debugInfo');
+const avatarSelect = document.getElementById('avatarSelect');
 
 // Initialize WebSocket connection
 function initWebSocket() {
     websocket = new WebSocket('ws://localhost:8765');
+    websocket.binaryType = 'arraybuffer';
     
     websocket.onopen = () => {
         updateStatus('Connected to server');
         logDebug('WebSocket connected');
+        // Ask the server to use the binary protocol
+        websocket.send(JSON.stringify({type: 'hello', protocol: PROTOCOL_VERSION}));
     };
     
     websocket.onmessage = async (event) => {
+        if (event.data instanceof ArrayBuffer) {
+            handleBinaryMessage(event.data);
+            return;
+        }
+        
         const data = JSON.parse(event.data);
-        logDebug('Received: ' + JSON.stringify(data));
+        logDebug('Received: ' + data.type);
         
         switch(data.type) {
+            case 'hello':
+                useBinaryProtocol = data.protocol === PROTOCOL_VERSION;
+                logDebug('Binary protocol ' + (useBinaryProtocol ? 'enabled' : 'unavailable'));
+                populateAvatars(data.avatars || []);
+                break;
+                
+            case 'error':
+                logDebug('Server error: ' + data.error);
+                break;
+                
+            case 'busy':
+                // Render queue is full; the request was not accepted
+                updateStatus('Server busy, try again in ' + data.retry_after + ' s');
+                logDebug('Busy: ' + data.error);
+                break;
+                
+            case 'cancelled':
+                // Drop whatever part of the cancelled response already arrived
+                pendingTransfers.delete(MSG_VIDEO + ':' + data.request_id);
+                pendingTransfers.delete(MSG_SEGMENT + ':' + data.request_id);
+                pendingTransfers.delete(MSG_SPEECH + ':' + data.request_id);
+                mouthHeaders.delete(MSG_SPEECH + ':' + data.request_id);
+                logDebug('Request ' + data.request_id + ' cancelled');
+                break;
+                
+            case 'transcript':
+                // Live recording: finished utterances, plus guesses for the current one
+                transcriptSegments[data.segment] = data.text;
+                recognizedText.textContent = transcriptSegments.filter(Boolean).join(' ');
+                break;
+                
             case 'text':
                 recognizedText.textContent = data.text;
                 // Send to LLM (external)
                 await sendToLLM(data.text);
                 break;
                 
+            case 'segment':
+                // One sentence of a streamed response: a link, inlined bytes, or binary chunks to follow
+                if (data.url) {
+                    // Start downloading now; segments still play in order
+                    enqueueSegment(fetch(data.url).then(response => response.blob()));
+                } else if (data.video) {
+                    enqueueSegment(new Blob([new Uint8Array(data.video)], {type: 'video/mp4'}));
+                }
+                logDebug('Segment ' + (data.index + 1) + '/' + data.count);
+                break;
+                
+            case 'speaking':
+                // Playing live on the WebRTC avatar tracks
+                logDebug('Avatar speaking for ' + data.duration.toFixed(1) + ' s');
+                break;
+                
+            case 'segments_done':
+                logDebug('Response streamed: ' + data.sent + '/' + data.segments +
+                         ' segments, first frame after ' + data.ttff_ms + ' ms');
+                break;
+                
+            case 'mouth_atlas':
+                // Avatar base frame and mouth patches; the sheet follows unless inlined
+                if (data.image) {
+                    receiveMouthAtlas(data, new Blob([new Uint8Array(data.image)], {type: 'image/png'}));
+                } else {
+                    mouthHeaders.set(MSG_ATLAS + ':' + data.request_id, data);
+                }
+                break;
+                
+            case 'mouth_track':
+                // Mouth shapes for a response; its audio follows unless inlined
+                if (data.audio) {
+                    playMouthTrack(data, new Blob([new Uint8Array(data.audio)], {type: 'audio/' + data.audio_format}));
+                } else {
+                    mouthHeaders.set(MSG_SPEECH + ':' + data.request_id, data);
+                }
+                break;
+                
             case 'video':
-                // Display received video
-                const videoBlob = new Blob([new Uint8Array(data.video)], {type: 'video/mp4'});
-                const videoUrl = URL.createObjectURL(videoBlob);
-                remoteVideo.src = videoUrl;
-                remoteVideo.play();
-                logDebug('Video received: ' + data.path);
+                if (data.url) {
+                    // Served over HTTP: the browser streams it with range requests
+                    playVideoUrl(data.url);
+                    logDebug('Video ready: ' + data.url);
+                } else {
+                    // Legacy JSON video
+                    playVideoBlob(new Blob([new Uint8Array(data.video)], {type: 'video/mp4'}));
+                    logDebug('Video received: ' + data.path);
+                }
                 break;
                 
             case 'answer':
@@ -69,6 +180,212 @@ function initWebSocket() {
     };
 }
 
+// Build one binary protocol message
+function encodeMessage(type, requestId, payload, chunkIndex, totalSize, flags) {
+    const message = new Uint8Array(HEADER_SIZE + payload.byteLength);
+    const view = new DataView(message.buffer);
+    message[0] = 0x41;  // 'A'
+    message[1] = 0x56;  // 'V'
+    view.setUint8(2, PROTOCOL_VERSION);
+    view.setUint8(3, type);
+    view.setUint8(4, flags);
+    view.setUint8(5, 0);
+    view.setUint32(6, requestId);
+    view.setUint32(10, chunkIndex);
+    view.setUint32(14, totalSize);
+    message.set(payload, HEADER_SIZE);
+    return message;
+}
+
+// Parse a binary protocol message
+function decodeMessage(buffer) {
+    const view = new DataView(buffer);
+    if (buffer.byteLength < HEADER_SIZE || view.getUint8(0) !== 0x41 || view.getUint8(1) !== 0x56) {
+        throw new Error('Bad binary message');
+    }
+    return {
+        type: view.getUint8(3),
+        flags: view.getUint8(4),
+        requestId: view.getUint32(6),
+        chunkIndex: view.getUint32(10),
+        totalSize: view.getUint32(14),
+        payload: new Uint8Array(buffer, HEADER_SIZE)
+    };
+}
+
+// Reassemble chunked videos from the server
+function handleBinaryMessage(buffer) {
+    let message;
+    try {
+        message = decodeMessage(buffer);
+    } catch (error) {
+        logDebug(error.message);
+        return;
+    }
+    
+    if (![MSG_VIDEO, MSG_SEGMENT, MSG_ATLAS, MSG_SPEECH].includes(message.type)) {
+        logDebug('Unknown binary message type ' + message.type);
+        return;
+    }
+    
+    const key = message.type + ':' + message.requestId;
+    if (!pendingTransfers.has(key)) {
+        pendingTransfers.set(key, []);
+    }
+    const chunks = pendingTransfers.get(key);
+    chunks.push(message.payload);
+    
+    if (message.flags & FLAG_FINAL) {
+        pendingTransfers.delete(key);
+        if (message.type === MSG_ATLAS || message.type === MSG_SPEECH) {
+            const header = mouthHeaders.get(key);
+            mouthHeaders.delete(key);
+            if (!header) {
+                return;
+            }
+            if (message.type === MSG_ATLAS) {
+                receiveMouthAtlas(header, new Blob(chunks, {type: 'image/png'}));
+            } else {
+                playMouthTrack(header, new Blob(chunks, {type: 'audio/' + header.audio_format}));
+            }
+            return;
+        }
+        const blob = new Blob(chunks, {type: 'video/mp4'});
+        if (message.type === MSG_SEGMENT) {
+            enqueueSegment(blob);
+        } else {
+            playVideoBlob(blob);
+            logDebug('Video received: request ' + message.requestId + ' (' + message.totalSize + ' bytes)');
+        }
+    }
+}
+
+// Play streamed segments back to back in arrival order (blobs or pending downloads)
+function enqueueSegment(blob) {
+    segmentQueue.push(blob);
+    if (!segmentPlaying) {
+        playNextSegment();
+    }
+}
+
+function playNextSegment() {
+    const next = segmentQueue.shift();
+    if (!next) {
+        segmentPlaying = false;
+        return;
+    }
+    segmentPlaying = true;
+    Promise.resolve(next).then(playVideoBlob, error => {
+        logDebug('Segment download failed: ' + error.message);
+        playNextSegment();
+    });
+}
+
+remoteVideo.addEventListener('ended', () => {
+    if (segmentPlaying) {
+        playNextSegment();
+    }
+});
+
+// Mouth delivery: decode the atlas sheet once and keep it for later responses
+function receiveMouthAtlas(meta, blob) {
+    mouthAtlases.set(meta.atlas_id, createImageBitmap(blob).then(image => ({meta, image})));
+    logDebug('Mouth atlas received: ' + meta.atlas_id + ' (' + meta.bytes + ' bytes)');
+}
+
+// Play a response's audio while drawing its mouth patches onto the canvas
+async function playMouthTrack(track, audioBlob) {
+    const atlas = await mouthAtlases.get(track.atlas_id);
+    if (!atlas) {
+        logDebug('Mouth atlas ' + track.atlas_id + ' missing');
+        return;
+    }
+    stopMouthPlayback();
+    
+    const {meta, image} = atlas;
+    const [roiX, roiY, roiWidth, roiHeight] = meta.roi;
+    const silence = Math.max(meta.visemes.indexOf('viseme_silence'), 0) * meta.levels;
+    const context = avatarCanvas.getContext('2d');
+    
+    function drawPatch(patch) {
+        const column = patch % meta.columns;
+        const row = Math.floor(patch / meta.columns);
+        context.drawImage(image, column * roiWidth, meta.height + row * roiHeight, roiWidth, roiHeight,
+                          roiX, roiY, roiWidth, roiHeight);
+    }
+    
+    // The static avatar is drawn once; frames only repaint the mouth
+    avatarCanvas.width = meta.width;
+    avatarCanvas.height = meta.height;
+    context.drawImage(image, 0, 0, meta.width, meta.height, 0, 0, meta.width, meta.height);
+    drawPatch(silence);
+    remoteVideo.pause();
+    remoteVideo.hidden = true;
+    avatarCanvas.hidden = false;
+    
+    const audio = new Audio(URL.createObjectURL(audioBlob));
+    const playback = {audio, frameRequest: 0};
+    mouthPlayback = playback;
+    let run = 0;
+    let drawn = silence;
+    
+    function draw() {
+        if (mouthPlayback !== playback) {
+            return;
+        }
+        if (audio.ended) {
+            drawPatch(silence);
+            stopMouthPlayback();
+            return;
+        }
+        // Audio is the clock: pick the run covering the current frame
+        const frame = Math.floor(audio.currentTime * track.fps);
+        while (run + 1 < track.runs.length && track.runs[run + 1][0] <= frame) {
+            run++;
+        }
+        const patch = track.runs.length && frame < track.frames ? track.runs[run][1] : silence;
+        if (patch !== drawn) {
+            drawPatch(patch);
+            drawn = patch;
+        }
+        playback.frameRequest = requestAnimationFrame(draw);
+    }
+    
+    try {
+        await audio.play();
+    } catch (error) {
+        logDebug('Mouth track playback failed: ' + error.message);
+    }
+    draw();
+    logDebug('Mouth track: ' + track.frames + ' frames, ' + track.runs.length + ' shape changes');
+}
+
+function stopMouthPlayback() {
+    if (!mouthPlayback) {
+        return;
+    }
+    cancelAnimationFrame(mouthPlayback.frameRequest);
+    mouthPlayback.audio.pause();
+    URL.revokeObjectURL(mouthPlayback.audio.src);
+    mouthPlayback = null;
+}
+
+function playVideoBlob(videoBlob) {
+    playVideoUrl(URL.createObjectURL(videoBlob));
+}
+
+function playVideoUrl(url) {
+    stopMouthPlayback();
+    avatarCanvas.hidden = true;
+    remoteVideo.hidden = false;
+    if (remoteVideo.src && remoteVideo.src.startsWith('blob:')) {
+        URL.revokeObjectURL(remoteVideo.src);
+    }
+    remoteVideo.srcObject = null;
+    remoteVideo.src = url;
+    remoteVideo.play();
+}
+
 // Get user media
 async function startCall() {
     try {
@@ -187,13 +504,43 @@ async function sendAudioToServer(audioBlob) {
     reader.readAsArrayBuffer(audioBlob);
     reader.onloadend = () => {
         const audioData = new Uint8Array(reader.result);
-        websocket.send(JSON.stringify({
-            type: 'audio',
-            audio: Array.from(audioData)
-        }));
+        
+        if (!useBinaryProtocol) {
+            websocket.send(JSON.stringify({
+                type: 'audio',
+                audio: Array.from(audioData)
+            }));
+            return;
+        }
+        
+        // Chunked binary upload
+        const requestId = nextRequestId++;
+        const total = audioData.byteLength;
+        let chunkIndex = 0;
+        for (let offset = 0; offset < total || chunkIndex === 0; offset += CHUNK_SIZE) {
+            const chunk = audioData.subarray(offset, offset + CHUNK_SIZE);
+            const final = offset + CHUNK_SIZE >= total;
+            websocket.send(encodeMessage(MSG_AUDIO, requestId, chunk, chunkIndex, total, final ? FLAG_FINAL : 0));
+            chunkIndex++;
+        }
     };
 }
 
+// Fill the avatar picker with the ids the server offers
+function populateAvatars(avatars) {
+    const selected = avatarSelect.value;
+    avatarSelect.innerHTML = '';
+    avatars.forEach(id => {
+        const option = document.createElement('option');
+        option.value = id;
+        option.textContent = id;
+        avatarSelect.appendChild(option);
+    });
+    if (avatars.includes(selected)) {
+        avatarSelect.value = selected;
+    }
+}
+
 // Send text to external LLM
 async function sendToLLM(text) {
     try {
@@ -208,7 +555,12 @@ async function sendToLLM(text) {
             // Send LLM response back to server for avatar generation
             websocket.send(JSON.stringify({
                 type: 'llm_response',
-                text: mockResponse
+                text: mockResponse,
+                avatar: avatarSelect.value || undefined,
+                // With a live call the avatar speaks on the WebRTC tracks instead
+                peer_id: peerConnection ? 'user1' : undefined,
+                delivery: MOUTH_DELIVERY ? 'mouth' : 'video',
+                stream: true
             }));
             
             updateStatus('Avatar response generated');
@@ -228,23 +580,62 @@ function toggleRecording() {
     }
 }
 
+// Barge-in: stop the avatar when the user starts talking over it
+function interruptAvatar() {
+    if (websocket && websocket.readyState === WebSocket.OPEN) {
+        websocket.send(JSON.stringify({
+            type: 'cancel',
+            peer_id: peerConnection ? 'user1' : undefined
+        }));
+    }
+    segmentQueue.length = 0;
+    segmentPlaying = false;
+    stopMouthPlayback();
+    if (!remoteVideo.srcObject) {
+        remoteVideo.pause();
+    }
+}
+
 function startRecording() {
+    interruptAvatar();
     recordedChunks = [];
     mediaRecorder = new MediaRecorder(localStream);
     
+    // Binary clients stream the recording; the server transcribes while the user speaks
+    const streaming = useBinaryProtocol;
+    const requestId = nextRequestId++;
+    let chunkIndex = 0;
+    transcriptSegments.length = 0;
+    
+    function sendChunk(blob) {
+        audioSendChain = audioSendChain.then(async () => {
+            const payload = blob ? new Uint8Array(await blob.arrayBuffer()) : new Uint8Array(0);
+            websocket.send(encodeMessage(MSG_AUDIO_STREAM, requestId, payload, chunkIndex++, 0,
+                                         blob ? 0 : FLAG_FINAL));
+        });
+    }
+    
     mediaRecorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
-            recordedChunks.push(event.data);
+            if (streaming) {
+                sendChunk(event.data);
+            } else {
+                recordedChunks.push(event.data);
+            }
         }
     };
     
     mediaRecorder.onstop = () => {
-        const blob = new Blob(recordedChunks, {type: 'audio/webm'});
-        sendAudioToServer(blob);
+        if (streaming) {
+            sendChunk(null);  // Empty final chunk ends the stream
+        } else {
+            const blob = new Blob(recordedChunks, {type: 'audio/webm'});
+            sendAudioToServer(blob);
+        }
         document.getElementById('recordBtn').textContent = 'Start Recording';
     };
     
-    mediaRecorder.start();
+    mediaRecorder.start(streaming ? RECORD_TIMESLICE_MS : undefined);
     document.getElementById('recordBtn').textContent = 'Stop Recording';
     logDebug('Recording started');
 }
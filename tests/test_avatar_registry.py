@@ -0,0 +1,10 @@
+import pytest
+
+from backend.avatar.avatar_registry import AvatarRegistry
+
+def test_unknown_ids_do_not_grow_the_lock_table(tmp_path):
+    registry = AvatarRegistry(avatars_dir=str(tmp_path), assets_dir=str(tmp_path / 'assets'))
+    for avatar_id in ('missing', '../etc/passwd', 'x' * 65):
+        with pytest.raises(KeyError):
+            registry.get(avatar_id)
+    assert not registry.load_locks and not registry.keys
@@ -0,0 +1,27 @@
+import json
+
+from backend.batch_render import BatchClip, BatchRun, clip_digest
+
+def make_run(tmp_path, clips, records):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    checkpoint.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    return BatchRun(clips, str(checkpoint), workers=1, output_dir=str(tmp_path))
+
+def test_changed_clips_are_rendered_again(tmp_path):
+    clips = [BatchClip(name, 'namaste', None, str(tmp_path / f'{name}.mp4')) for name in ('same', 'edited', 'new')]
+    for clip in clips[:2]:
+        (tmp_path / f'{clip.clip_id}.mp4').write_bytes(b'mp4')
+    old = clips[1]._replace(text='hello')
+    run = make_run(tmp_path, clips, [
+        {'id': 'same', 'status': 'done', 'digest': clip_digest(clips[0])},
+        {'id': 'edited', 'status': 'done', 'digest': clip_digest(old)},
+    ])
+
+    assert [clip.clip_id for clip in run.pending()] == ['edited', 'new']
+    assert run.stats['skipped'] == 1 and run.stats['resumed'] == 1
+
+def test_outputs_without_a_digest_still_count_as_done(tmp_path):
+    clip = BatchClip('old', 'namaste', 'anchor', str(tmp_path / 'old.mp4'))
+    (tmp_path / 'old.mp4').write_bytes(b'mp4')
+    run = make_run(tmp_path, [clip], [{'id': 'old', 'status': 'done'}])
+    assert run.pending() == [] and run.stats['resumed'] == 1
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from backend.protocol.binary_messages import (
+    FLAG_FINAL, MSG_AUDIO, MSG_VIDEO, BinaryMessage, ChunkAssembler, ProtocolError, decode_message,
+    iter_file_chunks
+)
+
+def chunk(request_id, index, payload, final=False):
+    return BinaryMessage(MSG_AUDIO, request_id, payload, index, flags=FLAG_FINAL if final else 0)
+
+def test_assembler_limits_open_transfers_and_their_bytes():
+    assembler = ChunkAssembler(max_size=100, max_pending=2, max_pending_bytes=150, timeout=60)
+    assembler.add(chunk(1, 0, b'a' * 60))
+    assembler.add(chunk(2, 0, b'b' * 60))
+    with pytest.raises(ProtocolError, match='Too many uploads'):
+        assembler.add(chunk(3, 0, b'c'))
+    with pytest.raises(ProtocolError, match='exceed 150 bytes'):
+        assembler.add(chunk(2, 1, b'b' * 40))
+    assert assembler.buffered == 60
+
+    assert assembler.add(chunk(1, 1, b'a' * 10, final=True)) == b'a' * 70
+    assert assembler.buffered == 0 and not assembler.pending
+
+def test_assembler_drops_stalled_transfers():
+    assembler = ChunkAssembler(max_size=100, max_pending=1, max_pending_bytes=100, timeout=0)
+    assembler.add(chunk(1, 0, b'a'))
+    # The stalled transfer no longer holds the only slot
+    assembler.add(chunk(2, 0, b'b'))
+    with pytest.raises(ProtocolError, match='does not start at chunk 0'):
+        assembler.add(chunk(1, 1, b'a'))
+
+def test_file_chunks_are_read_through_run_io(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'x' * 10)
+    calls = []
+
+    async def run_io(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    async def collect():
+        return [decode_message(message) async for message in iter_file_chunks(MSG_VIDEO, 7, str(path), run_io, 4)]
+
+    messages = asyncio.run(collect())
+    assert b''.join(bytes(message.payload) for message in messages) == b'x' * 10
+    assert [message.final for message in messages] == [False, False, True]
+    assert calls[0] is open and len(calls) == 4
@@ -0,0 +1,25 @@
+import os
+import time
+
+from backend.cache.disk_lru import DiskLRU
+
+def test_only_stale_temp_files_are_cleaned_up(tmp_path):
+    fresh = tmp_path / 'a.mp4.1.tmp'
+    stale = tmp_path / 'b.mp4.2.tmp'
+    fresh.write_bytes(b'being written by another process')
+    stale.write_bytes(b'left by a crash')
+    old = time.time() - DiskLRU.TEMP_GRACE_SECONDS - 60
+    os.utime(stale, (old, old))
+
+    cache = DiskLRU(str(tmp_path), 'mp4', max_bytes=1024)
+    assert cache.lookup('a') is None
+    assert fresh.exists() and not stale.exists()
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = DiskLRU(str(tmp_path), 'bin', max_bytes=10)
+    cache.write('a', b'12345')
+    cache.write('b', b'12345')
+    assert cache.lookup('a')
+    cache.write('c', b'12345')
+    assert cache.lookup('b') is None and cache.read('a') == b'12345'
+    assert sorted(os.listdir(tmp_path)) == ['a.bin', 'c.bin']
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from backend.avatar.avatar_renderer import AvatarRenderer
+from backend.workers.cancellation import RenderCancelled
+from backend.workers.frame_ring import FrameRing, FrameRingClosed
+
+SHAPE = (2, 3)
+
+def produce(ring, count):
+    for value in range(count):
+        slot = ring.acquire()
+        slot[...] = value
+        ring.publish()
+    ring.finish()
+
+def values(ring):
+    return [int(frame[0, 0]) for frame in ring]
+
+def frames(count, fail_after=None):
+    for value in range(count):
+        if value == fail_after:
+            raise RenderCancelled("cancelled mid-render")
+        yield np.full(SHAPE, value, dtype=np.uint8)
+
+def producers_running():
+    return [thread for thread in threading.enumerate() if thread.name == 'frame-producer']
+
+@pytest.mark.parametrize('count', [0, 3, 10])
+def test_frames_arrive_in_order(count):
+    with FrameRing(SHAPE, slots=4) as ring:
+        producer = threading.Thread(target=produce, args=(ring, count))
+        producer.start()
+        assert values(ring) == list(range(count))
+        producer.join()
+
+def test_frames_arrive_in_order_from_another_process():
+    with FrameRing(SHAPE, slots=2) as ring:
+        producer = multiprocessing.get_context('spawn').Process(target=produce_in_child, args=(ring, 7))
+        producer.start()
+        assert values(ring) == list(range(7))
+        producer.join(timeout=30)
+        assert producer.exitcode == 0
+
+def produce_in_child(ring, count):
+    try:
+        produce(ring, count)
+    finally:
+        ring.close()
+
+def test_producer_blocks_while_the_consumer_holds_every_slot():
+    with FrameRing(SHAPE, slots=2) as ring:
+        producer = threading.Thread(target=produce, args=(ring, 5))
+        producer.start()
+        time.sleep(0.3)
+        assert ring.written == 2 and producer.is_alive()
+
+        consumer = iter(ring)
+        next(consumer)
+        next(consumer)  # Recycles the first slot
+        time.sleep(0.3)
+        assert ring.written == 3 and producer.is_alive()
+
+        assert [int(frame[0, 0]) for frame in consumer] == [2, 3, 4]
+        producer.join()
+
+def test_blocked_sides_raise_once_aborted():
+    with FrameRing(SHAPE, slots=2) as ring:
+        threading.Timer(0.2, ring.abort).start()
+        with pytest.raises(FrameRingClosed):
+            values(ring)
+
+def test_producer_error_reaches_the_consumer(tmp_path):
+    renderer = AvatarRenderer(str(tmp_path))
+    received = []
+    with pytest.raises(RenderCancelled):
+        for frame in renderer.ring_frames(frames(10, fail_after=4), queue_size=2):
+            received.append(int(frame[0, 0]))
+    assert received == [0, 1, 2, 3]
+    assert not producers_running()
+
+def test_consumer_stopping_early_releases_the_producer(tmp_path):
+    renderer = AvatarRenderer(str(tmp_path))
+    with FrameRing(SHAPE, slots=2) as ring:
+        slotted = renderer.ring_frames(frames(100), ring)
+        assert int(next(slotted)[0, 0]) == 0
+        slotted.close()
+        # The producer was blocked on a full ring; it is gone before the block can be unmapped
+        assert not producers_running()
+        assert ring.aborted and ring.frames is not None
+    assert ring.frames is None
+
+    # A ring the renderer created itself is removed with the generator
+    blocks = shared_blocks()
+    slotted = renderer.ring_frames(frames(100), queue_size=2)
+    next(slotted)
+    slotted.close()
+    assert not producers_running()
+    assert shared_blocks() == blocks
+
+def shared_blocks():
+    # POSIX shared memory blocks, where the platform lists them
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
@@ -0,0 +1,30 @@
+import asyncio
+
+from backend.webrtc.peer_manager import PeerManager
+
+class StandInConnection:
+    """The parts of RTCPeerConnection PeerManager uses"""
+
+    def __init__(self, state):
+        self.connectionState = state
+
+    def on(self, event):
+        return lambda handler: handler
+
+    async def close(self):
+        self.connectionState = 'closed'
+
+def test_only_unconnected_idle_peers_are_reaped():
+    async def scenario():
+        peers = PeerManager(idle_timeout=0.01)
+        streaming = StandInConnection('connected')
+        stalled = StandInConnection('connecting')
+        await peers.add('session', 'live', streaming)
+        await peers.add('session', 'handshake', stalled)
+        await asyncio.sleep(0.05)
+
+        assert await peers.reap_idle() == 1
+        assert peers.get('session', 'live') is not None and peers.get('session', 'handshake') is None
+        assert stalled.connectionState == 'closed' and streaming.connectionState == 'connected'
+
+    asyncio.run(scenario())
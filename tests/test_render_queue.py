@@ -0,0 +1,199 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from backend.jobs.fair_queue import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, FairQueue
+from backend.jobs.render_queue import LocalRenderQueue, QueueBusyError, RenderJob
+from backend.viseme.viseme_generator import VISEME_DTYPE
+
+def make_job(tenant='a', priority=PRIORITY_NORMAL):
+    return RenderJob(np.zeros(2, dtype=VISEME_DTYPE), b'audio', tenant=tenant, priority=priority)
+
+def test_fair_queue_serves_priorities_first_then_tenants_in_turn():
+    queue = FairQueue()
+    queue.push('batch', 'a', PRIORITY_BACKGROUND)
+    for item in ('a1', 'a2', 'a3'):
+        queue.push(item, 'a')
+    queue.push('b1', 'b')
+    queue.push('live', 'c', PRIORITY_INTERACTIVE)
+
+    order = []
+    while (entry := queue.pop()) is not None:
+        order.append(entry[0])
+    assert order == ['live', 'a1', 'b1', 'a2', 'a3', 'batch']
+    assert len(queue) == 0 and not queue.tenant_depth
+
+def test_fair_queue_remove_frees_the_tenants_slot():
+    queue = FairQueue()
+    queue.push('a1', 'a')
+    queue.push('a2', 'a')
+    assert queue.remove('a1', 'a')
+    assert not queue.remove('a1', 'a')
+    assert len(queue) == 1 and queue.tenant_depth['a'] == 1
+    assert queue.pop() == ('a2', 'a')
+
+def test_local_queue_caps_depth_and_tenants_and_cancel_frees_a_slot():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def render(job):
+            await release.wait()
+            return job.job_id
+
+        queue = LocalRenderQueue(render, concurrency=1, max_depth=2, max_per_tenant=1)
+        running = asyncio.ensure_future(queue.submit(make_job('a')))
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(queue.submit(make_job('a')))
+        await asyncio.sleep(0)
+        assert queue.running == 1 and len(queue.jobs) == 1
+
+        with pytest.raises(QueueBusyError, match='for this client'):
+            await queue.submit(make_job('a'))
+        other = asyncio.ensure_future(queue.submit(make_job('b')))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueBusyError, match='queue full'):
+            await queue.submit(make_job('c'))
+
+        # A cancelled submitter stops counting at once
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert len(queue.jobs) == 1 and queue.jobs.tenant_depth['a'] == 0
+        again = asyncio.ensure_future(queue.submit(make_job('a')))
+        await asyncio.sleep(0)
+
+        release.set()
+        results = await asyncio.gather(running, other, again)
+        assert len(set(results)) == 3
+        assert queue.running == 0 and len(queue.jobs) == 0
+        assert queue.stats['completed'] == 3 and queue.stats['abandoned'] == 1
+
+    asyncio.run(scenario())
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from backend.jobs.render_queue import RedisRenderQueue  # noqa: E402
+from backend.jobs.render_worker import RenderWorker  # noqa: E402
+
+@pytest.fixture
+def redis_pair(tmp_path):
+    """Server queue and worker on one in-memory Redis"""
+    server = fakeredis.FakeServer()
+    queue = RedisRenderQueue(client=fakeredis.FakeAsyncRedis(server=server), namespace='test',
+                             max_depth=3, max_per_tenant=2, job_timeout=5, heartbeat_interval=0.05,
+                             output_path=str(tmp_path))
+    worker = RenderWorker(client=fakeredis.FakeRedis(server=server), namespace='test', worker_id='w1',
+                          output_path=str(tmp_path / 'worker'), shared_path='')
+    worker.heartbeat()
+    return queue, worker
+
+@pytest.fixture
+def fake_render(monkeypatch):
+    """Encodes a stand-in video instead of lip syncing"""
+    def render_with_stats(lipsync, renderer, viseme_sequence, audio_data, fps, fragmented=False):
+        path = renderer.new_video_path()
+        with open(path, 'wb') as f:
+            f.write(b'mp4:' + audio_data)
+        return path, {}
+
+    monkeypatch.setattr('backend.workers.stage_executor.render_with_stats', render_with_stats)
+
+def pop_job(worker):
+    job_id = worker.pop(args=[worker.namespace, PRIORITY_BACKGROUND])
+    return job_id.decode() if job_id else None
+
+def test_redis_queue_admission_and_fair_pop(redis_pair):
+    queue, worker = redis_pair
+
+    async def scenario():
+        jobs = [make_job('a'), make_job('a'), make_job('b', PRIORITY_INTERACTIVE)]
+        tasks = []
+        for job in jobs:
+            tasks.append(asyncio.ensure_future(queue.submit(job)))
+            await asyncio.sleep(0.01)
+            if len(tasks) == 2:
+                with pytest.raises(QueueBusyError, match='for this client'):
+                    await queue.submit(make_job('a'))
+        with pytest.raises(QueueBusyError, match='queue full'):
+            await queue.submit(make_job('c'))
+
+        order = await asyncio.to_thread(lambda: [pop_job(worker) for _ in range(4)])
+        assert order == [jobs[2].job_id, jobs[0].job_id, jobs[1].job_id, None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_redis_cancel_frees_the_slot_and_is_not_rendered(redis_pair, fake_render):
+    queue, worker = redis_pair
+
+    async def scenario():
+        job = make_job('a')
+        task = asyncio.ensure_future(queue.submit(job))
+        await asyncio.sleep(0.01)
+        assert int(await queue.redis.get('test:depth')) == 1
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert int(await queue.redis.get('test:depth')) == 0
+        assert not await queue.redis.hgetall('test:tenant_depth')
+        assert pop_job(worker) is None
+
+        # Popped, then cancelled before the worker claims it: skipped, hash not recreated
+        job = make_job('a')
+        task = asyncio.ensure_future(queue.submit(job))
+        await asyncio.sleep(0.01)
+        job_id = pop_job(worker)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        worker.process(job_id)
+        assert worker.stats['skipped'] == 1
+        assert not await queue.redis.exists(f'test:job:{job_id}')
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_redis_worker_returns_bytes_or_a_shared_path(redis_pair, fake_render, tmp_path):
+    queue, worker = redis_pair
+
+    async def round_trip(job):
+        task = asyncio.ensure_future(queue.submit(job))
+        await asyncio.sleep(0.01)
+        await asyncio.to_thread(worker.process, pop_job(worker))
+        return await task
+
+    async def scenario():
+        video_path = await round_trip(make_job('a'))
+        with open(video_path, 'rb') as f:
+            assert f.read() == b'mp4:audio'
+        assert os.listdir(worker.renderer.output_path) == []
+
+        worker.max_result_bytes = 4
+        with pytest.raises(RuntimeError, match='RENDER_SHARED_PATH'):
+            await round_trip(make_job('a'))
+
+        shared = tmp_path / 'shared'
+        worker.shared_path = str(shared)
+        worker.renderer.output_path = str(shared)
+        shared.mkdir()
+        video_path = await round_trip(make_job('a'))
+        assert os.path.dirname(video_path) == queue.output_path and os.listdir(shared) == []
+        assert worker.stats == {'completed': 2, 'failed': 1, 'skipped': 0}
+        assert not [key async for key in queue.redis.scan_iter(match='test:job:*')]
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_redis_queue_is_busy_without_live_workers(redis_pair):
+    queue, worker = redis_pair
+
+    async def scenario():
+        worker.redis.delete('test:worker:w1')
+        with pytest.raises(QueueBusyError, match='No render workers'):
+            await queue.submit(make_job('a'))
+        await queue.stop()
+
+    asyncio.run(scenario())
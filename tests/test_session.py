@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+from backend.session import SERVER_REQUEST_ID_BASE, ClientSession, connection_tenant
+
+def test_server_ids_stay_out_of_the_client_range():
+    session = ClientSession(websocket=None)
+    assert session.next_request_id() == SERVER_REQUEST_ID_BASE | 1
+    assert session.next_request_id() < 2 ** 32
+
+def test_equal_ids_of_different_kinds_do_not_cancel_each_other():
+    async def scenario():
+        session = ClientSession(websocket=None)
+        render = session.start_request(1, 'response', asyncio.sleep(10))
+        stt = session.start_request(1, 'stt', asyncio.sleep(10))
+        await asyncio.sleep(0)
+        assert not render.cancelled() and not stt.cancelled()
+
+        # Same kind and id: the new request replaces the old one
+        newer = session.start_request(1, 'stt', asyncio.sleep(10))
+        await asyncio.sleep(0)
+        assert stt.cancelled() and not render.cancelled()
+
+        cancelled = session.cancel_requests(kind='response')
+        assert list(cancelled) == [('response', 1)]
+        session.cancel_requests()
+        await asyncio.gather(render, newer, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+def test_tenant_comes_from_the_connection_not_the_client():
+    websocket = SimpleNamespace(remote_address=('203.0.113.7', 50000),
+                                request=SimpleNamespace(headers={'X-Forwarded-For': 'spoofed, 198.51.100.2'}))
+    assert connection_tenant(websocket, header='') == '203.0.113.7'
+    # Only the entry the trusted proxy appended counts
+    assert connection_tenant(websocket, header='X-Forwarded-For') == '198.51.100.2'
+    assert ClientSession(websocket).tenant == '203.0.113.7'
+    session = ClientSession(websocket=None)
+    assert session.tenant == session.session_id
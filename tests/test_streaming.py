@@ -0,0 +1,137 @@
+import asyncio
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from backend.config import Config
+from backend.stt.recognizers import OfflineRecognizer
+from backend.stt.speech_to_text import SpeechToText
+from backend.stt.streaming import PCMRingBuffer, StreamingTranscriber, VoiceActivityDetector
+
+RATE = 16000
+
+def tone(seconds, level=0.3):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (level * 32767 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+def make_vad(**overrides):
+    settings = dict(sample_rate=RATE, frame_ms=20, threshold_db=-40, margin_db=10, min_speech_ms=60,
+                    end_silence_ms=300, pad_ms=0, max_segment_seconds=10)
+    settings.update(overrides)
+    return VoiceActivityDetector(**settings)
+
+def test_ring_wraps_and_read_clips_to_what_is_held():
+    ring = PCMRingBuffer(5)
+    ring.write(np.arange(4, dtype=np.int16))
+    ring.write(np.arange(4, 8, dtype=np.int16))
+    assert ring.total == 8 and ring.oldest == 3
+    assert ring.read(0, 100).tolist() == [3, 4, 5, 6, 7]
+    assert ring.read(4, 6).tolist() == [4, 5]
+    assert ring.read(8, 10).tolist() == []
+
+    # A write longer than the ring keeps its tail
+    ring.write(np.arange(10, 22, dtype=np.int16))
+    assert ring.total == 20 and ring.read(0, 20).tolist() == [17, 18, 19, 20, 21]
+
+def test_vad_cuts_an_utterance_after_the_end_silence():
+    vad = make_vad()
+    assert vad.process(np.concatenate((silence(0.5), tone(0.5), silence(0.2)))) == []
+    assert vad.in_speech
+    # 300 ms of silence ends it, at the last voiced frame
+    assert vad.process(silence(0.2)) == [(8000, 16000)]
+    assert not vad.in_speech and vad.flush() == []
+
+def test_vad_cuts_long_speech_at_max_segment():
+    vad = make_vad(max_segment_seconds=1)
+    segments = vad.process(np.concatenate((silence(0.5), tone(2.5))))
+    assert segments == [(8000, 24000), (24000, 40000)]
+    assert vad.flush() == [(40000, 48000)]
+
+def test_vad_ignores_blips_shorter_than_min_speech():
+    vad = make_vad()
+    blip = np.concatenate((silence(0.5), tone(0.04), silence(1)))
+    assert vad.process(blip) + vad.flush() == []
+
+def test_feed_refuses_input_past_max_buffered():
+    async def recognize(pcm):
+        return None
+
+    transcriber = StreamingTranscriber(recognize, RATE, max_buffered=10)
+    assert transcriber.feed(b'x' * 6)
+    assert not transcriber.feed(b'x' * 6) and transcriber.refused
+    assert transcriber.feed(b'x' * 4)
+    transcriber.close()
+    assert transcriber.feed(b'x' * 100)  # Ignored once closed
+    assert transcriber.buffered == 10
+
+@pytest.fixture
+def webm():
+    """2.5 s webm/Opus recording with one second of tone in the middle"""
+    if shutil.which(Config.FFMPEG_BINARY) is None:
+        pytest.skip("ffmpeg not installed")
+    expression = "if(between(t,0.5,1.5),0.3*sin(2*PI*440*t),0)"
+    result = subprocess.run(
+        [Config.FFMPEG_BINARY, '-loglevel', 'error', '-f', 'lavfi', '-i', f"aevalsrc='{expression}':d=2.5:s=48000",
+         '-c:a', 'libopus', '-f', 'webm', 'pipe:1'],
+        stdout=subprocess.PIPE, check=True
+    )
+    return result.stdout
+
+def chunks(data, size=500):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+def test_webm_in_small_chunks_gives_one_final_result(webm):
+    recognizer = OfflineRecognizer(transcript='')
+
+    async def recognize(pcm):
+        return recognizer.recognize(pcm, RATE, 'hi-IN')
+
+    async def scenario():
+        transcriber = StreamingTranscriber(recognize, RATE, partial_interval=0, vad=make_vad())
+        results = []
+
+        async def on_result(result):
+            results.append(result)
+
+        run = asyncio.ensure_future(transcriber.run(on_result))
+        for chunk in chunks(webm):
+            assert transcriber.feed(chunk)
+            await asyncio.sleep(0)
+        transcriber.close()
+        return await run, results
+
+    text, results = asyncio.run(scenario())
+    assert [result.final for result in results] == [True]
+    assert text == results[0].text == '[speech 1.0s]'
+
+def test_process_audio_stream_yields_the_utterance(webm):
+    async def source():
+        for chunk in chunks(webm):
+            yield chunk
+
+    async def scenario():
+        stt = SpeechToText(recognizer=OfflineRecognizer(transcript='namaste'), sample_rate=RATE)
+        return [text async for text in stt.process_audio_stream(source())]
+
+    assert asyncio.run(scenario()) == ['namaste']
+
+def test_process_audio_stream_raises_the_transcribers_error():
+    class BrokenTranscriber(StreamingTranscriber):
+        async def run(self, on_result=None):
+            raise RuntimeError("decoder crashed")
+
+    async def source():
+        yield b'webm'
+
+    async def scenario():
+        stt = SpeechToText(recognizer=OfflineRecognizer(), sample_rate=RATE)
+        stt.open_stream = lambda partial_interval: BrokenTranscriber(stt.recognize_pcm, RATE)
+        return [text async for text in stt.process_audio_stream(source())]
+
+    with pytest.raises(RuntimeError, match='decoder crashed'):
+        asyncio.run(scenario())
@@ -0,0 +1,16 @@
+from backend.viseme.viseme_generator import VISEME_NAMES, VisemeGenerator
+
+def visemes(word):
+    return [VISEME_NAMES[i] for i in VisemeGenerator().tokenize_word(word)]
+
+def test_inherent_vowel_after_consonant():
+    assert visemes('कमल') == ['viseme_k', 'viseme_aa', 'viseme_m', 'viseme_aa', 'viseme_l']
+
+def test_vowel_sign_replaces_inherent_vowel():
+    assert visemes('जरा') == ['viseme_j', 'viseme_aa', 'viseme_r', 'viseme_aa']
+
+def test_nukta_consonant_keeps_inherent_vowel():
+    # ज + nukta, and the precomposed ज़ (U+095B)
+    for word in ('ज़रा', 'ज़रा'):
+        assert visemes(word) == ['viseme_s', 'viseme_aa', 'viseme_r', 'viseme_aa']
+    assert visemes('ग़ज़ल') == ['viseme_g', 'viseme_aa', 'viseme_s', 'viseme_aa', 'viseme_l']